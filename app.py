@@ -1,15 +1,62 @@
 from flask import Flask, redirect, url_for
 from flask_login import LoginManager, current_user
+from catalog_cache import CatalogCache
+from identity_cache import IdentityCache
+from instrumentation import SQLInstrumentation
+from job_queue import JobQueue
+from migrations import migrate
+from notifications import NotificationOutbox
+from password_verifier import PasswordVerifier
+from sqlite_profile import apply_sqlite_profile
+from user_import import UserImporter
 from models.db import db
 from models import User, LoginUser
+from routes.admin import admin_bp
+from routes.api import api_bp, api_token_user_id
 from routes.auth import auth_bp
+from routes.calendar import calendar_bp
 from routes.user import user_bp
 from routes.proposal import proposal_bp
 from routes.project import project_bp
 
 CONFIG = {
     'SQLALCHEMY_DATABASE_URI': 'sqlite:///dissertations.db',
-    'SECRET_KEY': 'dev'
+    'SQLITE_PROFILE': 'production',
+    'SQLITE_PRAGMAS': {},
+    'SECRET_KEY': 'dev',
+    'SQL_INSTRUMENTATION': False,
+    'SQL_INSTRUMENTATION_TOP_N': 5,
+    'USER_IMPORT_BATCH_SIZE': 500,
+    'USER_IMPORT_WORKERS': None,
+    'USER_IMPORT_FOLDER': None,
+    'PASSWORD_HASH_METHOD': 'scrypt',
+    'PASSWORD_VERIFY_WORKERS': 4,
+    'PASSWORD_VERIFY_QUEUE_DEPTH': 16,
+    'PASSWORD_VERIFY_RETRY_AFTER': 5,
+    'IDENTITY_CACHE_TTL': 60,
+    'IDENTITY_CACHE_SIZE': 1024,
+    'ADMIN_LIST_PAGE_SIZE': 50,
+    'CATALOG_PAGE_SIZE': 24,
+    'CATALOG_CACHE_TTL': 300,
+    'CATALOG_CACHE_SIZE': 256,
+    'API_PAGE_SIZE': 100,
+    'API_MAX_PAGE_SIZE': 1000,
+    'API_TOKEN_MAX_AGE': 30 * 24 * 3600,
+    'JOB_RUN_IN_PROCESS': False,
+    'JOB_WORKERS': 2,
+    'JOB_POLL_INTERVAL': 30,
+    'JOB_STALE_AFTER': 300,
+    'MAIL_SERVER': 'localhost',
+    'MAIL_PORT': 25,
+    'MAIL_USE_TLS': False,
+    'MAIL_USERNAME': None,
+    'MAIL_PASSWORD': None,
+    'MAIL_SENDER': 'dms@localhost',
+    'MAIL_TIMEOUT': 10,
+    'NOTIFICATION_INTERVAL': 300,
+    'NOTIFICATION_BATCH_SIZE': 500,
+    'NOTIFICATION_CLAIM_TIMEOUT': 300,
+    'NOTIFICATION_MAX_ATTEMPTS': 5
 }
 
 
@@ -20,15 +67,27 @@ def create_app(config=None):
         app.config.from_mapping(config)
 
     db.init_app(app)
+    apply_sqlite_profile(app)
+    SQLInstrumentation(app)
+    PasswordVerifier(app)
+    UserImporter(app)
+    identities = IdentityCache(app)
+    CatalogCache(app)
 
     login_manager = LoginManager()
     login_manager.login_view = 'auth.login'
+    login_manager.blueprint_login_views = {api_bp.name: None}  # API requests get a 401 instead of the login page
     login_manager.init_app(app)
 
     @login_manager.user_loader
     def load_user(user_id):
-        user = db.session.get(User, int(user_id))
-        return LoginUser(user) if user and user.active else None
+        identity = identities.get(int(user_id), User.load_identity)
+        return LoginUser(identity=identity) if identity and identity['active'] else None
+
+    @login_manager.request_loader
+    def load_user_from_token(request):
+        user_id = api_token_user_id(request)
+        return load_user(user_id) if user_id is not None else None
 
     @app.route('/')
     def index():
@@ -41,13 +100,19 @@ def create_app(config=None):
     app.register_blueprint(user_bp, url_prefix='/user')
     app.register_blueprint(proposal_bp, url_prefix='/proposal')
     app.register_blueprint(project_bp, url_prefix='/project')
+    app.register_blueprint(admin_bp, url_prefix='/admin')
+    app.register_blueprint(api_bp, url_prefix='/api/v1')
+    app.register_blueprint(calendar_bp, url_prefix='/calendar')
 
     with app.app_context():
         db.create_all()
+    migrate(app)
+    JobQueue(app)  # after the migrations, as a queue that runs jobs resumes those left queued by the last run
+    NotificationOutbox(app)
 
     return app
 
 
 if __name__ == "__main__":
-    this_app = create_app()
+    this_app = create_app({'JOB_RUN_IN_PROCESS': True})  # the server runs background jobs itself
     this_app.run(debug=False)
@@ -0,0 +1,213 @@
+"""Synthetic cohort for benchmarks, bulk-loaded through SQLAlchemy Core.
+
+Run from the repository root with ``python -m benchmarks.cohort DATABASE --scale 1``. At scale 1 the cohort has 10,000
+students, 400 supervisors, 8,000 projects and 60,000 meetings. Projects are spread over every status, and their marks
+over every state, including reconciliation across several marking rounds. Every generated user's password is
+``password``.
+"""
+import argparse
+import random
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy import insert, select
+
+from app import create_app
+from models import CatalogProposal, MarkingRound, Meeting, Project, ProjectMark, Proposal, User
+from models.MarkingRound import MarkingRoundState
+from models.db import db
+from password_verifier import hash_password
+
+# Cohort sizes at scale 1
+COHORT_SIZES = {
+    'students': 10000,
+    'supervisors': 400,
+    'admins': 5,
+    'projects': 8000,
+    'meetings': 60000,
+    'catalog': 800,
+}
+
+# Share of projects at each stage of their lifecycle. Reconciling projects have a non-concordant first round and an
+# open second round. Reconciled projects were agreed in their second round.
+PROJECT_STAGES = (
+    ('active', 0.40),
+    ('submitted', 0.15),
+    ('marking', 0.10),
+    ('confirmed', 0.20),
+    ('reconciling', 0.05),
+    ('reconciled', 0.05),
+    ('archived', 0.05),
+)
+
+TOPICS = ('machine learning', 'blockchain', 'computer vision', 'compilers', 'databases', 'networks', 'robotics',
+          'security', 'healthcare', 'education', 'energy', 'graphics', 'language models', 'distributed systems')
+ROOMS = ('Harrison 101', 'Harrison 170', 'Innovation 2', 'Library 3', 'Online')
+
+
+def cohort_sizes(scale: float) -> dict:
+    sizes = {name: max(1, round(size * scale)) for name, size in COHORT_SIZES.items()}
+    sizes['supervisors'] = max(3, sizes['supervisors'])  # a second marker must differ from the supervisor
+    sizes['students'] = max(sizes['students'], sizes['projects'])
+    sizes['meetings'] = round(COHORT_SIZES['meetings'] * scale)
+    return sizes
+
+
+def project_stages(count: int, rng: random.Random) -> [str]:
+    stages = [stage for stage, share in PROJECT_STAGES for _ in range(max(1, round(share * count)))]
+    stages = (stages + ['active'] * count)[:count]
+    rng.shuffle(stages)
+    return stages
+
+
+def mark_pair(rng: random.Random, concordant: bool) -> (float, float):
+    first = rng.randint(40, 85)
+    gap = rng.randint(-5, 5) if concordant else rng.choice((-1, 1)) * rng.randint(6, 15)
+    return float(first), float(first + gap)
+
+
+def generate_cohort(scale: float = 1.0, seed: int = 0, batch_size: int = 5000) -> dict:
+    # Fills an empty database in the current app context and returns the number of rows added to each table
+    if db.session.scalar(select(User.id).limit(1)) is not None:
+        raise ValueError('The synthetic cohort must be generated into an empty database.')
+    rng = random.Random(seed)
+    sizes = cohort_sizes(scale)
+    now = datetime.now().replace(microsecond=0)
+    password_hash = hash_password('password')
+    rows = {table: [] for table in ('user', 'catalog_proposal', 'proposal', 'project', 'marking_round',
+                                    'project_mark', 'meeting')}
+
+    def add(table: str, **values) -> int:
+        values['id'] = len(rows[table]) + 1
+        rows[table].append(values)
+        return values['id']
+
+    students = [add('user', name=f'Student {i}', email=f'student{i}@example.com', password_hash=password_hash,
+                    is_supervisor=False, is_admin=False, active=True) for i in range(sizes['students'])]
+    # A few supervisors have left; they keep their name on old records but take no new work
+    leavers = max(0, min(sizes['supervisors'] - 3, sizes['supervisors'] // 50))
+    supervisors = [add('user', name=f'Supervisor {i}', email=f'supervisor{i}@example.com',
+                       password_hash=password_hash, is_supervisor=True, is_admin=False,
+                       active=i < sizes['supervisors'] - leavers) for i in range(sizes['supervisors'])]
+    active_supervisors = supervisors[:len(supervisors) - leavers]
+    for i in range(sizes['admins']):
+        add('user', name=f'Admin {i}', email=f'admin{i}@example.com', password_hash=password_hash,
+            is_supervisor=False, is_admin=True, active=True)
+
+    catalog = []
+    for i in range(sizes['catalog']):
+        topic = rng.choice(TOPICS)
+        supervisor_id = active_supervisors[i % len(active_supervisors)]
+        active = rng.random() > 0.1
+        entry_id = add('catalog_proposal', title=f'{topic.title()} Project {i}',
+                       description=f'An investigation of {topic} and {rng.choice(TOPICS)}.', active=active,
+                       supervisor_id=supervisor_id)
+        if active:
+            catalog.append((entry_id, supervisor_id, topic))
+
+    for index, stage in enumerate(project_stages(sizes['projects'], rng)):
+        student_id = students[index]
+        created = now - timedelta(days=rng.randint(200, 300))
+        if catalog and rng.random() < 0.3:
+            catalog_id, supervisor_id, topic = rng.choice(catalog)
+        else:
+            catalog_id, supervisor_id, topic = None, rng.choice(active_supervisors), rng.choice(TOPICS)
+        proposal_id = add('proposal', title=f'{topic.title()} for Student {index}',
+                          description=f'Applying {topic} to a new problem.', catalog_proposal_id=catalog_id,
+                          student_id=student_id, supervisor_id=supervisor_id, created_date=created,
+                          accepted_date=created + timedelta(days=rng.randint(1, 14)), rejected_date=None)
+        second_marker_id = None
+        if stage != 'active':
+            second_marker_id = rng.choice([s for s in active_supervisors if s != supervisor_id])
+        submitted = now - timedelta(days=rng.randint(10, 60)) if stage != 'active' else None
+        project_id = add('project', proposal_id=proposal_id, student_id=student_id, supervisor_id=supervisor_id,
+                         second_marker_id=second_marker_id, submitted_datetime=submitted,
+                         archived_datetime=now - timedelta(days=rng.randint(1, 9)) if stage == 'archived' else None)
+
+        def mark(marker_id: int, value: float = None, round_id: int = None):
+            add('project_mark', project_id=project_id, marker_id=marker_id, round_id=round_id, mark=value,
+                feedback=f'Feedback from {marker_id}.' if value is not None else None,
+                submitted_at=submitted + timedelta(days=rng.randint(1, 9)) if value is not None else None,
+                finalised=value is not None)
+
+        def closed_round(number: int, concordant: bool) -> int:
+            first, second = mark_pair(rng, concordant)
+            round_id = add('marking_round', project_id=project_id, round_number=number,
+                           state=MarkingRoundState.CLOSED, concordant=concordant,
+                           resolved_mark=(first + second) / 2 if concordant else None)
+            mark(supervisor_id, first, round_id)
+            mark(second_marker_id, second, round_id)
+            return round_id
+
+        if stage == 'active':
+            mark(supervisor_id)
+        elif stage == 'submitted':
+            mark(supervisor_id)
+            mark(second_marker_id)
+        elif stage == 'marking':
+            round_id = add('marking_round', project_id=project_id, round_number=1, state=MarkingRoundState.OPEN,
+                           concordant=None, resolved_mark=None)
+            mark(supervisor_id, float(rng.randint(40, 85)), round_id)
+            mark(second_marker_id)
+        elif stage in ('confirmed', 'archived'):
+            closed_round(1, concordant=True)
+        elif stage == 'reconciling':
+            closed_round(1, concordant=False)
+            round_id = add('marking_round', project_id=project_id, round_number=2, state=MarkingRoundState.OPEN,
+                           concordant=None, resolved_mark=None)
+            mark(supervisor_id, round_id=round_id)
+            mark(second_marker_id, round_id=round_id)
+        elif stage == 'reconciled':
+            closed_round(1, concordant=False)
+            closed_round(2, concordant=True)
+
+    # Students without a project are waiting on a proposal, were turned down, or have not applied yet
+    for student_id in students[sizes['projects']:]:
+        outcome = rng.random()
+        if outcome < 0.75:
+            created = now - timedelta(days=rng.randint(1, 30))
+            add('proposal', title=f'{rng.choice(TOPICS).title()} Idea', description='A self-proposed project.',
+                catalog_proposal_id=None, student_id=student_id, supervisor_id=rng.choice(active_supervisors),
+                created_date=created, accepted_date=None,
+                rejected_date=created + timedelta(days=2) if outcome >= 0.5 else None)
+
+    projects = rows['project']
+    for _ in range(sizes['meetings']):
+        project = rng.choice(projects)
+        start = (now + timedelta(days=rng.randint(-200, 30))).replace(hour=rng.randint(9, 16), minute=0, second=0)
+        past = start < now
+        attended = past and rng.random() < 0.85
+        add('meeting', project_id=project['id'], created_at=start - timedelta(days=7), meeting_start=start,
+            meeting_end=start + timedelta(hours=1), location=rng.choice(ROOMS), attendance=attended,
+            outcome_notes='Discussed progress and next steps.' if attended else None)
+
+    tables = {'user': User, 'catalog_proposal': CatalogProposal, 'proposal': Proposal, 'project': Project,
+              'marking_round': MarkingRound, 'project_mark': ProjectMark, 'meeting': Meeting}
+    for name, model in tables.items():
+        for start in range(0, len(rows[name]), batch_size):
+            db.session.execute(insert(model.__table__), rows[name][start:start + batch_size])
+    db.session.commit()
+    return {name: len(table_rows) for name, table_rows in rows.items()}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('database', help='SQLite file to create; it must not hold any users yet.')
+    parser.add_argument('--scale', type=float, default=1.0)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    app = create_app({'SQLALCHEMY_DATABASE_URI': f'sqlite:///{args.database}'})
+    with app.app_context():
+        started = time.perf_counter()
+        counts = generate_cohort(args.scale, args.seed)
+        elapsed = time.perf_counter() - started
+        db.engine.dispose()
+    for name, count in counts.items():
+        print(f'{name:<18}{count:>10,}')
+    total = sum(counts.values())
+    print(f'Generated {total:,} rows in {elapsed:.1f}s ({total / elapsed:,.0f} rows/s)')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,184 @@
+"""Response times of the main routes against a synthetic cohort.
+
+Run from the repository root with ``python -m benchmarks.routes``. A cohort is generated first (see benchmarks.cohort),
+unless ``--database`` names one generated earlier. Each route is then requested through the Flask test client, timing
+every request and counting its SQL statements. ``--output`` saves the results as JSON. ``--baseline`` compares them
+with a saved run: a route counts as a regression if its median time grew by more than ``--tolerance`` (and by at least
+``--min-delta`` milliseconds, so jitter on sub-millisecond routes does not count) or it issues more statements. The
+command exits with status 1 if any route regressed.
+"""
+import argparse
+import json
+import os
+import platform
+import sqlite3
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+from flask import url_for
+from sqlalchemy import event, select
+
+from app import create_app
+from benchmarks.cohort import generate_cohort
+from models import Project, ProjectMark, User
+from models.Project import ProjectStatus
+from models.db import db
+
+
+def percentile(values: [float], share: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(share * len(ordered)))]
+
+
+def benchmark_cases(app) -> [(str, list)]:
+    # (name, requests), each request being (user id, method, url, form data). A case with one request repeats it. Users
+    # and records are picked from the cohort in id order, so runs against the same cohort request the same pages.
+    with app.app_context(), app.test_request_context():
+        student = db.session.scalar(select(Project.student_id).where(Project.status == ProjectStatus.ACTIVE)
+                                    .order_by(Project.id).limit(1))
+        supervisor, project = db.session.execute(
+            select(Project.supervisor_id, Project.id).where(Project.status == ProjectStatus.MARKING)
+            .order_by(Project.id).limit(1)).one()
+        admin = db.session.scalar(select(User.id).where(User.is_admin == True).order_by(User.id).limit(1))
+        # A mark can only be submitted once, so each request submits the next outstanding supervisor mark
+        marks = db.session.execute(
+            select(ProjectMark.id, ProjectMark.marker_id).join(Project, Project.id == ProjectMark.project_id)
+            .where(Project.status == ProjectStatus.SUBMITTED, ProjectMark.finalised == False,
+                   ProjectMark.marker_id == Project.supervisor_id).order_by(ProjectMark.id)).all()
+        home = url_for('user.home')
+        return [
+            ('user.home (student)', [(student, 'GET', home, None)]),
+            ('user.home (supervisor)', [(supervisor, 'GET', home, None)]),
+            ('user.home (admin)', [(admin, 'GET', home, None)]),
+            ('project.view_project', [(supervisor, 'GET', url_for('project.view_project', project_id=project), None)]),
+            ('proposal.view_catalog', [(student, 'GET', url_for('proposal.view_catalog'), None)]),
+            ('proposal.view_catalog (search)', [(student, 'GET', url_for('proposal.view_catalog', q='learning'),
+                                                 None)]),
+            ('admin.export_marks', [(admin, 'GET', url_for('admin.export_marks'), None)]),
+            ('project.submit_mark', [(marker_id, 'POST', url_for('project.submit_mark', mark_id=mark_id),
+                                      {'grade': '65', 'feedback': 'Benchmark mark.'}) for mark_id, marker_id in marks]),
+        ]
+
+
+def run_case(app, requests: list, repeat: int, warmup: int, statements: list) -> dict:
+    if len(requests) == 1:
+        requests = requests * (warmup + repeat)
+    timings, counts = [], []
+    for index, (user_id, method, url, data) in enumerate(requests[:warmup + repeat]):
+        client = app.test_client()
+        with client.session_transaction() as session:
+            session['_user_id'] = str(user_id)
+            session['_fresh'] = True
+        statements.clear()
+        started = time.perf_counter()
+        response = client.open(url, method=method, data=data)
+        elapsed = time.perf_counter() - started
+        if response.status_code >= 400:
+            raise RuntimeError(f'{method} {url} returned {response.status_code}')
+        if index >= warmup:
+            timings.append(elapsed * 1000)
+            counts.append(len(statements))
+    if not timings:
+        return None
+    return {
+        'requests': len(timings),
+        'mean_ms': round(statistics.fmean(timings), 3),
+        'median_ms': round(statistics.median(timings), 3),
+        'p95_ms': round(percentile(timings, 0.95), 3),
+        'min_ms': round(min(timings), 3),
+        'queries': statistics.median_low(counts),
+    }
+
+
+def run_benchmarks(database: str, scale: float, repeat: int, warmup: int, seed: int = 0) -> dict:
+    app = create_app({'SQLALCHEMY_DATABASE_URI': f'sqlite:///{database}', 'SERVER_NAME': 'localhost'})
+    statements = []
+    with app.app_context():
+        if db.session.scalar(select(User.id).limit(1)) is None:
+            generate_cohort(scale, seed)
+        counts = {'users': db.session.query(User).count(), 'projects': db.session.query(Project).count()}
+        event.listen(db.engine, 'before_cursor_execute', lambda *args: statements.append(args[2]))
+        db.session.remove()
+    routes = {}
+    for name, requests in benchmark_cases(app):
+        result = run_case(app, requests, repeat, warmup, statements)
+        if result is not None:
+            routes[name] = result
+    with app.app_context():
+        db.engine.dispose()
+    return {
+        'created': datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'sqlite': sqlite3.sqlite_version,
+        'cohort': counts,
+        'repeat': repeat,
+        'routes': routes,
+    }
+
+
+def compare(results: dict, baseline: dict, tolerance: float, min_delta: float = 1.0) -> [(str, dict, dict, bool)]:
+    # (route, baseline, current, regressed) for every route in both runs
+    rows = []
+    for name, current in results['routes'].items():
+        before = baseline.get('routes', {}).get(name)
+        if before is None:
+            continue
+        slowdown = current['median_ms'] - before['median_ms']
+        regressed = (slowdown > before['median_ms'] * tolerance and slowdown >= min_delta
+                     or current['queries'] > before['queries'])
+        rows.append((name, before, current, regressed))
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--database', help='Cohort database to reuse, generated there if it has no users yet.')
+    parser.add_argument('--scale', type=float, default=0.1, help='Cohort scale when generating (1 = 10k students).')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--repeat', type=int, default=20)
+    parser.add_argument('--warmup', type=int, default=3)
+    parser.add_argument('--output', help='Write the results to this JSON file.')
+    parser.add_argument('--baseline', help='Compare against the results in this JSON file.')
+    parser.add_argument('--tolerance', type=float, default=0.2, help='Allowed median slowdown, e.g. 0.2 for 20%%.')
+    parser.add_argument('--min-delta', type=float, default=1.0, help='Slowdowns under this many ms are ignored.')
+    args = parser.parse_args()
+
+    temporary = args.database is None
+    if temporary:
+        db_fd, database = tempfile.mkstemp(suffix='.db')
+        os.close(db_fd)
+    else:
+        database = args.database
+    try:
+        results = run_benchmarks(database, args.scale, args.repeat, args.warmup, args.seed)
+    finally:
+        if temporary:
+            for suffix in ('', '-wal', '-shm'):
+                if os.path.exists(database + suffix):
+                    os.unlink(database + suffix)
+    if args.output:
+        with open(args.output, 'w') as output:
+            json.dump(results, output, indent=2)
+
+    print(f'{results["cohort"]["users"]:,} users, {results["cohort"]["projects"]:,} projects, '
+          f'{args.repeat} requests per route')
+    print(f'{"route":<34}{"median ms":>10}{"p95 ms":>10}{"queries":>9}')
+    for name, result in results['routes'].items():
+        print(f'{name:<34}{result["median_ms"]:>10.2f}{result["p95_ms"]:>10.2f}{result["queries"]:>9}')
+    if args.baseline:
+        with open(args.baseline) as baseline_file:
+            rows = compare(results, json.load(baseline_file), args.tolerance, args.min_delta)
+        print(f'\nAgainst {args.baseline}:')
+        print(f'{"route":<34}{"median ms":>18}{"queries":>12}')
+        for name, before, current, regressed in rows:
+            print(f'{name:<34}{before["median_ms"]:>8.2f} -> {current["median_ms"]:<8.2f}'
+                  f'{before["queries"]:>5} -> {current["queries"]:<4}{"  REGRESSED" if regressed else ""}')
+        if any(regressed for *_, regressed in rows):
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
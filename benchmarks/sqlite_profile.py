@@ -0,0 +1,114 @@
+"""Mixed read/write throughput under each SQLite profile.
+
+Run from the repository root with ``python -m benchmarks.sqlite_profile``. Each profile gets a fresh database seeded
+with a cohort of projects, then worker threads run a mix of dashboard-style reads and meeting inserts for a fixed time.
+"""
+import argparse
+import os
+import random
+import tempfile
+import threading
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy.exc import OperationalError
+
+from app import create_app
+from models import Meeting, Project, Proposal, User
+from models.Project import ProjectStatus
+from models.db import db
+from sqlite_profile import SQLITE_PROFILES
+
+
+def seed(cohort: int):
+    supervisors = [User(email=f'supervisor{i}@example.com', name=f'Supervisor {i}', password_hash='x',
+                        is_supervisor=True) for i in range(max(1, cohort // 10))]
+    db.session.add_all(supervisors)
+    db.session.flush()
+    for i in range(cohort):
+        student = User(email=f'student{i}@example.com', name=f'Student {i}', password_hash='x')
+        db.session.add(student)
+        db.session.flush()
+        supervisor = supervisors[i % len(supervisors)]
+        proposal = Proposal(title=f'Project {i}', description='Description', student_id=student.id,
+                            supervisor_id=supervisor.id, accepted_date=datetime.now())
+        db.session.add(proposal)
+        db.session.flush()
+        db.session.add(Project(proposal_id=proposal.id, student_id=student.id, supervisor_id=supervisor.id))
+    db.session.commit()
+
+
+def worker(app, project_ids: [int], write_ratio: float, deadline: float, results: dict, lock: threading.Lock):
+    reads = writes = errors = 0
+    rng = random.Random()
+    with app.app_context():
+        while time.perf_counter() < deadline:
+            project_id = rng.choice(project_ids)
+            try:
+                if rng.random() < write_ratio:
+                    start = datetime.now() + timedelta(days=rng.randint(1, 60))
+                    db.session.add(Meeting(project_id=project_id, meeting_start=start,
+                                           meeting_end=start + timedelta(hours=1)))
+                    db.session.commit()
+                    writes += 1
+                else:
+                    Project.query.filter(Project.status == ProjectStatus.ACTIVE).limit(50).all()
+                    Meeting.query.filter_by(project_id=project_id).order_by(Meeting.meeting_start).all()
+                    reads += 1
+            except OperationalError:
+                db.session.rollback()
+                errors += 1
+        db.session.remove()
+    with lock:
+        results['reads'] += reads
+        results['writes'] += writes
+        results['errors'] += errors
+
+
+def run_profile(profile: str, threads: int, seconds: float, write_ratio: float, cohort: int) -> dict:
+    db_fd, db_path = tempfile.mkstemp(suffix='.db')
+    try:
+        app = create_app({'SQLALCHEMY_DATABASE_URI': f'sqlite:///{db_path}', 'SQLITE_PROFILE': profile})
+        with app.app_context():
+            seed(cohort)
+            project_ids = [project_id for project_id, in db.session.query(Project.id)]
+            db.session.remove()
+        results = {'reads': 0, 'writes': 0, 'errors': 0}
+        lock = threading.Lock()
+        deadline = time.perf_counter() + seconds
+        pool = [threading.Thread(target=worker, args=(app, project_ids, write_ratio, deadline, results, lock))
+                for _ in range(threads)]
+        for thread in pool:
+            thread.start()
+        for thread in pool:
+            thread.join()
+        with app.app_context():
+            db.engine.dispose()
+        return results
+    finally:
+        os.close(db_fd)
+        for suffix in ('', '-wal', '-shm'):
+            if os.path.exists(db_path + suffix):
+                os.unlink(db_path + suffix)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--profiles', nargs='+', default=list(SQLITE_PROFILES), choices=list(SQLITE_PROFILES))
+    parser.add_argument('--threads', type=int, default=8)
+    parser.add_argument('--seconds', type=float, default=5.0)
+    parser.add_argument('--write-ratio', type=float, default=0.2)
+    parser.add_argument('--cohort', type=int, default=500)
+    args = parser.parse_args()
+
+    print(f'{args.threads} threads, {args.seconds:g}s per profile, {args.write_ratio:.0%} writes, '
+          f'{args.cohort} projects')
+    print(f'{"profile":<12}{"reads/s":>10}{"writes/s":>10}{"total/s":>10}{"errors":>8}')
+    for profile in args.profiles:
+        results = run_profile(profile, args.threads, args.seconds, args.write_ratio, args.cohort)
+        reads, writes = results['reads'] / args.seconds, results['writes'] / args.seconds
+        print(f'{profile:<12}{reads:>10.1f}{writes:>10.1f}{reads + writes:>10.1f}{results["errors"]:>8}')
+
+
+if __name__ == '__main__':
+    main()
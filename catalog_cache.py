@@ -0,0 +1,67 @@
+import time
+from collections import OrderedDict
+from threading import Lock
+
+from flask import Flask, current_app
+
+
+class CatalogCache:
+    # Keeps rendered catalog pages keyed on a catalog version, so repeat views skip the search query and the template.
+    # Routes that change what the catalog shows (catalog entries, active supervisors) bump the version, which drops
+    # every page rendered before it. Entries also expire after CATALOG_CACHE_TTL seconds, bounding how long a change
+    # made by another process (a CLI command or another worker) goes unseen. At most CATALOG_CACHE_SIZE pages are held,
+    # least recently used first out.
+
+    def __init__(self, app: Flask = None):
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app: Flask):
+        self.ttl = app.config.get('CATALOG_CACHE_TTL', 300)
+        self.max_size = app.config.get('CATALOG_CACHE_SIZE', 256)
+        self.entries = OrderedDict()  # (version, key) -> (expiry, html), oldest use first
+        self.lock = Lock()
+        self.version = 0
+        self.hits = 0
+        self.misses = 0
+        app.extensions['catalog_cache'] = self
+
+    @property
+    def size(self) -> int:
+        return len(self.entries)
+
+    @property
+    def hit_rate(self) -> float:
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+    def get(self, key: tuple, render) -> str:
+        now = time.monotonic()
+        with self.lock:
+            version = self.version
+            entry = self.entries.get((version, key))
+            if entry is not None and entry[0] > now:
+                self.entries.move_to_end((version, key))
+                self.hits += 1
+                return entry[1]
+            self.misses += 1
+        html = render()
+        with self.lock:
+            # A page rendered while the catalog changed may already be stale, so it is not stored
+            if version == self.version and self.max_size > 0:
+                self.entries[(version, key)] = (now + self.ttl, html)
+                self.entries.move_to_end((version, key))
+                while len(self.entries) > self.max_size:
+                    self.entries.popitem(last=False)
+        return html
+
+    def bump(self):
+        with self.lock:
+            self.version += 1
+            self.entries.clear()
+
+
+def invalidate_catalog():
+    cache = current_app.extensions.get('catalog_cache')
+    if cache is not None:
+        cache.bump()
@@ -26,3 +26,18 @@ class ProjectNotSubmittedError(ValueError):
 class NoConcordantProjectMarks(ValueError):
     #  This exception is raised when a project has no concordant marks, thus requires additional marking
     pass
+
+
+class InvalidMeetingSeries(ValueError):
+    # This exception is raised when a recurring meeting series cannot be created as requested.
+    pass
+
+
+class VerifierBusyError(RuntimeError):
+    # This exception is raised when the password verification pool has no room for another login attempt.
+    pass
+
+
+class JobCancelled(Exception):
+    # This exception is raised inside a background job when an admin has asked for it to be cancelled.
+    pass
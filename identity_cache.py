@@ -0,0 +1,66 @@
+import time
+from collections import OrderedDict
+from threading import Lock
+
+from flask import Flask, current_app
+
+
+class IdentityCache:
+    # Keeps the identity of recently seen users (see User.identity) for IDENTITY_CACHE_TTL seconds so authorising a
+    # request does not need a user-table query. At most IDENTITY_CACHE_SIZE users are held, least recently used first
+    # out. Routes that change a user's role, status or password invalidate that user's entry.
+
+    def __init__(self, app: Flask = None):
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app: Flask):
+        self.ttl = app.config.get('IDENTITY_CACHE_TTL', 60)
+        self.max_size = app.config.get('IDENTITY_CACHE_SIZE', 1024)
+        self.entries = OrderedDict()  # user id -> (expiry, identity), oldest use first
+        self.lock = Lock()
+        self.generation = 0  # bumped on invalidation so a load that raced with it is not stored
+        self.hits = 0
+        self.misses = 0
+        app.extensions['identity_cache'] = self
+
+    @property
+    def size(self) -> int:
+        return len(self.entries)
+
+    @property
+    def hit_rate(self) -> float:
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+    def get(self, user_id: int, load) -> dict:
+        now = time.monotonic()
+        with self.lock:
+            entry = self.entries.get(user_id)
+            if entry is not None and entry[0] > now:
+                self.entries.move_to_end(user_id)
+                self.hits += 1
+                return entry[1]
+            self.misses += 1
+            generation = self.generation
+        identity = load(user_id)
+        if identity is not None:
+            with self.lock:
+                if generation == self.generation:
+                    self.entries[user_id] = (now + self.ttl, identity)
+                    self.entries.move_to_end(user_id)
+                    while len(self.entries) > self.max_size:
+                        self.entries.popitem(last=False)
+        return identity
+
+    def invalidate(self, *user_ids: int):
+        with self.lock:
+            self.generation += 1
+            for user_id in user_ids:
+                self.entries.pop(user_id, None)
+
+
+def invalidate_identities(*user_ids: int):
+    cache = current_app.extensions.get('identity_cache')
+    if cache is not None:
+        cache.invalidate(*user_ids)
@@ -4,7 +4,7 @@ from models.db import db
 app = create_app()
 
 from models import User, CatalogProposal
-from werkzeug.security import generate_password_hash
+from password_verifier import hash_password
 
 
 def init_database():
@@ -17,7 +17,7 @@ def init_database():
             User(
                 name="Alice Student",
                 email="alice@student.univ.edu",
-                password_hash=generate_password_hash("password123"),
+                password_hash=hash_password("password123"),
                 is_supervisor=False,
                 is_admin=False,
                 active=True
@@ -25,7 +25,7 @@ def init_database():
             User(
                 name="Bob Supervisor",
                 email="bob@staff.univ.edu",
-                password_hash=generate_password_hash("securepass"),
+                password_hash=hash_password("securepass"),
                 is_supervisor=True,
                 is_admin=False,
                 active=True
@@ -33,7 +33,7 @@ def init_database():
             User(
                 name="Carol Supervisor",
                 email="carol@staff.univ.edu",
-                password_hash=generate_password_hash("anotherpass"),
+                password_hash=hash_password("anotherpass"),
                 is_supervisor=True,
                 is_admin=False,
                 active=True
@@ -41,7 +41,7 @@ def init_database():
             User(
                 name="Dave Admin",
                 email="dave@admin.univ.edu",
-                password_hash=generate_password_hash("adminpass"),
+                password_hash=hash_password("adminpass"),
                 is_supervisor=True,  # Also supervises
                 is_admin=True,
                 active=True
@@ -49,7 +49,7 @@ def init_database():
             User(
                 name="Eve Inactive Supervisor",
                 email="eve@staff.univ.edu",
-                password_hash=generate_password_hash("inactivepass"),
+                password_hash=hash_password("inactivepass"),
                 is_supervisor=True,
                 is_admin=False,
                 active=False
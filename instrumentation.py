@@ -0,0 +1,144 @@
+import heapq
+import json
+import logging
+import time
+from threading import Lock
+
+from flask import Flask, g, has_request_context, request
+from sqlalchemy import event
+
+from models.db import db
+
+# Logger for the per-request JSON lines. It has its own handler and level, so the lines are written whatever level the
+# app's logger is left at.
+SQL_STATS_LOGGER = 'sql_stats'
+
+
+class RequestQueryStats:
+    def __init__(self, top_n: int):
+        self.top_n = top_n
+        self.count = 0
+        self.total_time = 0.0
+        self.slowest = []  # min-heap of (duration, statement) holding the top_n slowest statements
+
+    def record(self, statement: str, duration: float):
+        self.count += 1
+        self.total_time += duration
+        if len(self.slowest) < self.top_n:
+            heapq.heappush(self.slowest, (duration, statement))
+        elif duration > self.slowest[0][0]:
+            heapq.heapreplace(self.slowest, (duration, statement))
+
+    def slowest_statements(self) -> [(float, str)]:
+        return sorted(self.slowest, reverse=True)
+
+
+class EndpointQueryStats:
+    def __init__(self, top_n: int):
+        self.top_n = top_n
+        self.requests = 0
+        self.queries = 0
+        self.db_time = 0.0
+        self.max_queries = 0
+        self.max_db_time = 0.0
+        self.slowest = []
+
+    def add(self, stats: RequestQueryStats):
+        self.requests += 1
+        self.queries += stats.count
+        self.db_time += stats.total_time
+        self.max_queries = max(self.max_queries, stats.count)
+        self.max_db_time = max(self.max_db_time, stats.total_time)
+        for item in stats.slowest:
+            if len(self.slowest) < self.top_n:
+                heapq.heappush(self.slowest, item)
+            elif item[0] > self.slowest[0][0]:
+                heapq.heapreplace(self.slowest, item)
+
+    @property
+    def mean_queries(self) -> float:
+        return self.queries / self.requests if self.requests else 0.0
+
+    @property
+    def mean_db_time(self) -> float:
+        return self.db_time / self.requests if self.requests else 0.0
+
+    def slowest_statements(self) -> [(float, str)]:
+        return sorted(self.slowest, reverse=True)
+
+
+class SQLInstrumentation:
+    # Records query count, total database time and the slowest statements for each request when SQL_INSTRUMENTATION
+    # is enabled. Each response gets a Server-Timing header and a JSON line on the SQL_STATS_LOGGER logger, and totals
+    # are kept per endpoint for the admin SQL statistics page.
+
+    def __init__(self, app: Flask = None):
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app: Flask):
+        if not app.config.get('SQL_INSTRUMENTATION'):
+            return
+        top_n = app.config.get('SQL_INSTRUMENTATION_TOP_N', 5)
+        app.extensions['sql_instrumentation'] = {'top_n': top_n, 'endpoints': {}, 'lock': Lock()}
+        logger = stats_logger()
+
+        with app.app_context():
+            engine = db.engine
+
+        @event.listens_for(engine, 'before_cursor_execute')
+        def start_timer(conn, cursor, statement, parameters, context, executemany):
+            conn.info.setdefault('query_start_time', []).append(time.perf_counter())
+
+        @event.listens_for(engine, 'after_cursor_execute')
+        def stop_timer(conn, cursor, statement, parameters, context, executemany):
+            duration = time.perf_counter() - conn.info['query_start_time'].pop()
+            if has_request_context() and 'query_stats' in g:
+                g.query_stats.record(statement, duration)
+
+        @app.before_request
+        def start_request_stats():
+            g.query_stats = RequestQueryStats(top_n)
+
+        @app.after_request
+        def report_request_stats(response):
+            stats = g.pop('query_stats', None)
+            if stats is None:
+                return response
+            endpoint = request.endpoint or request.path
+            state = app.extensions['sql_instrumentation']
+            with state['lock']:
+                state['endpoints'].setdefault(endpoint, EndpointQueryStats(top_n)).add(stats)
+            response.headers.add('Server-Timing',
+                                 f'db;dur={stats.total_time * 1000:.2f};desc="{stats.count} queries"')
+            logger.info(json.dumps({
+                'event': 'sql_stats',
+                'endpoint': endpoint,
+                'method': request.method,
+                'status': response.status_code,
+                'queries': stats.count,
+                'db_time_ms': round(stats.total_time * 1000, 3),
+                'slowest': [{'ms': round(duration * 1000, 3), 'statement': statement}
+                            for duration, statement in stats.slowest_statements()]
+            }))
+            return response
+
+
+def stats_logger() -> logging.Logger:
+    logger = logging.getLogger(SQL_STATS_LOGGER)
+    if not logger.handlers:
+        handler = logging.StreamHandler()
+        handler.setFormatter(logging.Formatter('%(message)s'))
+        logger.addHandler(handler)
+        logger.setLevel(logging.INFO)
+        logger.propagate = False
+    return logger
+
+
+def worst_endpoints(app: Flask) -> [(str, EndpointQueryStats)]:
+    state = app.extensions.get('sql_instrumentation')
+    if state is None:
+        return []
+    with state['lock']:
+        endpoints = list(state['endpoints'].items())
+    return sorted(endpoints, key=lambda item: item[1].max_db_time, reverse=True)
@@ -0,0 +1,210 @@
+from concurrent.futures import ThreadPoolExecutor, wait as wait_for
+from datetime import datetime, timedelta
+from threading import Event, Lock, Thread
+
+import click
+from flask import Flask, current_app
+from flask.cli import AppGroup
+from sqlalchemy import select, update
+
+from exceptions import JobCancelled
+from models.Job import Job, JobState
+from models.db import db
+
+# Task functions by name, registered with job_task
+TASKS = {}
+
+
+def job_task(name: str):
+    # Registers a function as the task run for jobs of this name. It is called as task(job, **arguments) with a
+    # JobContext for reporting progress, and returns the message shown once the job has succeeded.
+    def register(function):
+        TASKS[name] = function
+        return function
+
+    return register
+
+
+class JobContext:
+    # Handed to a running task. progress() records how far it has got, which is also the point where a cancelled job
+    # stops: it raises JobCancelled once cancellation has been asked for.
+
+    def __init__(self, job_id: int):
+        self.job_id = job_id
+
+    def progress(self, done: int, total: int = None):
+        # Commits the session, so call it between units of work, never in the middle of one
+        values = {'progress': done, 'heartbeat_at': datetime.now()}
+        if total is not None:
+            values['total'] = total
+        cancel_requested = db.session.execute(
+            update(Job).where(Job.id == self.job_id).values(**values).returning(Job.cancel_requested)
+            .execution_options(synchronize_session=False)).scalar()
+        db.session.commit()
+        if cancel_requested:
+            raise JobCancelled(f'Job {self.job_id} was cancelled.')
+
+
+class JobQueue:
+    # Runs slow operations outside the request on a pool of worker threads, keeping every job's state in the job table.
+    # Any process can submit jobs, but only those started to run them do: the server with JOB_RUN_IN_PROCESS set, on
+    # JOB_WORKERS threads, or `flask jobs worker`. Other processes, such as CLI commands, only queue them. A job is
+    # claimed by moving it from queued to running in one conditional update, so each runs once even with several worker
+    # processes. Every JOB_POLL_INTERVAL seconds a running queue dispatches the jobs queued by other processes, renews
+    # the heartbeat of the jobs it is running itself, however long a task goes between progress reports, and queues
+    # again the running jobs whose heartbeat is JOB_STALE_AFTER seconds old, whose worker must have stopped, so tasks
+    # must be safe to run again after an interruption. JOB_STALE_AFTER must therefore be well above JOB_POLL_INTERVAL.
+    # The poll is not repeated when testing; poll() runs it on demand.
+
+    def __init__(self, app: Flask = None):
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app: Flask):
+        self.app = app
+        self.stale_after = timedelta(seconds=app.config.get('JOB_STALE_AFTER', 300))
+        self.poll_interval = app.config.get('JOB_POLL_INTERVAL', 30)
+        self.executor = None  # Only created in a process that runs jobs, see start()
+        self.futures = {}  # job id -> Future, for the jobs dispatched by this process
+        self.lock = Lock()
+        self.stopped = Event()
+        app.extensions['job_queue'] = self
+        app.cli.add_command(jobs_cli)
+        workers = app.config.get('JOB_WORKERS', 2)
+        if app.config.get('JOB_RUN_IN_PROCESS') and workers:
+            self.start(workers)
+            if not app.testing:
+                Thread(target=self.work, name='job-queue', daemon=True).start()
+
+    @property
+    def running(self) -> bool:
+        return self.executor is not None
+
+    def start(self, workers: int):
+        # Starts running jobs in this process, beginning with those left queued or abandoned by the last run
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='job')
+        with self.app.app_context():
+            self.poll()
+
+    def work(self):
+        while not self.stopped.wait(self.poll_interval):
+            with self.app.app_context():
+                try:
+                    self.poll()
+                except Exception:
+                    self.app.logger.exception('Polling the job queue failed')
+                finally:
+                    db.session.remove()
+
+    def stop(self):
+        self.stopped.set()
+
+    def submit(self, name: str, created_by_id: int = None, **arguments) -> Job:
+        if name not in TASKS:
+            raise ValueError(f'Unknown job {name}.')
+        job = Job(name=name, arguments=arguments, created_by_id=created_by_id)
+        db.session.add(job)
+        db.session.commit()
+        if self.running:
+            self.dispatch(job.id)
+        return job
+
+    def dispatch(self, job_id: int):
+        with self.lock:
+            self.futures[job_id] = self.executor.submit(self.run, job_id)
+
+    def poll(self):
+        now = datetime.now()
+        with self.lock:
+            dispatched = set(self.futures)
+        # Jobs this process still holds are alive whether or not their task has reported progress lately
+        if dispatched:
+            db.session.execute(update(Job).where(Job.id.in_(dispatched), Job.state == JobState.RUNNING)
+                               .values(heartbeat_at=now).execution_options(synchronize_session=False))
+        db.session.execute(update(Job).where(Job.state == JobState.RUNNING, Job.heartbeat_at < now - self.stale_after,
+                                             Job.id.not_in(dispatched))
+                           .values(state=JobState.QUEUED).execution_options(synchronize_session=False))
+        db.session.commit()
+        queued = db.session.scalars(select(Job.id).where(Job.state == JobState.QUEUED)
+                                    .order_by(Job.created_at, Job.id)).all()
+        for job_id in queued:
+            if job_id not in dispatched:
+                self.dispatch(job_id)
+
+    def cancel(self, job_id: int) -> bool:
+        # A queued job is cancelled straight away, a running one at its next progress report. Returns whether the job
+        # was still unfinished.
+        now = datetime.now()
+        cancelled = db.session.execute(
+            update(Job).where(Job.id == job_id, Job.state == JobState.QUEUED)
+            .values(state=JobState.CANCELLED, cancel_requested=True, finished_at=now)
+            .execution_options(synchronize_session=False)).rowcount
+        if not cancelled:
+            cancelled = db.session.execute(
+                update(Job).where(Job.id == job_id, Job.state == JobState.RUNNING).values(cancel_requested=True)
+                .execution_options(synchronize_session=False)).rowcount
+        db.session.commit()
+        return bool(cancelled)
+
+    def wait(self, timeout: float = None):
+        # Blocks until every job dispatched by this process has finished
+        with self.lock:
+            futures = list(self.futures.values())
+        wait_for(futures, timeout)
+
+    def run(self, job_id: int):
+        with self.app.app_context():
+            try:
+                self._run(job_id)
+            finally:
+                db.session.remove()
+                with self.lock:
+                    self.futures.pop(job_id, None)
+
+    def _run(self, job_id: int):
+        now = datetime.now()
+        claimed = db.session.execute(
+            update(Job).where(Job.id == job_id, Job.state == JobState.QUEUED)
+            .values(state=JobState.RUNNING, started_at=now, heartbeat_at=now)
+            .execution_options(synchronize_session=False)).rowcount
+        db.session.commit()
+        if not claimed:
+            return  # cancelled while queued, or claimed by another process
+        job = db.session.get(Job, job_id)
+        task = TASKS.get(job.name)
+        try:
+            if task is None:
+                raise ValueError(f'Unknown job {job.name}.')
+            message = task(JobContext(job_id), **job.arguments)
+            state = JobState.SUCCEEDED
+        except JobCancelled:
+            db.session.rollback()
+            message, state = 'Cancelled.', JobState.CANCELLED
+        except Exception as e:
+            db.session.rollback()
+            self.app.logger.exception('Job %s (%s) failed', job_id, job.name)
+            message, state = str(e) or e.__class__.__name__, JobState.FAILED
+        db.session.execute(update(Job).where(Job.id == job_id).values(
+            state=state, message=message, finished_at=datetime.now()).execution_options(synchronize_session=False))
+        db.session.commit()
+
+
+jobs_cli = AppGroup('jobs', help='Run background jobs.')
+
+
+@jobs_cli.command('worker')
+@click.option('--workers', type=int, help='Jobs run at once, instead of JOB_WORKERS.')
+def jobs_worker_command(workers):
+    """Run queued background jobs and deliver notifications until stopped."""
+    queue = current_app.extensions['job_queue']
+    outbox = current_app.extensions['notification_outbox']
+    workers = max(1, workers or current_app.config['JOB_WORKERS'])
+    if not queue.running:
+        queue.start(workers)
+    outbox.start()
+    click.echo(f'Running background jobs on {workers} thread(s), press Ctrl+C to stop.')
+    try:
+        queue.work()
+    except KeyboardInterrupt:
+        queue.stop()
+        outbox.stop()
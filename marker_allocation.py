@@ -0,0 +1,134 @@
+import heapq
+
+from sqlalchemy import and_, bindparam, exists, func, insert, or_, select, update
+
+from job_queue import JobContext, job_task
+from models.Project import Project, ProjectStatus
+from models.ProjectMark import ProjectMark
+from models.Proposal import Proposal
+from models.User import User
+from models.db import db
+from notifications import notify_all
+
+# Projects whose marks are still being entered, which is the marking load a supervisor carries
+MARKING_STATUSES = (ProjectStatus.SUBMITTED, ProjectStatus.MARKING)
+
+
+class AllocationPlan:
+    def __init__(self):
+        self.assignments = []  # (project id, title, supervisor id, second marker id) in allocation order
+        self.unassigned = []  # (project id, title) for projects no eligible marker could take
+        self.loads = {}  # marker id -> (name, projects being marked before, after)
+        self.allocated = []  # (project id, second marker id) actually written, once the plan is applied
+
+    def __len__(self):
+        return len(self.assignments)
+
+
+def marking_loads() -> {int: (str, int)}:
+    # Every active supervisor with the number of projects being marked that they supervise or second mark
+    marking = and_(Project.status.in_(MARKING_STATUSES),
+                   or_(Project.supervisor_id == User.id, Project.second_marker_id == User.id))
+    rows = db.session.execute(select(User.id, User.name, func.count(Project.id)).outerjoin(Project, marking).where(
+        User.is_supervisor == True, User.active == True).group_by(User.id, User.name))
+    return {user_id: (name, load) for user_id, name, load in rows}
+
+
+def plan_allocation() -> AllocationPlan:
+    # Assigns every submitted project without a second marker, oldest submission first, to the least loaded active
+    # supervisor who is neither its supervisor nor its student (ties go to the lowest id)
+    plan = AllocationPlan()
+    loads = marking_loads()
+    heap = [(load, user_id) for user_id, (_, load) in loads.items()]
+    heapq.heapify(heap)
+    projects = db.session.execute(
+        select(Project.id, Proposal.title, Project.supervisor_id, Project.student_id)
+        .join(Proposal, Proposal.id == Project.proposal_id)
+        .where(Project.second_marker_id.is_(None), Project.status.in_(MARKING_STATUSES))
+        .order_by(Project.submitted_datetime, Project.id))
+    for project_id, title, supervisor_id, student_id in projects:
+        skipped = []
+        while heap and heap[0][1] in (supervisor_id, student_id):
+            skipped.append(heapq.heappop(heap))
+        if heap:
+            load, marker_id = heapq.heappop(heap)
+            heapq.heappush(heap, (load + 1, marker_id))
+            plan.assignments.append((project_id, title, supervisor_id, marker_id))
+        else:
+            plan.unassigned.append((project_id, title))
+        for entry in skipped:
+            heapq.heappush(heap, entry)
+    after = dict((user_id, load) for load, user_id in heap)
+    plan.loads = {user_id: (name, load, after[user_id]) for user_id, (name, load) in loads.items()}
+    return plan
+
+
+def apply_allocation(assignments: [(int, int)], progress=None) -> [(int, int)]:
+    # Writes the given (project id, second marker id) pairs and their ProjectMark rows in one transaction, returning
+    # the pairs that took effect. A project assigned a marker since the plan was made keeps that marker, and a marker
+    # who is no longer an active supervisor is not assigned. When progress is given, each project is written in its own
+    # transaction instead and progress(projects done) is called after each one, so an interrupted run can be resumed
+    # without assigning or notifying anyone twice.
+    if progress is not None:
+        allocated = []
+        for done, assignment in enumerate(assignments, 1):
+            allocated += apply_allocation([assignment])
+            progress(done)
+        return allocated
+    if not assignments:
+        return []
+    projects = Project.__table__
+    marks = ProjectMark.__table__
+    users = User.__table__
+    project_ids = [project_id for project_id, _ in assignments]
+    try:
+        unassigned = set(db.session.scalars(select(projects.c.id).where(
+            projects.c.id.in_(project_ids), projects.c.second_marker_id.is_(None))))
+        db.session.execute(
+            update(projects).where(
+                projects.c.id == bindparam('project_id'), projects.c.second_marker_id.is_(None),
+                exists().where(users.c.id == bindparam('marker_id'), users.c.is_supervisor == True,
+                               users.c.active == True))
+            .values(second_marker_id=bindparam('marker_id')),
+            [{'project_id': project_id, 'marker_id': marker_id} for project_id, marker_id in assignments])
+        assigned = set(db.session.execute(select(projects.c.id, projects.c.second_marker_id).where(
+            projects.c.id.in_(project_ids))).tuples())
+        allocated = [(project_id, marker_id) for project_id, marker_id in assignments
+                     if project_id in unassigned and (project_id, marker_id) in assigned]
+        # As project.add_marker does, a marker only gets a mark row if they have no outstanding one on the project
+        outstanding = set(db.session.execute(select(marks.c.project_id, marks.c.marker_id).where(
+            marks.c.project_id.in_(project_ids), marks.c.finalised == False)).tuples())
+        rows = [{'project_id': project_id, 'marker_id': marker_id, 'finalised': False}
+                for project_id, marker_id in allocated if (project_id, marker_id) not in outstanding]
+        if rows:
+            db.session.execute(insert(marks), rows)
+        # Notified in the same transaction, and only for the assignments that took effect
+        titles = dict(db.session.execute(select(Project.id, Proposal.title).join(
+            Proposal, Proposal.id == Project.proposal_id).where(Project.id.in_(project_ids))).all())
+        notify_all([{'recipient_id': marker_id, 'subject': f'Second marker: {titles[project_id]}',
+                     'body': 'You have been assigned as second marker for this project.'}
+                    for project_id, marker_id in allocated])
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+    return [(project_id, marker_id) for project_id, marker_id in allocated]
+
+
+def allocate_second_markers(dry_run: bool = False) -> AllocationPlan:
+    # Plans the allocation and, unless dry_run, applies it at once
+    plan = plan_allocation()
+    if not dry_run:
+        plan.allocated = apply_allocation([(project_id, marker_id) for project_id, _, _, marker_id in plan.assignments])
+    return plan
+
+
+@job_task('allocate_second_markers')
+def allocate_second_markers_job(job: JobContext, assignments: [[int, int]]) -> str:
+    job.progress(0, len(assignments))
+    allocated = apply_allocation(assignments, progress=job.progress)
+    message = f'{len(allocated)} second marker(s) allocated.'
+    changed = len(assignments) - len(allocated)
+    if changed:
+        message += f' {changed} project(s) changed since the preview and were left as they are.'
+    return message
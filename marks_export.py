@@ -0,0 +1,89 @@
+import csv
+from itertools import groupby
+
+from sqlalchemy import and_, func, select
+from sqlalchemy.orm import aliased
+
+from models import MarkingRound, Project, ProjectMark, Proposal, User
+from models.db import db
+
+# Leading columns of the exam board export, followed by three columns per marking round and the final mark
+EXPORT_COLUMNS = ('Project ID', 'Title', 'Student', 'Student Email', 'Supervisor', 'Second Marker', 'Status')
+
+# Projects read from the cursor at a time, so memory stays flat however large the cohort
+EXPORT_BATCH_SIZE = 1000
+
+# Spreadsheet applications run cells starting with these as formulas
+FORMULA_PREFIXES = ('=', '+', '-', '@', '\t', '\r')
+
+
+class Echo:
+    # A file-like object handing each line written by csv.writer straight back, so rows can be yielded one at a time
+    def write(self, value: str) -> str:
+        return value
+
+
+def cell(value):
+    if value is None:
+        return ''
+    if isinstance(value, str) and value.startswith(FORMULA_PREFIXES):
+        return "'" + value
+    return value
+
+
+def export_header(rounds: int) -> [str]:
+    header = list(EXPORT_COLUMNS)
+    for number in range(1, rounds + 1):
+        header += [f'Round {number} Supervisor Mark', f'Round {number} Second Marker Mark', f'Round {number} Agreed']
+    return header + ['Final Mark']
+
+
+def export_rows() -> [([object], {int: dict})]:
+    # One row per project, built from a single query of every project joined to its rounds and finalised marks and
+    # ordered by project, so consecutive rows of the result belong to the same project
+    student, supervisor, second_marker = aliased(User), aliased(User), aliased(User)
+    # Aliased so the marking_round subqueries of the status expression are not correlated with the joined rounds
+    marking_round = aliased(MarkingRound)
+    rows = db.session.execute(
+        select(Project.id, Proposal.title, student.name.label('student'), student.email,
+               supervisor.name.label('supervisor'), second_marker.name.label('second_marker'),
+               Project.status.label('status'), Project.supervisor_id, marking_round.round_number,
+               marking_round.concordant, marking_round.resolved_mark, ProjectMark.marker_id, ProjectMark.mark)
+        .join(Proposal, Proposal.id == Project.proposal_id)
+        .join(student, student.id == Project.student_id)
+        .join(supervisor, supervisor.id == Project.supervisor_id)
+        .outerjoin(second_marker, second_marker.id == Project.second_marker_id)
+        .outerjoin(marking_round, marking_round.project_id == Project.id)
+        .outerjoin(ProjectMark, and_(ProjectMark.round_id == marking_round.id, ProjectMark.finalised == True))
+        .order_by(Project.id, marking_round.round_number, ProjectMark.id)
+        .execution_options(yield_per=EXPORT_BATCH_SIZE))
+    for _, project_rows in groupby(rows, key=lambda row: row.id):
+        rounds = {}
+        for row in project_rows:
+            if row.round_number is None:
+                continue
+            marks = rounds.setdefault(row.round_number, {'supervisor': None, 'second_marker': None,
+                                                         'concordant': row.concordant,
+                                                         'resolved_mark': row.resolved_mark})
+            if row.marker_id is not None:
+                marks['supervisor' if row.marker_id == row.supervisor_id else 'second_marker'] = row.mark
+        yield [row.id, row.title, row.student, row.email, row.supervisor, row.second_marker, row.status.value], rounds
+
+
+def export_csv() -> [str]:
+    # The export as CSV lines, starting with a byte order mark so spreadsheet applications read it as UTF-8
+    rounds = db.session.scalar(select(func.max(MarkingRound.round_number))) or 1
+    writer = csv.writer(Echo())
+    yield '\ufeff' + writer.writerow(export_header(rounds))
+    for fields, project_rounds in export_rows():
+        final_mark = None
+        for number in range(1, rounds + 1):
+            marks = project_rounds.get(number)
+            if marks is None:
+                fields += [None, None, None]
+                continue
+            fields += [marks['supervisor'], marks['second_marker'],
+                       None if marks['concordant'] is None else ('Yes' if marks['concordant'] else 'No')]
+            if marks['concordant'] and final_mark is None:
+                final_mark = marks['resolved_mark']
+        yield writer.writerow([cell(value) for value in fields + [final_mark]])
@@ -0,0 +1,51 @@
+from flask import Flask
+from sqlalchemy import inspect
+
+from models.CatalogProposal import create_catalog_search
+from models.MarkingRound import assign_marks_to_rounds
+from models.User import assign_calendar_secrets
+from models.db import db
+
+
+# Columns added to existing tables since their first release. create_all only creates whole tables, so databases
+# created before a column was declared on a model are given it here.
+ADDED_COLUMNS = (
+    ('project_mark', 'round_id', 'INTEGER REFERENCES marking_round (id)'),
+    ('meeting', 'series_id', 'INTEGER REFERENCES meeting_series (id)'),
+    ('meeting', 'updated_at', 'DATETIME'),
+    ('user', 'calendar_secret', 'VARCHAR(32)'),
+    ('user', 'calendar_changed_at', 'DATETIME'),
+    ('notification', 'failed_at', 'DATETIME'),
+)
+
+
+def add_missing_columns(connection):
+    for table, column, definition in ADDED_COLUMNS:
+        if column not in {existing['name'] for existing in inspect(connection).get_columns(table)}:
+            connection.exec_driver_sql(f'ALTER TABLE {table} ADD COLUMN {column} {definition}')
+
+
+def create_missing_indexes(connection):
+    # create_all only creates indexes together with their tables, so databases created before an index was declared
+    # on a model are given it here. Names are read from sqlite_master because reflection skips expression indexes.
+    existing = set(connection.exec_driver_sql("SELECT name FROM sqlite_master WHERE type = 'index'").scalars())
+    for table in db.metadata.sorted_tables:
+        for index in table.indexes:
+            if index.name not in existing:
+                index.create(connection)
+
+
+# Applied in order on every start-up, so each one must be safe to run against an already migrated database
+MIGRATIONS = (
+    add_missing_columns,
+    create_missing_indexes,
+    assign_marks_to_rounds,
+    assign_calendar_secrets,
+    create_catalog_search,
+)
+
+
+def migrate(app: Flask):
+    with app.app_context(), db.engine.begin() as connection:
+        for migration in MIGRATIONS:
+            migration(connection)
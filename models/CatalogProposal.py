@@ -1,4 +1,6 @@
-from sqlalchemy import ForeignKey
+import re
+
+from sqlalchemy import ForeignKey, column, event, func, literal_column, select, table
 from sqlalchemy.orm import relationship, validates
 
 from exceptions import ActiveUserError, InvalidSupervisor
@@ -18,6 +20,10 @@ class CatalogProposal(db.Model):
 
     supervisor = relationship('User', back_populates='catalog_proposals')
 
+    __table_args__ = (
+        db.Index('ix_catalog_proposal_supervisor_active', 'supervisor_id', 'active'),
+    )
+
     @validates('supervisor')
     def validate_supervisor(self, key, user):
         if user is None:
@@ -27,3 +33,71 @@ class CatalogProposal(db.Model):
         if not user.active:
             raise ActiveUserError("Catalog proposals must be assigned to an active supervisor.")
         return user
+
+    @classmethod
+    def search(cls, text: str, page: int, per_page: int) -> ([tuple], bool):
+        # One page of active entries from active supervisors, best bm25 match first (titles weigh more than
+        # descriptions), or in creation order without search text. Rows carry the supervisor's name, and the flag says
+        # whether another page follows.
+        from models.User import User
+        statement = select(cls.id, cls.title, cls.description, cls.supervisor_id,
+                           User.name.label('supervisor_name')).join(User, User.id == cls.supervisor_id).where(
+            cls.active == True, User.active == True, User.is_supervisor == True)
+        match = fts_query(text)
+        if match:
+            statement = statement.join(CATALOG_SEARCH, CATALOG_SEARCH.c.rowid == cls.id).where(
+                literal_column(CATALOG_SEARCH.name).op('MATCH')(match)
+            ).order_by(func.bm25(literal_column(CATALOG_SEARCH.name), 10.0, 1.0), cls.id)
+        else:
+            statement = statement.order_by(cls.id)
+        rows = db.session.execute(statement.limit(per_page + 1).offset((page - 1) * per_page)).all()
+        return rows[:per_page], len(rows) > per_page
+
+
+# FTS5 index over catalog titles and descriptions, reading the text from catalog_proposal itself and kept in step with
+# it by triggers
+CATALOG_SEARCH = table('catalog_proposal_fts', column('rowid'))
+CATALOG_SEARCH_DDL = (
+    "CREATE VIRTUAL TABLE IF NOT EXISTS catalog_proposal_fts USING fts5("
+    "title, description, content='catalog_proposal', content_rowid='id', tokenize='porter unicode61')",
+    "CREATE TRIGGER IF NOT EXISTS catalog_proposal_fts_insert AFTER INSERT ON catalog_proposal BEGIN "
+    "INSERT INTO catalog_proposal_fts(rowid, title, description) VALUES (new.id, new.title, new.description); END",
+    "CREATE TRIGGER IF NOT EXISTS catalog_proposal_fts_delete AFTER DELETE ON catalog_proposal BEGIN "
+    "INSERT INTO catalog_proposal_fts(catalog_proposal_fts, rowid, title, description) "
+    "VALUES ('delete', old.id, old.title, old.description); END",
+    "CREATE TRIGGER IF NOT EXISTS catalog_proposal_fts_update AFTER UPDATE OF title, description ON catalog_proposal "
+    "BEGIN INSERT INTO catalog_proposal_fts(catalog_proposal_fts, rowid, title, description) "
+    "VALUES ('delete', old.id, old.title, old.description); "
+    "INSERT INTO catalog_proposal_fts(rowid, title, description) VALUES (new.id, new.title, new.description); END",
+)
+
+
+def fts_query(text: str) -> str:
+    # Each word becomes a quoted term so FTS5 operators in the input are matched literally; the last is a prefix so
+    # results show while typing
+    terms = re.findall(r'\w+', text or '')
+    if not terms:
+        return None
+    return ' '.join([f'"{term}"' for term in terms[:-1]] + [f'"{terms[-1]}"*'])
+
+
+def create_catalog_search(connection):
+    if connection.dialect.name != 'sqlite':
+        return
+    exists = connection.exec_driver_sql(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'catalog_proposal_fts'").first()
+    for statement in CATALOG_SEARCH_DDL:
+        connection.exec_driver_sql(statement)
+    if not exists:
+        connection.exec_driver_sql("INSERT INTO catalog_proposal_fts(catalog_proposal_fts) VALUES ('rebuild')")
+
+
+@event.listens_for(CatalogProposal.__table__, 'after_create')
+def create_catalog_search_with_table(target, connection, **kw):
+    create_catalog_search(connection)
+
+
+@event.listens_for(CatalogProposal.__table__, 'after_drop')
+def drop_catalog_search_with_table(target, connection, **kw):
+    if connection.dialect.name == 'sqlite':
+        connection.exec_driver_sql("DROP TABLE IF EXISTS catalog_proposal_fts")
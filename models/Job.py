@@ -0,0 +1,54 @@
+from datetime import datetime
+from enum import Enum
+
+from sqlalchemy import ForeignKey
+from sqlalchemy.orm import relationship
+
+from models.db import db
+
+
+class JobState(Enum):
+    QUEUED = 'Queued'
+    RUNNING = 'Running'
+    SUCCEEDED = 'Succeeded'
+    FAILED = 'Failed'
+    CANCELLED = 'Cancelled'
+
+
+# States a job does not leave again
+FINISHED_JOB_STATES = (JobState.SUCCEEDED, JobState.FAILED, JobState.CANCELLED)
+
+
+class Job(db.Model):
+    __tablename__ = 'job'
+
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(64), nullable=False)  # A task registered with job_queue.job_task
+    arguments = db.Column(db.JSON, nullable=False, default=dict)
+
+    state = db.Column(db.Enum(JobState), nullable=False, default=JobState.QUEUED)
+    progress = db.Column(db.Integer, nullable=False, default=0)
+    total = db.Column(db.Integer, nullable=True)  # None while the amount of work is unknown
+    message = db.Column(db.Text, nullable=True)  # The task's result, or the error it failed with
+    cancel_requested = db.Column(db.Boolean, nullable=False, default=False)
+
+    created_by_id = db.Column(db.Integer, ForeignKey('user.id'), nullable=True)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.now)
+    started_at = db.Column(db.DateTime, nullable=True)
+    heartbeat_at = db.Column(db.DateTime, nullable=True)  # Last progress report of a running job
+    finished_at = db.Column(db.DateTime, nullable=True)
+
+    created_by = relationship('User')
+
+    __table_args__ = (
+        # Jobs to resume on start-up, and the admin list of the latest jobs
+        db.Index('ix_job_state_created', 'state', 'created_at'),
+    )
+
+    @property
+    def is_finished(self):
+        return self.state in FINISHED_JOB_STATES
+
+    @property
+    def percent(self):
+        return round(100 * self.progress / self.total) if self.total else None
@@ -0,0 +1,154 @@
+from enum import Enum
+
+from sqlalchemy import ForeignKey, bindparam, event, insert, inspect, select, update
+from sqlalchemy.orm import relationship
+from sqlalchemy.orm.attributes import set_committed_value
+from sqlalchemy.orm.util import identity_key
+
+from models.ProjectMark import ProjectMark
+from models.db import db
+
+
+class MarkingRoundState(Enum):
+    OPEN = 'Open'
+    CLOSED = 'Closed'
+
+
+class MarkingRound(db.Model):
+    __tablename__ = 'marking_round'
+
+    id = db.Column(db.Integer, primary_key=True)
+    project_id = db.Column(db.Integer, ForeignKey('project.id'), nullable=False)
+    round_number = db.Column(db.Integer, nullable=False)
+
+    state = db.Column(db.Enum(MarkingRoundState), nullable=False, default=MarkingRoundState.OPEN)
+    concordant = db.Column(db.Boolean, nullable=True)  # None until the round is closed
+    resolved_mark = db.Column(db.Float, nullable=True)  # Average of the pair when concordant
+
+    project = relationship('Project', back_populates='rounds')
+    marks = relationship('ProjectMark', back_populates='round', order_by='ProjectMark.id')
+
+    __table_args__ = (
+        db.UniqueConstraint('project_id', 'round_number', name='uq_marking_round_project_round'),
+    )
+
+    @property
+    def is_open(self):
+        return self.state == MarkingRoundState.OPEN
+
+
+def _is_newly_finalised(session, mark: ProjectMark) -> bool:
+    if not mark.finalised:
+        return False
+    return mark in session.new or bool(inspect(mark).attrs.finalised.history.added)
+
+
+def _assign_round(session, mark: ProjectMark) -> int:
+    rounds = MarkingRound.__table__
+    round_id = mark.round_id
+    if round_id is not None:
+        state = session.execute(select(rounds.c.state).where(rounds.c.id == round_id)).scalar()
+        if state != MarkingRoundState.OPEN:
+            round_id = None
+    if round_id is None:
+        latest = session.execute(
+            select(rounds.c.id, rounds.c.round_number, rounds.c.state)
+            .where(rounds.c.project_id == mark.project_id)
+            .order_by(rounds.c.round_number.desc()).limit(1)
+        ).first()
+        if latest is not None and latest.state == MarkingRoundState.OPEN:
+            round_id = latest.id
+        else:
+            round_id = session.execute(insert(rounds).values(
+                project_id=mark.project_id,
+                round_number=latest.round_number + 1 if latest is not None else 1,
+                state=MarkingRoundState.OPEN
+            )).inserted_primary_key[0]
+    if mark.round_id != round_id:
+        session.execute(update(ProjectMark.__table__).where(ProjectMark.__table__.c.id == mark.id)
+                        .values(round_id=round_id))
+        set_committed_value(mark, 'round_id', round_id)
+    return round_id
+
+
+def _close_round_if_complete(session, round_id: int):
+    marks = ProjectMark.__table__
+    finalised = session.execute(
+        select(marks.c.mark).where(marks.c.round_id == round_id, marks.c.finalised == True)
+        .order_by(marks.c.id).limit(2)
+    ).scalars().all()
+    if len(finalised) < 2:
+        return
+    session.execute(update(MarkingRound.__table__).where(MarkingRound.__table__.c.id == round_id)
+                    .values(**closed_round(*finalised)))
+
+
+def closed_round(m1: float, m2: float) -> dict:
+    # The values of a round closed by this pair of finalised marks
+    concordant = bool(m1 and m2 and abs(m1 - m2) <= 5)
+    return {'state': MarkingRoundState.CLOSED, 'concordant': concordant,
+            'resolved_mark': (m1 + m2) / 2 if concordant else None}
+
+
+def assign_marks_to_rounds(connection):
+    # Builds the rounds of finalised marks that have none, such as those submitted before marking rounds existed, the
+    # same way the listener below does: in id order per project, closing a round at its second mark. Marks already in a
+    # round are left alone, so this is safe to run again.
+    rounds = MarkingRound.__table__
+    marks = ProjectMark.__table__
+    unassigned = connection.execute(
+        select(marks.c.id, marks.c.project_id, marks.c.mark)
+        .where(marks.c.finalised == True, marks.c.round_id.is_(None))
+        .order_by(marks.c.project_id, marks.c.id)).all()
+    if not unassigned:
+        return
+    latest = {}  # project id -> (round id, round number, finalised marks in it while it is open, else None)
+    for row in connection.execute(
+            select(rounds.c.id, rounds.c.project_id, rounds.c.round_number, rounds.c.state)
+            .where(rounds.c.project_id.in_({mark.project_id for mark in unassigned}))
+            .order_by(rounds.c.project_id, rounds.c.round_number)):
+        latest[row.project_id] = (row.id, row.round_number, [] if row.state == MarkingRoundState.OPEN else None)
+    open_rounds = {round_id: round_marks for round_id, _, round_marks in latest.values() if round_marks is not None}
+    for round_id, mark in connection.execute(
+            select(marks.c.round_id, marks.c.mark).where(marks.c.round_id.in_(open_rounds), marks.c.finalised == True)
+            .order_by(marks.c.id)):
+        open_rounds[round_id].append(mark)
+    assignments = []
+    for mark in unassigned:
+        round_id, round_number, round_marks = latest.get(mark.project_id, (None, 0, None))
+        if round_marks is None:
+            round_number += 1
+            round_id = connection.execute(insert(rounds).values(
+                project_id=mark.project_id, round_number=round_number, state=MarkingRoundState.OPEN
+            )).inserted_primary_key[0]
+            round_marks = []
+        round_marks.append(mark.mark)
+        assignments.append({'mark_id': mark.id, 'assigned_round_id': round_id})
+        if len(round_marks) == 2:
+            connection.execute(update(rounds).where(rounds.c.id == round_id).values(**closed_round(*round_marks)))
+            round_marks = None
+        latest[mark.project_id] = (round_id, round_number, round_marks)
+    connection.execute(update(marks).where(marks.c.id == bindparam('mark_id'))
+                       .values(round_id=bindparam('assigned_round_id')), assignments)
+
+
+@event.listens_for(db.session, 'after_flush')
+def update_marking_rounds(session, flush_context):
+    # Finalised marks are placed into the project's open round (or a new one) in id order; a round closes once it
+    # holds two finalised marks, recording whether they are concordant and the resolved mark.
+    newly_finalised = [obj for obj in list(session.new) + list(session.dirty)
+                       if isinstance(obj, ProjectMark) and _is_newly_finalised(session, obj)]
+    for mark in sorted(newly_finalised, key=lambda m: m.id):
+        _close_round_if_complete(session, _assign_round(session, mark))
+    if newly_finalised:
+        session.info.setdefault('marking_round_marks', []).extend(newly_finalised)
+
+
+@event.listens_for(db.session, 'after_flush_postexec')
+def expire_marking_rounds(session, flush_context):
+    from models.Project import Project
+    for mark in session.info.pop('marking_round_marks', []):
+        session.expire(mark, ['round'])
+        project = session.identity_map.get(identity_key(Project, mark.project_id))
+        if project is not None:
+            session.expire(project, ['rounds'])
@@ -10,8 +10,10 @@ class Meeting(db.Model):
 
     id = db.Column(db.Integer, primary_key=True)
     project_id = db.Column(db.Integer, ForeignKey('project.id'), nullable=False)
+    series_id = db.Column(db.Integer, ForeignKey('meeting_series.id'), nullable=True)  # None for one-off meetings
 
-    created_at = db.Column(db.DateTime, default=datetime.now())
+    created_at = db.Column(db.DateTime, default=datetime.now)
+    updated_at = db.Column(db.DateTime, nullable=True, default=datetime.now, onupdate=datetime.now)
     meeting_start = db.Column(db.DateTime, nullable=False)
     meeting_end = db.Column(db.DateTime, nullable=True)
     location = db.Column(db.String(120), nullable=True)
@@ -20,6 +22,7 @@ class Meeting(db.Model):
     outcome_notes = db.Column(db.Text, nullable=True)
 
     project = relationship('Project', back_populates='meetings')
+    series = relationship('MeetingSeries', back_populates='meetings')
 
     @property
     def has_started(self):
@@ -27,4 +30,8 @@ class Meeting(db.Model):
 
     __table_args__ = (
         db.CheckConstraint('meeting_end IS NULL OR meeting_end > meeting_start', name='check_meeting_end_after_start'),
+        # A project's meetings in date order
+        db.Index('ix_meeting_project_start', 'project_id', 'meeting_start'),
+        # The occurrences of a series in date order, for edits to the rest of a series
+        db.Index('ix_meeting_series_start', 'series_id', 'meeting_start'),
     )
@@ -0,0 +1,95 @@
+from datetime import date, datetime, timedelta
+
+from sqlalchemy import ForeignKey, insert
+from sqlalchemy.orm import relationship
+
+from exceptions import InvalidMeetingSeries
+from models.Meeting import Meeting
+from models.db import db
+
+# Weeks between the occurrences of a series for each repeat option
+SERIES_INTERVALS = {'weekly': 1, 'fortnightly': 2}
+
+# Upper bound on the occurrences created by one series, a full academic year of weekly meetings
+MAX_SERIES_OCCURRENCES = 52
+
+
+class MeetingSeries(db.Model):
+    __tablename__ = 'meeting_series'
+
+    id = db.Column(db.Integer, primary_key=True)
+    project_id = db.Column(db.Integer, ForeignKey('project.id'), nullable=False)
+    interval_weeks = db.Column(db.Integer, nullable=False)
+
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.now)
+
+    meetings = relationship('Meeting', back_populates='series', order_by='Meeting.meeting_start')
+
+    __table_args__ = (
+        db.CheckConstraint('interval_weeks > 0', name='check_series_interval_positive'),
+    )
+
+    @staticmethod
+    def occurrences(start: datetime, end: datetime, interval_weeks: int, count: int,
+                    skip_dates: [date] = ()) -> [(datetime, datetime)]:
+        # The (start, end) of each of count meetings, one every interval_weeks from start. Occurrences falling on a
+        # skipped date are left out and do not count towards count. Every occurrence is checked against the meeting
+        # table's check_meeting_end_after_start constraint here, so an invalid series is refused before any insert.
+        if interval_weeks not in SERIES_INTERVALS.values():
+            raise InvalidMeetingSeries("Meetings can only repeat weekly or fortnightly.")
+        if not 1 <= count <= MAX_SERIES_OCCURRENCES:
+            raise InvalidMeetingSeries(f"A series must have between 1 and {MAX_SERIES_OCCURRENCES} meetings.")
+        skip_dates = set(skip_dates)
+        step = timedelta(weeks=interval_weeks)
+        slots = []
+        offset = 0
+        while len(slots) < count:
+            slot_start, slot_end = start + offset * step, end + offset * step if end else None
+            offset += 1
+            if slot_start.date() in skip_dates:
+                continue
+            if slot_end is not None and slot_end <= slot_start:
+                raise InvalidMeetingSeries(f"The meeting on {slot_start:%Y-%m-%d} would end before it starts.")
+            slots.append((slot_start, slot_end))
+        return slots
+
+    @staticmethod
+    def parse_skip_dates(value: str) -> [date]:
+        # The comma separated ISO dates of the meeting form's skip_dates field; raises ValueError for a malformed one
+        return [date.fromisoformat(day.strip()) for day in (value or '').split(',') if day.strip()]
+
+    @classmethod
+    def create(cls, project_id: int, start: datetime, end: datetime, location: str, interval_weeks: int, count: int,
+               skip_dates: [date] = ()) -> 'MeetingSeries':
+        # Adds the series and all of its meetings in one batched insert, committed together
+        slots = cls.occurrences(start, end, interval_weeks, count, skip_dates)
+        series = cls(project_id=project_id, interval_weeks=interval_weeks)
+        try:
+            db.session.add(series)
+            db.session.flush()
+            now = datetime.now()
+            db.session.execute(insert(Meeting.__table__), [
+                {'project_id': project_id, 'series_id': series.id, 'created_at': now, 'updated_at': now,
+                 'meeting_start': slot_start, 'meeting_end': slot_end, 'location': location, 'attendance': False}
+                for slot_start, slot_end in slots])
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+        return series
+
+    def meetings_after(self, meeting: Meeting) -> [Meeting]:
+        # Every occurrence of the series later than the given one
+        return Meeting.query.filter(Meeting.series_id == self.id, Meeting.meeting_start > meeting.meeting_start
+                                    ).order_by(Meeting.meeting_start).all()
+
+    @staticmethod
+    def shift_later(later: [Meeting], meeting: Meeting, old_start: datetime, old_end: datetime):
+        # Moves the later occurrences of a series by as much as meeting was moved from old_start and old_end. When
+        # either has no end time the later ends move with the start.
+        start_shift = meeting.meeting_start - old_start
+        end_shift = meeting.meeting_end - old_end if meeting.meeting_end and old_end else start_shift
+        for occurrence in later:
+            occurrence.meeting_start += start_shift
+            if occurrence.meeting_end:
+                occurrence.meeting_end += end_shift
@@ -0,0 +1,30 @@
+from datetime import datetime
+
+from sqlalchemy import ForeignKey
+from sqlalchemy.orm import relationship
+
+from models.db import db
+
+
+class Notification(db.Model):
+    # An outbox entry: written in the transaction that makes the change it reports, and mailed later as part of a
+    # digest of everything pending for its recipient
+    __tablename__ = 'notification'
+
+    id = db.Column(db.Integer, primary_key=True)
+    recipient_id = db.Column(db.Integer, ForeignKey('user.id'), nullable=False)
+    subject = db.Column(db.String(200), nullable=False)
+    body = db.Column(db.Text, nullable=False)
+
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.now)
+    claimed_at = db.Column(db.DateTime, nullable=True)  # When a worker took it for delivery
+    sent_at = db.Column(db.DateTime, nullable=True)
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    failed_at = db.Column(db.DateTime, nullable=True)  # When delivery was given up after the last allowed attempt
+
+    recipient = relationship('User')
+
+    __table_args__ = (
+        # Pending notifications, read by the worker in id order
+        db.Index('ix_notification_pending', 'sent_at', 'id'),
+    )
@@ -1,8 +1,9 @@
-from sqlalchemy import ForeignKey
+from sqlalchemy import ForeignKey, case, exists, type_coerce
 from sqlalchemy.ext.hybrid import hybrid_property
 from sqlalchemy.orm import relationship
 
 from exceptions import NoConcordantProjectMarks
+from models.MarkingRound import MarkingRound
 from models.db import db
 from enum import Enum
 
@@ -31,6 +32,8 @@ class Project(db.Model):
     supervisor = relationship('User', back_populates='projects_supervised', foreign_keys=[supervisor_id])
     second_marker = relationship('User', back_populates='projects_marked', foreign_keys=[second_marker_id])
     marks = relationship('ProjectMark', back_populates='project', cascade="all, delete-orphan")
+    rounds = relationship('MarkingRound', back_populates='project', order_by='MarkingRound.round_number',
+                          cascade="all, delete-orphan")
 
     submitted_datetime = db.Column(db.DateTime, nullable=True)
     archived_datetime = db.Column(db.DateTime, nullable=True)
@@ -43,37 +46,39 @@ class Project(db.Model):
     def is_archived(self):
         return self.archived_datetime is not None
 
+    @property
+    def current_round(self):
+        return self.rounds[-1] if self.rounds else None
+
     @hybrid_property
     def status(self):
         if self.is_archived:
             return ProjectStatus.ARCHIVED
-        final_mark = None
         if self.is_submitted:
-            try:
-                final_mark = self.get_final_mark()
-            except NoConcordantProjectMarks:
-                if any(m.finalised for m in self.marks):
-                    return ProjectStatus.MARKING
-            if final_mark is not None:
+            if any(r.concordant for r in self.rounds):
                 return ProjectStatus.MARKS_CONFIRMED
-            else:
-                return ProjectStatus.SUBMITTED
+            if self.rounds:
+                return ProjectStatus.MARKING
+            return ProjectStatus.SUBMITTED
         return ProjectStatus.ACTIVE
 
+    @status.expression
+    def status(cls):
+        # A marking round is only opened once a mark is finalised, so any round means marking is in progress.
+        has_round = exists().where(MarkingRound.project_id == cls.id)
+        return type_coerce(case(
+            (cls.archived_datetime.isnot(None), ProjectStatus.ARCHIVED.name),
+            (cls.submitted_datetime.is_(None), ProjectStatus.ACTIVE.name),
+            (has_round.where(MarkingRound.concordant == True), ProjectStatus.MARKS_CONFIRMED.name),
+            (has_round, ProjectStatus.MARKING.name),
+            else_=ProjectStatus.SUBMITTED.name
+        ), db.Enum(ProjectStatus, native_enum=False, create_constraint=False))
+
     def get_final_mark(self):
-        # Only compute if there are pairs and all pairs are concordant
-        marks = [m for m in self.marks if m.finalised]
-        if len(marks) == 0 or len(marks) % 2 != 0:
-            raise NoConcordantProjectMarks("Project does not have a valid pair of marks for reconciliation.")
-
-        marks_sorted = sorted(marks, key=lambda m: m.id)
-
-        for i in range(0, len(marks_sorted), 2):
-            m1, m2 = marks_sorted[i], marks_sorted[i + 1]
-            if not (m1.mark and m2.mark and m1.finalised and m2.finalised):
-                continue
-            if abs(m1.mark - m2.mark) <= 5:
-                return (m1.mark + m2.mark) / 2
+        # Marks are reconciled per marking round; the first concordant round gives the final mark
+        for marking_round in self.rounds:
+            if marking_round.concordant:
+                return marking_round.resolved_mark
         raise NoConcordantProjectMarks("No concordant marks found for project.")
 
     @hybrid_property
@@ -95,4 +100,9 @@ class Project(db.Model):
                            name='check_second_marker_not_supervisor'),
         db.CheckConstraint('second_marker_id IS NULL OR second_marker_id != student_id',
                            name='check_second_marker_not_student'),
+        # Status is derived from the submitted/archived dates, so these cover the per-user status lookups
+        db.Index('ix_project_supervisor_status', 'supervisor_id', 'archived_datetime', 'submitted_datetime'),
+        db.Index('ix_project_student_status', 'student_id', 'archived_datetime', 'submitted_datetime'),
+        db.Index('ix_project_second_marker', 'second_marker_id'),
+        db.Index('ix_project_archived', 'archived_datetime'),
     )
@@ -10,6 +10,7 @@ class ProjectMark(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     project_id = db.Column(db.Integer, ForeignKey('project.id'), nullable=False)
     marker_id = db.Column(db.Integer, ForeignKey('user.id'), nullable=False)
+    round_id = db.Column(db.Integer, ForeignKey('marking_round.id'), nullable=True)  # Set once finalised
 
     mark = db.Column(db.Float, nullable=True)
     feedback = db.Column(db.Text, nullable=True)
@@ -19,9 +20,16 @@ class ProjectMark(db.Model):
 
     project = relationship('Project', back_populates='marks')
     marker = relationship('User', back_populates='marks_given')
+    round = relationship('MarkingRound', back_populates='marks')
 
     __table_args__ = (
         CheckConstraint('mark is NULL OR (mark >= 0 AND mark <= 100)', name='check_grade_bounds'),
+        # A project's marks, optionally narrowed to one marker and whether finalised (view, submit and add marker)
+        db.Index('ix_project_mark_project_marker', 'project_id', 'marker_id', 'finalised'),
+        # A marker's outstanding marks and the projects they mark (dashboards and deactivation checks)
+        db.Index('ix_project_mark_marker', 'marker_id', 'finalised', 'project_id'),
+        # The finalised marks of a marking round
+        db.Index('ix_project_mark_round', 'round_id', 'finalised'),
     )
 
     @validates('finalised')
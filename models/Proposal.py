@@ -1,6 +1,7 @@
 from datetime import datetime
 
-from sqlalchemy import ForeignKey
+from sqlalchemy import Engine, ForeignKey, case, event, type_coerce
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.ext.hybrid import hybrid_property
 from sqlalchemy.orm import relationship, validates
 
@@ -64,11 +65,29 @@ class Proposal(db.Model):
         else:
             return ProposalStatus.PENDING
 
-    @validates('student_id')
-    def validate_max_active_proposal(self, key, value):
-        if value is not None:
-            user_proposals = Proposal.query.filter_by(student_id=value).filter(Proposal.id != self.id).all()
-            pending_user_proposals = [p for p in user_proposals if p.status == ProposalStatus.PENDING]
-            if len(pending_user_proposals) > 0:
-                raise MaxProposalsReachedError("Student already has an active proposal.")
-        return value
+    @status.expression
+    def status(cls):
+        return type_coerce(case(
+            (cls.rejected_date.isnot(None), ProposalStatus.REJECTED.name),
+            (cls.accepted_date.isnot(None), ProposalStatus.ACCEPTED.name),
+            else_=ProposalStatus.PENDING.name
+        ), db.Enum(ProposalStatus, native_enum=False, create_constraint=False))
+
+    __table_args__ = (
+        # Status is derived from the accepted/rejected dates, so these cover the per-user status lookups
+        db.Index('ix_proposal_supervisor_status', 'supervisor_id', 'accepted_date', 'rejected_date'),
+        db.Index('ix_proposal_student_status', 'student_id', 'accepted_date', 'rejected_date'),
+        db.Index('ix_proposal_catalog_proposal', 'catalog_proposal_id'),
+        # A student may only have one pending proposal at a time
+        db.Index('uq_proposal_student_pending', 'student_id', unique=True,
+                 sqlite_where=db.text('accepted_date IS NULL AND rejected_date IS NULL'),
+                 postgresql_where=db.text('accepted_date IS NULL AND rejected_date IS NULL')),
+    )
+
+
+@event.listens_for(Engine, 'handle_error')
+def translate_pending_proposal_violation(context):
+    message = str(context.original_exception)
+    if isinstance(context.sqlalchemy_exception, IntegrityError) and (
+            'uq_proposal_student_pending' in message or 'UNIQUE constraint failed: proposal.student_id' in message):
+        raise MaxProposalsReachedError("Student already has an active proposal.") from context.sqlalchemy_exception
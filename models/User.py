@@ -1,16 +1,32 @@
+import secrets
+from datetime import datetime
+
 from flask import flash
 from flask_login import UserMixin
 
-from sqlalchemy import or_
+from sqlalchemy import event, exists, func, inspect, literal, or_, select, union_all, update
 from sqlalchemy.ext.hybrid import hybrid_property
 from sqlalchemy.orm import relationship, validates
-from werkzeug.security import check_password_hash, generate_password_hash
+from werkzeug.security import check_password_hash
 
+from models.Meeting import Meeting
 from models.Proposal import Proposal, ProposalStatus
 from models.Project import Project, ProjectStatus
 from models.ProjectMark import ProjectMark
 from exceptions import ActiveUserError
 from models.db import db
+from password_verifier import hash_password
+
+# Reasons a user cannot be deactivated, in the order they are reported
+DEACTIVATION_BLOCKERS = {
+    'pending': "Cannot deactivate user with pending proposals.",
+    'ongoing': "Cannot deactivate user with ongoing projects.",
+    'unmarked': "Cannot deactivate user with unfinalised marks.",
+}
+
+
+def new_calendar_secret() -> str:
+    return secrets.token_urlsafe(16)
 
 
 class User(db.Model):
@@ -25,6 +41,11 @@ class User(db.Model):
     is_admin = db.Column(db.Boolean, default=False)
     active = db.Column(db.Boolean, default=True)
 
+    # The secret in the user's calendar feed link, replaced to revoke the link, and when their feed last changed in a
+    # way its meetings' own timestamps cannot show: a meeting deleted, or a project or person in it renamed
+    calendar_secret = db.Column(db.String(32), nullable=True, default=new_calendar_secret)
+    calendar_changed_at = db.Column(db.DateTime, nullable=True)
+
     projects = db.relationship('Project', back_populates='student', foreign_keys='Project.student_id')
 
     proposals_submitted = relationship('Proposal', back_populates='student', foreign_keys='Proposal.student_id')
@@ -34,9 +55,17 @@ class User(db.Model):
     projects_marked = relationship('Project', back_populates='second_marker', foreign_keys='Project.second_marker_id')
     marks_given = relationship('ProjectMark', back_populates='marker', foreign_keys='ProjectMark.marker_id')
 
+    __table_args__ = (
+        # The module leader's student and supervisor lists by status, in (name, id) order for keyset pagination
+        db.Index('ix_user_student_name', 'is_supervisor', 'is_admin', 'active', 'name', 'id'),
+        db.Index('ix_user_supervisor_name', 'is_supervisor', 'active', 'name', 'id'),
+        # Emails are stored as given and looked up without regard to case (see email_matches)
+        db.Index('ix_user_email_lower', func.lower(email)),
+    )
+
     def set_password(self, password: str) -> bool:
         try:
-            self.password_hash = generate_password_hash(password)
+            self.password_hash = hash_password(password)
             return True
         except Exception as e:
             flash(f"Error setting password: {e}", "error")
@@ -53,33 +82,91 @@ class User(db.Model):
 
     @hybrid_property
     def has_ongoing_project(self):
-        return [p for p in Project.query.join(Proposal).filter(
+        return Project.query.join(Proposal).filter(
             or_(
                 Project.supervisor_id == self.id,
                 Project.student_id == self.id
-            )
-        ) if p.status not in [ProjectStatus.ARCHIVED]]
+            ),
+            Project.status != ProjectStatus.ARCHIVED
+        ).all()
 
     @hybrid_property
     def has_pending(self):
-        return [p for p in Proposal.query.filter(
+        return Proposal.query.filter(
             or_(
                 Proposal.supervisor_id == self.id,
                 Proposal.student_id == self.id
-            )
-        ) if p.status == ProposalStatus.PENDING]
+            ),
+            Proposal.status == ProposalStatus.PENDING
+        ).all()
 
     @validates('active')
     def validate_active_status(self, key, value: bool):
         if not value:
-            if self.has_pending:
-                raise ActiveUserError("Cannot deactivate user with pending proposals.")
-            if self.has_ongoing_project:
-                raise ActiveUserError("Cannot deactivate user with ongoing projects.")
-            if self.has_unmarked:
-                raise ActiveUserError("Cannot deactivate user with unfinalised marks.")
+            blockers = User.deactivation_blockers([self.id]).get(self.id)
+            if blockers:
+                raise ActiveUserError(blockers[0])
         return value
 
+    @classmethod
+    def deactivation_blockers(cls, user_ids: [int]) -> {int: [str]}:
+        # Every blocking row for the given users is gathered in one grouped query over the union of the sources
+        user_ids = list(user_ids)
+        pending = Proposal.status == ProposalStatus.PENDING
+        ongoing = Project.archived_datetime.is_(None)
+        sources = union_all(
+            select(Proposal.student_id.label('user_id'), literal('pending').label('reason'))
+            .where(pending, Proposal.student_id.in_(user_ids)),
+            select(Proposal.supervisor_id, literal('pending')).where(pending, Proposal.supervisor_id.in_(user_ids)),
+            select(Project.student_id, literal('ongoing')).where(ongoing, Project.student_id.in_(user_ids)),
+            select(Project.supervisor_id, literal('ongoing')).where(ongoing, Project.supervisor_id.in_(user_ids)),
+            select(ProjectMark.marker_id, literal('unmarked'))
+            .where(ProjectMark.finalised == False, ProjectMark.marker_id.in_(user_ids))
+        ).subquery()
+        rows = db.session.execute(
+            select(sources.c.user_id, sources.c.reason).group_by(sources.c.user_id, sources.c.reason)
+        ).all()
+        found = {(user_id, reason) for user_id, reason in rows}
+        blockers = {}
+        for user_id in user_ids:
+            reasons = [message for reason, message in DEACTIVATION_BLOCKERS.items() if (user_id, reason) in found]
+            if reasons:
+                blockers[user_id] = reasons
+        return blockers
+
+    @classmethod
+    def deactivation_allowed(cls) -> list:
+        # The conditions of deactivation_blockers as NOT EXISTS predicates on the user row, one per source so each
+        # can use its index
+        pending = Proposal.status == ProposalStatus.PENDING
+        ongoing = Project.archived_datetime.is_(None)
+        return [~exists().where(pending, Proposal.student_id == cls.id),
+                ~exists().where(pending, Proposal.supervisor_id == cls.id),
+                ~exists().where(ongoing, Project.student_id == cls.id),
+                ~exists().where(ongoing, Project.supervisor_id == cls.id),
+                ~exists().where(ProjectMark.finalised == False, ProjectMark.marker_id == cls.id)]
+
+    @classmethod
+    def bulk_deactivate(cls, user_ids: [int]) -> ([int], {int: [str]}):
+        # Deactivates every eligible user in one statement, returning their ids and the reasons for any refused. The
+        # update checks eligibility again, so a user given a proposal, project or mark since the check is refused.
+        user_ids = set(user_ids)
+        existing = set(db.session.scalars(select(cls.id).where(cls.id.in_(user_ids))))
+        refused = {user_id: ["User does not exist."] for user_id in user_ids - existing}
+        refused.update(cls.deactivation_blockers(existing))
+        eligible = existing - refused.keys()
+        deactivated = []
+        if eligible:
+            deactivated = sorted(db.session.scalars(
+                update(cls).where(cls.id.in_(eligible), *cls.deactivation_allowed()).values(active=False)
+                .returning(cls.id).execution_options(synchronize_session='fetch')))
+            blocked = eligible - set(deactivated)
+            if blocked:
+                refused.update({user_id: ["User could not be deactivated, please retry."] for user_id in blocked})
+                refused.update(cls.deactivation_blockers(blocked))
+        db.session.commit()
+        return deactivated, refused
+
     @hybrid_property
     def is_student(self):
         return not (self.is_supervisor or self.is_admin)
@@ -95,40 +182,94 @@ class User(db.Model):
         else:
             return "Student"
 
+    @property
+    def identity(self) -> dict:
+        # The fields needed to authorise a request, as held by the identity cache
+        return {'id': self.id, 'email': self.email, 'name': self.name, 'is_supervisor': self.is_supervisor,
+                'is_admin': self.is_admin, 'user_type': self.user_type, 'active': self.active}
+
+    @classmethod
+    def email_matches(cls, *emails: str):
+        # Criterion matching users by any of the given emails, ignoring case and surrounding spaces
+        return func.lower(cls.email).in_([email.strip().lower() for email in emails])
+
+    @classmethod
+    def find_by_email(cls, email: str):
+        return cls.query.filter(cls.email_matches(email)).first()
+
+    @classmethod
+    def load_identity(cls, user_id: int) -> dict:
+        user = db.session.get(cls, user_id)
+        return user.identity if user else None
+
     @classmethod
     def get_active_supervisors(cls):
         return cls.query.filter_by(is_supervisor=True, active=True).all()
 
 
 class LoginUser(UserMixin):
-    def __init__(self, user: User):
-        self.id = user.id
+    # Built from a user's identity so it can be served from the identity cache; the User row is only loaded if obj is
+    # used.
+    def __init__(self, user: User = None, identity: dict = None):
+        self._identity = identity if identity is not None else user.identity
         self._user = user
+        self.id = self._identity['id']
 
     @property
     def email(self):
-        return self._user.email
+        return self._identity['email']
 
     @property
     def name(self):
-        return self._user.name
+        return self._identity['name']
 
     @property
     def is_supervisor(self):
-        return self._user.is_supervisor
+        return self._identity['is_supervisor']
 
     @property
     def is_admin(self):
-        return self._user.is_admin
+        return self._identity['is_admin']
 
     @property
     def is_student(self):
-        return not self._user.is_supervisor and not self._user.is_admin
+        return not self.is_supervisor and not self.is_admin
 
     @property
     def user_type(self):
-        return self._user.user_type
+        return self._identity['user_type']
 
     @property
     def obj(self):
+        if self._user is None:
+            self._user = db.session.get(User, self.id)
         return self._user
+
+
+def assign_calendar_secrets(connection):
+    # Gives users created before feed secrets existed one, so each has a feed link. Users with a secret keep it.
+    connection.exec_driver_sql("UPDATE user SET calendar_secret = lower(hex(randomblob(16))) "
+                               "WHERE calendar_secret IS NULL")
+
+
+def _changed(obj, attribute: str) -> bool:
+    return inspect(obj).attrs[attribute].history.has_changes()
+
+
+@event.listens_for(db.session, 'after_flush')
+def record_calendar_changes(session, flush_context):
+    # Marks the feeds showing a deleted meeting, a retitled project or a renamed user as changed, in the same
+    # transaction, so their ETag and Last-Modified move on (see routes.calendar.feed_version)
+    deleted_from = {obj.project_id for obj in session.deleted if isinstance(obj, Meeting)}
+    retitled = {obj.id for obj in session.dirty if isinstance(obj, Proposal) and _changed(obj, 'title')}
+    renamed = {obj.id for obj in session.dirty if isinstance(obj, User) and _changed(obj, 'name')}
+    if not (deleted_from or retitled or renamed):
+        return
+    projects = Project.__table__
+    users = User.__table__
+    affected = select(projects.c.student_id, projects.c.supervisor_id).where(or_(
+        projects.c.id.in_(deleted_from), projects.c.proposal_id.in_(retitled),
+        projects.c.student_id.in_(renamed), projects.c.supervisor_id.in_(renamed))).subquery()
+    session.execute(update(users).where(or_(
+        users.c.id.in_(renamed), users.c.id.in_(select(affected.c.student_id)),
+        users.c.id.in_(select(affected.c.supervisor_id)))).values(calendar_changed_at=datetime.now()))
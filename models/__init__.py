@@ -4,4 +4,8 @@ from .Proposal import Proposal  # noqa: F401
 from .Project import Project  # noqa: F401
 from .CatalogProposal import CatalogProposal  # noqa: F401
 from .ProjectMark import ProjectMark  # noqa: F401
+from .MarkingRound import MarkingRound  # noqa: F401
 from .Meeting import Meeting  # noqa: F401
+from .MeetingSeries import MeetingSeries  # noqa: F401
+from .Job import Job  # noqa: F401
+from .Notification import Notification  # noqa: F401
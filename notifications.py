@@ -0,0 +1,167 @@
+import smtplib
+from datetime import datetime, timedelta
+from email.message import EmailMessage
+from itertools import groupby
+from threading import Event, Thread
+
+import click
+from flask import Flask, current_app
+from flask.cli import with_appcontext
+from sqlalchemy import insert, or_, select, update
+
+from models import User
+from models.Notification import Notification
+from models.db import db
+
+
+def notify(recipient_id: int, subject: str, body: str):
+    # Adds a notification to the session, so it is committed, or rolled back, with the change it reports
+    db.session.add(Notification(recipient_id=recipient_id, subject=subject, body=body))
+
+
+def notify_all(notifications: [dict]):
+    # As notify, for many notifications at once in one executemany insert. Each dict has recipient_id, subject and body.
+    if notifications:
+        now = datetime.now()
+        db.session.execute(insert(Notification.__table__),
+                           [dict(notification, created_at=now, attempts=0) for notification in notifications])
+
+
+def digest_message(sender: str, recipient: User, notifications: [Notification]) -> EmailMessage:
+    message = EmailMessage()
+    message['From'] = sender
+    message['To'] = recipient.email
+    if len(notifications) == 1:
+        message['Subject'] = notifications[0].subject
+    else:
+        message['Subject'] = f'{len(notifications)} updates on your dissertation projects'
+    lines = [f'Hello {recipient.name},', '']
+    for notification in notifications:
+        lines += [f'{notification.created_at.strftime("%d/%m/%Y %H:%M")} {notification.subject}',
+                  notification.body, '']
+    message.set_content('\n'.join(lines))
+    return message
+
+
+class NotificationOutbox:
+    # Delivers the notification outbox by email. Every NOTIFICATION_INTERVAL seconds a worker thread claims the pending
+    # notifications, NOTIFICATION_BATCH_SIZE at a time, and sends each recipient one digest of all of theirs over SMTP
+    # to MAIL_SERVER:MAIL_PORT. A claim lapses after NOTIFICATION_CLAIM_TIMEOUT seconds, so notifications claimed by a
+    # worker that stopped, or that failed to send, are retried, up to NOTIFICATION_MAX_ATTEMPTS times; once the last
+    # attempt has lapsed they are marked as failed and logged. Like the job queue, the worker only runs in the server
+    # when JOB_RUN_IN_PROCESS is set (and not when testing) or in `flask jobs worker`, so CLI commands and extra server
+    # processes do not each start one; drain() delivers the outbox on demand.
+
+    def __init__(self, app: Flask = None):
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app: Flask):
+        self.app = app
+        self.interval = app.config.get('NOTIFICATION_INTERVAL', 300)
+        self.batch_size = app.config.get('NOTIFICATION_BATCH_SIZE', 500)
+        self.claim_timeout = timedelta(seconds=app.config.get('NOTIFICATION_CLAIM_TIMEOUT', 300))
+        self.max_attempts = app.config.get('NOTIFICATION_MAX_ATTEMPTS', 5)
+        self.stopped = Event()
+        self.thread = None
+        app.extensions['notification_outbox'] = self
+        app.cli.add_command(send_notifications_command)
+        if app.config.get('JOB_RUN_IN_PROCESS') and not app.testing:
+            self.start()
+
+    def start(self):
+        if self.interval and self.thread is None:
+            self.thread = Thread(target=self.work, name='notification-outbox', daemon=True)
+            self.thread.start()
+
+    def stop(self):
+        self.stopped.set()
+
+    def work(self):
+        while not self.stopped.wait(self.interval):
+            with self.app.app_context():
+                try:
+                    self.drain()
+                except Exception:
+                    self.app.logger.exception('Delivering notifications failed')
+                finally:
+                    db.session.remove()
+
+    def pending(self, now: datetime):
+        return (Notification.sent_at.is_(None), Notification.attempts < self.max_attempts,
+                or_(Notification.claimed_at.is_(None), Notification.claimed_at < now - self.claim_timeout))
+
+    def give_up(self, now: datetime):
+        # Marks the notifications whose last allowed attempt has lapsed without them being sent as failed
+        failed = db.session.execute(
+            update(Notification).where(Notification.sent_at.is_(None), Notification.failed_at.is_(None),
+                                       Notification.attempts >= self.max_attempts,
+                                       Notification.claimed_at < now - self.claim_timeout)
+            .values(failed_at=now).returning(Notification.id)
+            .execution_options(synchronize_session=False)).scalars().all()
+        db.session.commit()
+        if failed:
+            current_app.logger.error('Gave up on %s notification(s) after %s attempts: %s', len(failed),
+                                     self.max_attempts, ', '.join(map(str, sorted(failed))))
+
+    def claim(self) -> [int]:
+        # Takes the next batch for delivery. The update checks the claim again, so two workers never send the same one.
+        now = datetime.now()
+        self.give_up(now)
+        notification_ids = db.session.scalars(select(Notification.id).where(*self.pending(now))
+                                              .order_by(Notification.id).limit(self.batch_size)).all()
+        if not notification_ids:
+            return []
+        claimed = db.session.scalars(
+            update(Notification).where(Notification.id.in_(notification_ids), *self.pending(now))
+            .values(claimed_at=now, attempts=Notification.attempts + 1).returning(Notification.id)
+            .execution_options(synchronize_session=False)).all()
+        db.session.commit()
+        return claimed
+
+    def drain(self) -> int:
+        # Sends every pending notification and returns the number of digests sent
+        sent = 0
+        while True:
+            claimed = self.claim()
+            if not claimed:
+                return sent
+            sent += self.deliver(claimed)
+
+    def deliver(self, notification_ids: [int]) -> int:
+        config = current_app.config
+        rows = db.session.execute(select(Notification, User).join(User, User.id == Notification.recipient_id)
+                                  .where(Notification.id.in_(notification_ids))
+                                  .order_by(Notification.recipient_id, Notification.id)).all()
+        # Built before sending, as each commit below expires the loaded rows
+        digests = []
+        for recipient, recipient_rows in groupby(rows, key=lambda row: row.User):
+            notifications = [row.Notification for row in recipient_rows]
+            digests.append((recipient.email, digest_message(config['MAIL_SENDER'], recipient, notifications),
+                            [notification.id for notification in notifications]))
+        sent = 0
+        with smtplib.SMTP(config['MAIL_SERVER'], config['MAIL_PORT'], timeout=config['MAIL_TIMEOUT']) as smtp:
+            if config['MAIL_USE_TLS']:
+                smtp.starttls()
+            if config['MAIL_USERNAME']:
+                smtp.login(config['MAIL_USERNAME'], config['MAIL_PASSWORD'])
+            for email, message, digest_ids in digests:
+                try:
+                    smtp.send_message(message)
+                except smtplib.SMTPException as e:
+                    # Left claimed, so it is tried again once the claim lapses, and the other digests are still sent
+                    current_app.logger.warning('Notification digest for %s not sent: %s', email, e)
+                    continue
+                db.session.execute(update(Notification).where(Notification.id.in_(digest_ids))
+                                   .values(sent_at=datetime.now()).execution_options(synchronize_session=False))
+                db.session.commit()
+                sent += 1
+        return sent
+
+
+@click.command('send-notifications')
+@with_appcontext
+def send_notifications_command():
+    """Send every pending notification now, as one digest per recipient."""
+    sent = current_app.extensions['notification_outbox'].drain()
+    click.echo(f'Sent {sent} notification digest(s).')
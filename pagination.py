@@ -0,0 +1,73 @@
+import base64
+import binascii
+import json
+
+from flask import abort
+from sqlalchemy import tuple_
+
+
+class KeysetPage:
+    def __init__(self, items: list, next_cursor: str = None, prev_cursor: str = None):
+        self.items = items
+        self.next_cursor = next_cursor  # Pass as `after` for the following page, None on the last page
+        self.prev_cursor = prev_cursor  # Pass as `before` for the preceding page, None on the first page
+
+    def __iter__(self):
+        return iter(self.items)
+
+    def __len__(self):
+        return len(self.items)
+
+
+def encode_cursor(values: list) -> str:
+    return base64.urlsafe_b64encode(json.dumps(values, separators=(',', ':')).encode()).decode().rstrip('=')
+
+
+def cursor_value_valid(key, value) -> bool:
+    # Whether a value read from a cursor has the type of the column it is compared with
+    if value is None or isinstance(value, bool):
+        return False
+    try:
+        expected = key.type.python_type
+    except NotImplementedError:
+        return isinstance(value, (str, int, float))
+    return isinstance(value, (int, float) if expected is float else expected)
+
+
+def decode_cursor(cursor: str, keys: tuple) -> list:
+    # Returns the key values held by the cursor, or None if there is none. A cursor that is malformed or whose values
+    # do not match the key columns, which no page link produces, is refused with a 400 before it reaches the query.
+    if not cursor:
+        return None
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+    except (binascii.Error, ValueError):
+        values = None
+    if not (isinstance(values, list) and len(values) == len(keys)
+            and all(cursor_value_valid(key, value) for key, value in zip(keys, values))):
+        abort(400, 'Invalid page cursor.')
+    return values
+
+
+def keyset_page(query, keys: tuple, per_page: int, after: str = None, before: str = None) -> KeysetPage:
+    # Seeks to the page after or before a cursor on the ascending, unique ordering given by keys (e.g. name, id), so
+    # each page costs the same however deep it is
+    after, before = decode_cursor(after, keys), decode_cursor(before, keys)
+    if before is not None:
+        rows = query.filter(tuple_(*keys) < tuple_(*before)).order_by(*[key.desc() for key in keys]) \
+            .limit(per_page + 1).all()
+        items = rows[:per_page][::-1]
+        has_prev, has_next = len(rows) > per_page, True
+    else:
+        if after is not None:
+            query = query.filter(tuple_(*keys) > tuple_(*after))
+        rows = query.order_by(*keys).limit(per_page + 1).all()
+        items = rows[:per_page]
+        has_prev, has_next = after is not None, len(rows) > per_page
+
+    def cursor(item) -> str:
+        return encode_cursor([getattr(item, key.key) for key in keys])
+
+    return KeysetPage(items,
+                      next_cursor=cursor(items[-1]) if items and has_next else None,
+                      prev_cursor=cursor(items[0]) if items and has_prev else None)
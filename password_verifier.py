@@ -0,0 +1,57 @@
+from concurrent.futures import ThreadPoolExecutor
+from functools import cached_property
+from threading import BoundedSemaphore
+
+from flask import Flask, current_app
+from werkzeug.security import check_password_hash, generate_password_hash
+
+from exceptions import VerifierBusyError
+
+
+class PasswordVerifier:
+    # Checks passwords on a bounded pool of threads (hashlib releases the GIL while hashing) so a rush of logins does
+    # not tie up every request thread. PASSWORD_VERIFY_WORKERS checks run at once and PASSWORD_VERIFY_QUEUE_DEPTH more
+    # may wait; beyond that VerifierBusyError is raised straight away. A hash made with parameters other than
+    # PASSWORD_HASH_METHOD is recomputed with them after a successful check.
+
+    def __init__(self, app: Flask = None):
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app: Flask):
+        workers = app.config.get('PASSWORD_VERIFY_WORKERS', 4)
+        queue_depth = app.config.get('PASSWORD_VERIFY_QUEUE_DEPTH', 16)
+        self.method = app.config.get('PASSWORD_HASH_METHOD', 'scrypt')
+        self.retry_after = app.config.get('PASSWORD_VERIFY_RETRY_AFTER', 5)
+        self.slots = BoundedSemaphore(workers + queue_depth)
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='password-verifier')
+        app.extensions['password_verifier'] = self
+
+    @cached_property
+    def hash_prefix(self) -> str:
+        # The method and cost parameters werkzeug writes ahead of the salt, e.g. 'scrypt:32768:8:1'
+        return self.hash('').split('$', 1)[0]
+
+    def hash(self, password: str) -> str:
+        return generate_password_hash(password, self.method)
+
+    def _check(self, password_hash: str, password: str) -> (bool, str):
+        if not check_password_hash(password_hash, password):
+            return False, None
+        if password_hash.split('$', 1)[0] == self.hash_prefix:
+            return True, None
+        return True, self.hash(password)
+
+    def verify(self, password_hash: str, password: str) -> (bool, str):
+        # Returns whether the password matches and, when the hash should be upgraded, its replacement
+        if not self.slots.acquire(blocking=False):
+            raise VerifierBusyError("Too many logins are being processed, please try again shortly.")
+        try:
+            return self.executor.submit(self._check, password_hash, password).result()
+        finally:
+            self.slots.release()
+
+
+def hash_password(password: str) -> str:
+    # Every new password is hashed here so it is made with PASSWORD_HASH_METHOD rather than werkzeug's default
+    return current_app.extensions['password_verifier'].hash(password)
@@ -0,0 +1,64 @@
+from sqlalchemy import delete, func, select, update
+
+from job_queue import JobContext, job_task
+from models.Project import Project, ProjectStatus
+from models.ProjectMark import ProjectMark
+from models.db import db
+
+# Projects that can be archived: those never submitted and those whose marks are confirmed
+ARCHIVABLE_STATUSES = (ProjectStatus.ACTIVE, ProjectStatus.MARKS_CONFIRMED)
+
+# Projects archived per transaction, which keeps each write lock on the database short
+ARCHIVE_CHUNK_SIZE = 500
+
+
+def count_archivable(statuses: [ProjectStatus] = ARCHIVABLE_STATUSES) -> int:
+    return db.session.scalar(select(func.count(Project.id)).where(Project.status.in_(statuses)))
+
+
+def archive_chunk(after_id: int, statuses: [ProjectStatus], chunk_size: int) -> (int, int):
+    # Archives the next chunk of eligible projects with an id above after_id and deletes their unfinalised marks, in
+    # one short transaction. The update checks the status again, so a project submitted since it was selected is left
+    # alone, and takes the archive time from the database as Project.archive does. Returns the last id examined, None
+    # once there are no more, and the number of projects archived.
+    project_ids = db.session.scalars(select(Project.id).where(Project.id > after_id, Project.status.in_(statuses))
+                                     .order_by(Project.id).limit(chunk_size)).all()
+    if not project_ids:
+        return None, 0
+    try:
+        archived = db.session.scalars(
+            update(Project).where(Project.id.in_(project_ids), Project.status.in_(statuses))
+            .values(archived_datetime=func.now()).returning(Project.id)
+            .execution_options(synchronize_session=False)).all()
+        if archived:
+            db.session.execute(delete(ProjectMark).where(ProjectMark.project_id.in_(archived),
+                                                         ProjectMark.finalised == False)
+                               .execution_options(synchronize_session=False))
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+    return project_ids[-1], len(archived)
+
+
+def archive_projects(statuses: [ProjectStatus] = ARCHIVABLE_STATUSES, chunk_size: int = ARCHIVE_CHUNK_SIZE,
+                     progress=None) -> int:
+    # Archives every project in the given statuses chunk by chunk, calling progress(archived so far) after each one,
+    # and returns the number archived. Archived projects no longer match the status filter, so an interrupted run is
+    # resumed by simply running it again.
+    archived = 0
+    after_id = 0
+    while True:
+        after_id, count = archive_chunk(after_id, statuses, chunk_size)
+        if after_id is None:
+            return archived
+        archived += count
+        if progress is not None:
+            progress(archived)
+
+
+@job_task('archive_projects')
+def archive_projects_job(job: JobContext, statuses: [str]) -> str:
+    statuses = [ProjectStatus[name] for name in statuses]
+    job.progress(0, count_archivable(statuses))
+    return f'{archive_projects(statuses, progress=job.progress)} project(s) archived.'
@@ -0,0 +1,66 @@
+from datetime import date
+
+from flask import Blueprint, render_template, redirect, url_for, flash, current_app, stream_with_context
+from flask_login import login_required, current_user
+from sqlalchemy import select
+from sqlalchemy.orm import joinedload
+
+from instrumentation import worst_endpoints
+from marks_export import export_csv
+from models.Job import Job
+from models.db import db
+
+admin_bp = Blueprint('admin', __name__)
+
+# Most recent jobs listed on the jobs page
+JOBS_SHOWN = 50
+
+
+@admin_bp.route('/sql_stats', methods=['GET'])
+@login_required
+def sql_stats():
+    if not current_user.is_admin:
+        flash('Only module leaders can view SQL statistics.', 'danger')
+        return redirect(url_for('user.home'))
+    enabled = 'sql_instrumentation' in current_app.extensions
+    return render_template('sql_stats.html', enabled=enabled, endpoints=worst_endpoints(current_app),
+                           identity_cache=current_app.extensions.get('identity_cache'),
+                           catalog_cache=current_app.extensions.get('catalog_cache'))
+
+
+@admin_bp.route('/marks.csv', methods=['GET'])
+@login_required
+def export_marks():
+    if not current_user.is_admin:
+        flash('Only module leaders can export marks.', 'danger')
+        return redirect(url_for('user.home'))
+    # Streamed as it is read, so the download starts at once and the file is never held in memory
+    response = current_app.response_class(stream_with_context(export_csv()), mimetype='text/csv')
+    response.headers['Content-Disposition'] = f'attachment; filename=marks-{date.today().isoformat()}.csv'
+    response.cache_control.private = True
+    response.cache_control.no_store = True
+    return response
+
+
+@admin_bp.route('/jobs', methods=['GET'])
+@login_required
+def jobs():
+    if not current_user.is_admin:
+        flash('Only module leaders can view background jobs.', 'danger')
+        return redirect(url_for('user.home'))
+    recent = db.session.scalars(select(Job).options(joinedload(Job.created_by))
+                                .order_by(Job.created_at.desc(), Job.id.desc()).limit(JOBS_SHOWN)).all()
+    return render_template('jobs.html', jobs=recent, active=any(not job.is_finished for job in recent))
+
+
+@admin_bp.route('/jobs/<int:job_id>/cancel', methods=['POST'])
+@login_required
+def cancel_job(job_id):
+    if not current_user.is_admin:
+        flash('Only module leaders can cancel background jobs.', 'danger')
+        return redirect(url_for('user.home'))
+    if current_app.extensions['job_queue'].cancel(job_id):
+        flash(f'Job #{job_id} cancelled.', 'success')
+    else:
+        flash(f'Job #{job_id} has already finished.', 'warning')
+    return redirect(url_for('admin.jobs'))
@@ -0,0 +1,241 @@
+from datetime import datetime
+from enum import Enum
+
+import click
+from flask import Blueprint, jsonify, request, current_app, abort
+from flask_login import login_required, current_user
+from itsdangerous import BadSignature, URLSafeTimedSerializer
+from sqlalchemy import case, or_, select, true
+from werkzeug.exceptions import HTTPException
+
+from models import db, User, Proposal, Project, CatalogProposal, ProjectMark, MarkingRound, Meeting
+from models.Project import ProjectStatus
+from models.Proposal import ProposalStatus
+from pagination import keyset_page
+
+# Read-only JSON API for reporting scripts and dashboards, mounted at /api/v1. Each listing selects only the requested
+# fields as plain row tuples and is paged by id with the cursors of pagination.keyset_page.
+api_bp = Blueprint('api', __name__)
+
+API_TOKEN_SALT = 'api-token'
+
+
+def name_of(user_id_column):
+    # The user's name as a correlated subquery, so it is only looked up when the field is selected
+    return select(User.name).where(User.id == user_id_column).scalar_subquery()
+
+
+PROJECT_FIELDS = {
+    'id': Project.id,
+    'title': select(Proposal.title).where(Proposal.id == Project.proposal_id).scalar_subquery(),
+    'status': Project.status,
+    'student_id': Project.student_id,
+    'student': name_of(Project.student_id),
+    'supervisor_id': Project.supervisor_id,
+    'supervisor': name_of(Project.supervisor_id),
+    'second_marker_id': Project.second_marker_id,
+    'second_marker': name_of(Project.second_marker_id),
+    'submitted': Project.submitted_datetime,
+    'archived': Project.archived_datetime,
+    'final_mark': select(MarkingRound.resolved_mark).where(
+        MarkingRound.project_id == Project.id, MarkingRound.concordant == True
+    ).order_by(MarkingRound.round_number).limit(1).scalar_subquery(),
+}
+
+PROPOSAL_FIELDS = {
+    'id': Proposal.id,
+    'title': Proposal.title,
+    'description': Proposal.description,
+    'status': Proposal.status,
+    'catalog_proposal_id': Proposal.catalog_proposal_id,
+    'student_id': Proposal.student_id,
+    'student': name_of(Proposal.student_id),
+    'supervisor_id': Proposal.supervisor_id,
+    'supervisor': name_of(Proposal.supervisor_id),
+    'created': Proposal.created_date,
+    'accepted': Proposal.accepted_date,
+    'rejected': Proposal.rejected_date,
+}
+
+MEETING_FIELDS = {
+    'id': Meeting.id,
+    'project_id': Meeting.project_id,
+    'start': Meeting.meeting_start,
+    'end': Meeting.meeting_end,
+    'location': Meeting.location,
+    'attendance': Meeting.attendance,
+    'outcome_notes': Meeting.outcome_notes,
+}
+
+CATALOG_FIELDS = {
+    'id': CatalogProposal.id,
+    'title': CatalogProposal.title,
+    'description': CatalogProposal.description,
+    'supervisor_id': CatalogProposal.supervisor_id,
+    'supervisor': name_of(CatalogProposal.supervisor_id),
+}
+
+
+def mark_fields(revealed) -> dict:
+    # Marking is double-blind: a mark and its feedback are null unless the revealed condition holds for the row
+    return {
+        'id': ProjectMark.id,
+        'project_id': ProjectMark.project_id,
+        'marker_id': ProjectMark.marker_id,
+        'marker': name_of(ProjectMark.marker_id),
+        'round': select(MarkingRound.round_number).where(MarkingRound.id == ProjectMark.round_id).scalar_subquery(),
+        'mark': case((revealed, ProjectMark.mark), else_=None),
+        'feedback': case((revealed, ProjectMark.feedback), else_=None),
+        'finalised': ProjectMark.finalised,
+        'submitted': ProjectMark.submitted_at,
+    }
+
+
+def token_serializer() -> URLSafeTimedSerializer:
+    return URLSafeTimedSerializer(current_app.secret_key, salt=API_TOKEN_SALT)
+
+
+def issue_api_token(user_id: int) -> str:
+    return token_serializer().dumps(user_id)
+
+
+def api_token_user_id(req) -> int:
+    # The user id held by a valid "Authorization: Bearer <token>" header on an API request, otherwise None
+    if req.blueprint != api_bp.name:
+        return None
+    scheme, _, token = req.headers.get('Authorization', '').partition(' ')
+    if scheme.lower() != 'bearer' or not token:
+        return None
+    try:
+        user_id = token_serializer().loads(token.strip(), max_age=current_app.config['API_TOKEN_MAX_AGE'])
+    except BadSignature:
+        return None
+    return user_id if isinstance(user_id, int) else None
+
+
+def serialize(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    if isinstance(value, Enum):
+        return value.name
+    return value
+
+
+def selected_fields(available: dict) -> [str]:
+    # The fields named by ?fields=a,b (all by default); id is always included as it orders the pages
+    requested = request.args.get('fields')
+    if not requested:
+        return list(available)
+    names = [name.strip() for name in requested.split(',') if name.strip()]
+    unknown = [name for name in names if name not in available]
+    if unknown:
+        abort(400, f"Unknown field(s): {', '.join(unknown)}. Available: {', '.join(available)}.")
+    return ['id'] + [name for name in dict.fromkeys(names) if name != 'id']
+
+
+def page_size() -> int:
+    limit = request.args.get('limit', current_app.config['API_PAGE_SIZE'], type=int)
+    return min(max(1, limit), current_app.config['API_MAX_PAGE_SIZE'])
+
+
+def listing(available: dict, *criteria):
+    names = selected_fields(available)
+    query = db.session.query(*[available[name].label(name) for name in names]).filter(*criteria)
+    page = keyset_page(query, (available['id'],), page_size(), request.args.get('after'), request.args.get('before'))
+    return jsonify({
+        'fields': names,
+        'items': [{name: serialize(value) for name, value in zip(names, row)} for row in page],
+        'next_cursor': page.next_cursor,
+        'prev_cursor': page.prev_cursor,
+    })
+
+
+def status_filter(column, statuses):
+    status = request.args.get('status')
+    if status is None:
+        return true()
+    if status.upper() not in statuses.__members__:
+        abort(400, f"Unknown status: {status}. Available: {', '.join(statuses.__members__)}.")
+    return column == statuses[status.upper()]
+
+
+def visible_project(project_id: int) -> Project:
+    project = db.get_or_404(Project, project_id)
+    if not (current_user.is_admin or current_user.id in (project.student_id, project.supervisor_id,
+                                                         project.second_marker_id)):
+        abort(403, "You do not have access to this project.")
+    return project
+
+
+@api_bp.errorhandler(HTTPException)
+def json_error(error):
+    return jsonify({'error': error.name, 'message': error.description}), error.code
+
+
+@api_bp.route('/', methods=['GET'])
+@login_required
+def index():
+    return jsonify({'version': 1, 'resources': {
+        'projects': list(PROJECT_FIELDS),
+        'proposals': list(PROPOSAL_FIELDS),
+        'projects/<id>/meetings': list(MEETING_FIELDS),
+        'projects/<id>/marks': list(mark_fields(true())),
+        'catalog': list(CATALOG_FIELDS),
+    }})
+
+
+@api_bp.route('/projects', methods=['GET'])
+@login_required
+def projects():
+    # Admins see every project, everyone else the projects they study, supervise or mark
+    mine = true() if current_user.is_admin else or_(
+        Project.student_id == current_user.id, Project.supervisor_id == current_user.id,
+        Project.second_marker_id == current_user.id)
+    return listing(PROJECT_FIELDS, mine, status_filter(Project.status, ProjectStatus))
+
+
+@api_bp.route('/proposals', methods=['GET'])
+@login_required
+def proposals():
+    mine = true() if current_user.is_admin else or_(
+        Proposal.student_id == current_user.id, Proposal.supervisor_id == current_user.id)
+    return listing(PROPOSAL_FIELDS, mine, status_filter(Proposal.status, ProposalStatus))
+
+
+@api_bp.route('/projects/<int:project_id>/meetings', methods=['GET'])
+@login_required
+def meetings(project_id):
+    visible_project(project_id)
+    return listing(MEETING_FIELDS, Meeting.project_id == project_id)
+
+
+@api_bp.route('/projects/<int:project_id>/marks', methods=['GET'])
+@login_required
+def marks(project_id):
+    # As on the project page: markers see their own marks until the final mark is agreed, and admins who are not
+    # marking the project see them all
+    project = visible_project(project_id)
+    if project.final_mark is not None or (current_user.is_admin and current_user.id not in (
+            project.supervisor_id, project.second_marker_id)):
+        revealed = true()
+    else:
+        revealed = ProjectMark.marker_id == current_user.id
+    return listing(mark_fields(revealed), ProjectMark.project_id == project_id)
+
+
+@api_bp.route('/catalog', methods=['GET'])
+@login_required
+def catalog():
+    active_supervisors = select(User.id).where(User.is_supervisor == True, User.active == True)
+    return listing(CATALOG_FIELDS, CatalogProposal.active == True,
+                   CatalogProposal.supervisor_id.in_(active_supervisors))
+
+
+@api_bp.cli.command('token')
+@click.argument('user')
+def issue_token_command(user):
+    """Print an API token for USER (id or email), valid for API_TOKEN_MAX_AGE seconds."""
+    found = db.session.scalar(select(User).where(User.id == int(user) if user.isdigit() else User.email_matches(user)))
+    if found is None or not found.active:
+        raise click.ClickException(f'{user}: No active user found.')
+    click.echo(issue_api_token(found.id))
@@ -1,7 +1,8 @@
-from flask import Blueprint, request, redirect, url_for, render_template, flash
+from flask import Blueprint, request, redirect, url_for, render_template, flash, current_app
 from flask_login import login_user, logout_user, login_required
 
-from models import User, LoginUser
+from exceptions import VerifierBusyError
+from models import db, User, LoginUser
 
 auth_bp = Blueprint('auth', __name__)
 
@@ -9,8 +10,19 @@ auth_bp = Blueprint('auth', __name__)
 @auth_bp.route("/login", methods=["GET", "POST"])
 def login():
     if request.method == "POST":
-        user = User.query.filter_by(email=request.form["email"]).first()
-        if user and user.check_password(request.form["password"]):
+        user = User.find_by_email(request.form["email"])
+        verified = False
+        if user:
+            verifier = current_app.extensions["password_verifier"]
+            try:
+                verified, upgraded_hash = verifier.verify(user.password_hash, request.form["password"])
+            except VerifierBusyError as e:
+                flash(str(e), "warning")
+                return render_template("login.html"), 503, {"Retry-After": str(verifier.retry_after)}
+            if upgraded_hash:
+                user.password_hash = upgraded_hash
+                db.session.commit()
+        if verified:
             if user.active:
                 login_user(LoginUser(user))
                 return redirect(url_for("user.home"))
@@ -0,0 +1,154 @@
+import hashlib
+import hmac
+from datetime import timezone
+
+from flask import Blueprint, abort, current_app, flash, redirect, request, stream_with_context, url_for
+from flask_login import current_user, login_required
+from itsdangerous import BadSignature, URLSafeSerializer
+from sqlalchemy import func, or_, select, update
+from sqlalchemy.orm import aliased
+from werkzeug.http import is_resource_modified
+
+from models import db, User, Proposal, Project, Meeting
+from models.User import new_calendar_secret
+
+# iCalendar feeds of each user's meetings, mounted at /calendar. Calendar clients cannot log in, so a feed is found by a
+# signed token naming its user and their current feed secret, which they can replace to revoke a leaked link. Clients
+# poll every few minutes, so unchanged feeds are answered with a bare 304.
+calendar_bp = Blueprint('calendar', __name__)
+
+CALENDAR_TOKEN_SALT = 'calendar-feed'
+
+# Meetings fetched from the cursor at a time while a feed is streamed
+FEED_BATCH_SIZE = 500
+
+
+def token_serializer() -> URLSafeSerializer:
+    return URLSafeSerializer(current_app.secret_key, salt=CALENDAR_TOKEN_SALT)
+
+
+def calendar_feed_url(user_id: int) -> str:
+    secret = db.session.scalar(select(User.calendar_secret).where(User.id == user_id))
+    return url_for('calendar.feed', token=token_serializer().dumps([user_id, secret]), _external=True)
+
+
+def escape_text(value: str) -> str:
+    # TEXT values per RFC 5545 section 3.3.11
+    return (value.replace('\\', '\\\\').replace(';', '\\;').replace(',', '\\,')
+            .replace('\r\n', '\\n').replace('\n', '\\n'))
+
+
+def content_line(name: str, value: str) -> str:
+    # A content line folded into lines of at most 75 octets, each continuation starting with a space
+    line = f'{name}:{value}'.encode()
+    parts = []
+    while len(line) > 75:
+        cut = 75 if not parts else 74
+        while cut and (line[cut] & 0xC0) == 0x80:  # never split a UTF-8 sequence
+            cut -= 1
+        parts.append(line[:cut])
+        line = line[cut:]
+    parts.append(line)
+    return '\r\n '.join(part.decode() for part in parts) + '\r\n'
+
+
+def local_time(value) -> str:
+    # Meeting times are stored as naive local times, so they are written as floating times
+    return value.strftime('%Y%m%dT%H%M%S')
+
+
+def utc_time(value) -> str:
+    return value.astimezone(timezone.utc).strftime('%Y%m%dT%H%M%SZ')
+
+
+def feed_meetings(user_id: int):
+    # Every meeting of the projects the user supervises or carries out, with the project details shown in its event
+    student, supervisor = aliased(User), aliased(User)
+    return (select(Meeting.id, Meeting.project_id, Project.supervisor_id, Meeting.meeting_start, Meeting.meeting_end,
+                   Meeting.location,
+                   func.coalesce(Meeting.updated_at, Meeting.created_at).label('changed'), Proposal.title,
+                   student.name.label('student'), supervisor.name.label('supervisor'))
+            .join(Project, Project.id == Meeting.project_id)
+            .join(Proposal, Proposal.id == Project.proposal_id)
+            .join(student, student.id == Project.student_id)
+            .join(supervisor, supervisor.id == Project.supervisor_id)
+            .where(or_(Project.supervisor_id == user_id, Project.student_id == user_id)))
+
+
+def feed_version(user_id: int) -> (str, int, object):
+    # The user's feed secret, the number of their meetings and when their feed last changed: the latest change to one
+    # of its meetings, or to what those cannot show (deletions and renames, recorded on the user). The count and time
+    # change whenever the feed would.
+    changed = func.coalesce(Meeting.updated_at, Meeting.created_at)
+    meetings = select(Meeting.id).join(Project, Project.id == Meeting.project_id) \
+        .where(or_(Project.supervisor_id == user_id, Project.student_id == user_id)).subquery()
+    row = db.session.execute(
+        select(User.calendar_secret, User.calendar_changed_at,
+               select(func.count()).select_from(meetings).scalar_subquery(),
+               select(func.max(changed)).where(Meeting.id.in_(select(meetings.c.id))).scalar_subquery())
+        .where(User.id == user_id)).one()
+    secret, recorded, count, latest = row
+    return secret, count, max(filter(None, (recorded, latest)), default=None)
+
+
+def feed_lines(user_id: int, name: str):
+    yield ('BEGIN:VCALENDAR\r\nVERSION:2.0\r\nPRODID:-//ECMM427//Dissertation Meetings//EN\r\n'
+           'CALSCALE:GREGORIAN\r\nMETHOD:PUBLISH\r\n')
+    yield content_line('X-WR-CALNAME', escape_text(f'Project meetings of {name}'))
+    host = request.host.split(':')[0]
+    rows = db.session.execute(feed_meetings(user_id).order_by(Meeting.meeting_start, Meeting.id)
+                              .execution_options(yield_per=FEED_BATCH_SIZE))
+    for row in rows:
+        other = row.student if row.supervisor_id == user_id else row.supervisor
+        event = ['BEGIN:VEVENT\r\n', content_line('UID', f'meeting-{row.id}@{host}'),
+                 content_line('DTSTAMP', utc_time(row.changed)),
+                 content_line('LAST-MODIFIED', utc_time(row.changed)),
+                 content_line('DTSTART', local_time(row.meeting_start))]
+        if row.meeting_end:
+            event.append(content_line('DTEND', local_time(row.meeting_end)))
+        event.append(content_line('SUMMARY', escape_text(f'{row.title} meeting with {other}')))
+        if row.location:
+            event.append(content_line('LOCATION', escape_text(row.location)))
+        event.append(content_line('URL', url_for('project.view_project', project_id=row.project_id,
+                                                 _external=True)))
+        event.append('END:VEVENT\r\n')
+        yield ''.join(event)
+    yield 'END:VCALENDAR\r\n'
+
+
+@calendar_bp.route('/<token>.ics', methods=['GET'])
+def feed(token):
+    try:
+        user_id, secret = token_serializer().loads(token)
+    except (BadSignature, TypeError, ValueError):
+        abort(404)
+    identity = current_app.extensions['identity_cache'].get(user_id, User.load_identity) \
+        if isinstance(user_id, int) and isinstance(secret, str) else None
+    if not (identity and identity['active']):
+        abort(404)
+    current_secret, count, changed = feed_version(user_id)
+    if current_secret is None or not hmac.compare_digest(secret, current_secret):
+        abort(404)
+    response = current_app.response_class(mimetype='text/calendar')
+    response.set_etag(hashlib.sha1(f'{user_id}:{count}:{changed}'.encode()).hexdigest())
+    if changed is not None:
+        response.last_modified = changed.replace(microsecond=0).astimezone(timezone.utc)
+    response.cache_control.private = True
+    response.cache_control.no_cache = True
+    # The meetings are only queried, and streamed row by row, when the client's copy is out of date
+    if not is_resource_modified(request.environ, response.get_etag()[0], last_modified=response.last_modified):
+        response.status_code = 304
+        return response
+    response.response = stream_with_context(feed_lines(user_id, identity['name']))
+    return response
+
+
+@calendar_bp.route('/reset', methods=['POST'])
+@login_required
+def reset_feed():
+    # Replaces the user's feed secret, so every link to their feed handed out so far stops working
+    db.session.execute(update(User).where(User.id == current_user.id).values(calendar_secret=new_calendar_secret()))
+    db.session.commit()
+    flash('Your calendar feed link has been reset. Subscribe again with the new link.', 'success')
+    project_id = request.form.get('project_id', type=int)
+    return redirect(url_for('project.view_project', project_id=project_id) if project_id else url_for('user.home'))
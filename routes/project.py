@@ -1,19 +1,30 @@
 from datetime import datetime
 
-from flask import Blueprint, render_template, request, redirect, url_for, flash
+import click
+from flask import Blueprint, render_template, request, redirect, url_for, flash, current_app
 from flask_login import login_required, current_user
+from itsdangerous import BadSignature, URLSafeTimedSerializer
+from sqlalchemy import delete
 from sqlalchemy.exc import IntegrityError
 
-from exceptions import NoConcordantProjectMarks
+from marker_allocation import allocate_second_markers
 from models import User
+from models.MarkingRound import MarkingRound
 from models.Project import Project, ProjectStatus
 from models.Meeting import Meeting
+from models.MeetingSeries import MeetingSeries, SERIES_INTERVALS
 from models.ProjectMark import ProjectMark
 
 from models.db import db
+from notifications import notify
+from project_archive import ARCHIVABLE_STATUSES, ARCHIVE_CHUNK_SIZE, archive_projects, count_archivable
+from routes.calendar import calendar_feed_url
 
 project_bp = Blueprint('project', __name__)
 
+ALLOCATION_PLAN_SALT = 'allocate-markers'
+ALLOCATION_PLAN_MAX_AGE = 60 * 60  # seconds a previewed allocation can be confirmed for
+
 
 @project_bp.route('/project/<int:project_id>', methods=['GET'])
 @login_required
@@ -21,23 +32,36 @@ def view_project(project_id):
     project = Project.query.get_or_404(project_id)
     meetings = Meeting.query.filter_by(project_id=project_id).order_by(Meeting.meeting_start).all()
     marks = ProjectMark.query.filter_by(project_id=project_id).all()
-    try:
-        _ = project.get_final_mark()
-        final_mark_is_ready = True
-    except NoConcordantProjectMarks:
-        final_mark_is_ready = False
+    status = project.status
+    final_mark = project.final_mark
+    final_mark_is_ready = final_mark is not None
     user_role = 'student' if current_user.id == project.student_id else (
         'supervisor' if current_user.id == project.supervisor_id else (
             'second_marker' if current_user.id == project.second_marker_id else (
                 'admin' if current_user.is_admin else 'other')))
     can_create_meeting = user_role == 'supervisor'
-    can_mark = user_role in ['supervisor', 'second_marker'] and project.status in [ProjectStatus.SUBMITTED,
-                                                                                   ProjectStatus.MARKING]
-    can_submit = user_role == 'student' and project.status == ProjectStatus.ACTIVE
+    can_mark = user_role in ['supervisor', 'second_marker'] and status in [ProjectStatus.SUBMITTED,
+                                                                           ProjectStatus.MARKING]
+    can_submit = user_role == 'student' and status == ProjectStatus.ACTIVE
     supervisors = User.query.filter_by(is_supervisor=True, active=True).all()
+    # The student and supervisor can subscribe to all of their meetings from the project page
+    calendar_url = calendar_feed_url(current_user.id) if user_role in ('student', 'supervisor') else None
     return render_template('project.html', project=project, meetings=meetings, marks=marks, user_role=user_role,
                            can_create_meeting=can_create_meeting, can_mark=can_mark, can_submit=can_submit,
-                           final_mark_is_ready=final_mark_is_ready, supervisors=supervisors)
+                           final_mark_is_ready=final_mark_is_ready, final_mark=final_mark, supervisors=supervisors,
+                           calendar_url=calendar_url)
+
+
+def create_meeting_series(project_id: int, start: datetime, end: datetime, location: str, repeat: str):
+    # Creates the meetings repeating from the first one as set out by the form, flashing the outcome
+    try:
+        series = MeetingSeries.create(project_id, start, end, location, SERIES_INTERVALS.get(repeat),
+                                      request.form.get('occurrences', 0, type=int),
+                                      MeetingSeries.parse_skip_dates(request.form.get('skip_dates')))
+    except ValueError as e:
+        flash(f'Meeting series not created: {e}', 'danger')
+        return
+    flash(f'{len(series.meetings)} {repeat} meetings created.', 'success')
 
 
 @project_bp.route('/project/<int:project_id>/create_meeting', methods=['POST'])
@@ -66,6 +90,10 @@ def create_meeting(project_id):
     if not location:
         flash('Meeting location is required.', 'danger')
         return redirect(url_for('project.view_project', project_id=project_id))
+    repeat = request.form.get('repeat', 'none')
+    if repeat != 'none':
+        create_meeting_series(project_id, meeting_start, meeting_end, location, repeat)
+        return redirect(url_for('project.view_project', project_id=project_id))
     meeting = Meeting(
         project_id=project_id,
         meeting_start=meeting_start,
@@ -78,6 +106,11 @@ def create_meeting(project_id):
     return redirect(url_for('project.view_project', project_id=project_id))
 
 
+def applies_to_rest_of_series(meeting: Meeting) -> bool:
+    # Whether the submitted form covers the meeting and every later occurrence of its series
+    return meeting.series_id is not None and request.form.get('scope') == 'following'
+
+
 @project_bp.route('/meeting/<int:meeting_id>/edit', methods=['POST'])
 @login_required
 def edit_meeting(meeting_id):
@@ -88,6 +121,11 @@ def edit_meeting(meeting_id):
         flash('Not authorized.', 'danger')
         return redirect(url_for('project.view_project', project_id=meeting.project_id))
 
+    # Times moved on one occurrence move every later occurrence by the same amount when the rest of the series is
+    # edited; attendance and notes always belong to the one meeting
+    later = meeting.series.meetings_after(meeting) if applies_to_rest_of_series(meeting) else []
+    old_start, old_end = meeting.meeting_start, meeting.meeting_end
+
     meeting_start = request.form.get('meeting_start')
     if meeting_start:
         try:
@@ -104,11 +142,13 @@ def edit_meeting(meeting_id):
             flash(f'Invalid meeting end time format: {e}', 'danger')
             return redirect(url_for('project.view_project', project_id=meeting.project_id))
 
+    MeetingSeries.shift_later(later, meeting, old_start, old_end)
+
     meeting.attendance = bool(int(request.form.get('attendance', 0)))
     meeting.outcome_notes = request.form.get('outcome_notes')
     try:
         db.session.commit()
-        flash('Meeting updated.', 'success')
+        flash(f'{len(later) + 1} meetings updated.' if later else 'Meeting updated.', 'success')
     except IntegrityError as e:
         db.session.rollback()
         flash(f"Integrity error. Meeting end time can not be before start time. {e}", "warning")
@@ -124,9 +164,13 @@ def delete_meeting(meeting_id):
     if current_user.id not in [project.supervisor_id] and not current_user.is_admin:
         flash('Not authorized.', 'danger')
         return redirect(url_for('project.view_project', project_id=meeting.project_id))
+    deleted = 1
+    if applies_to_rest_of_series(meeting):
+        deleted += db.session.execute(delete(Meeting).where(
+            Meeting.series_id == meeting.series_id, Meeting.meeting_start > meeting.meeting_start)).rowcount
     db.session.delete(meeting)
     db.session.commit()
-    flash('Meeting deleted.', 'success')
+    flash(f'{deleted} meetings deleted.' if deleted > 1 else 'Meeting deleted.', 'success')
     return redirect(url_for('project.view_project', project_id=meeting.project_id))
 
 
@@ -151,24 +195,23 @@ def submit_mark(mark_id):
     db.session.flush()
     flash('Mark submitted.', 'success')
 
-    # Post-update check for non-concordant marks
-    try:
-        project.get_final_mark()
-    except NoConcordantProjectMarks:
-        # Find the last non-concordant pair
-        finalised_marks = [m for m in project.marks if m.finalised]
-        if len(finalised_marks) >= 2 and len(finalised_marks) % 2 == 0:
-            # Sort by id to get the most recent pair
-            marks_sorted = sorted(finalised_marks, key=lambda m: m.id)
-            m1, m2 = marks_sorted[-2], marks_sorted[-1]
-            # Only create new marks if not already present for these markers
-            for marker in [m1.marker_id, m2.marker_id]:
-                exists = ProjectMark.query.filter_by(project_id=project.id, marker_id=marker, finalised=False).first()
-                if not exists:
-                    new_mark = ProjectMark(project_id=project.id, marker_id=marker)
-                    db.session.add(new_mark)
-            db.session.commit()
-            flash('Non-concordant marks detected. New marking round started for the two markers.', 'warning')
+    # Post-update check for non-concordant marks: the submitted mark may have closed its marking round
+    marking_round = mark.round
+    if marking_round and not marking_round.is_open and not marking_round.concordant:
+        next_round = MarkingRound(project_id=project.id, round_number=marking_round.round_number + 1)
+        db.session.add(next_round)
+        # Only create new marks if not already present for these markers
+        pending_markers = {marker_id for (marker_id,) in db.session.query(ProjectMark.marker_id).filter_by(
+            project_id=project.id, finalised=False)}
+        for marker in [m.marker_id for m in marking_round.marks]:
+            if marker not in pending_markers:
+                db.session.add(ProjectMark(project_id=project.id, marker_id=marker, round=next_round))
+        for marker in {m.marker_id for m in marking_round.marks}:
+            notify(marker, f'Marks not concordant: {project.proposal.title}',
+                   f'The marks for round {marking_round.round_number} differ by more than 5. '
+                   f'Round {next_round.round_number} has been opened for both markers.')
+        db.session.commit()
+        flash('Non-concordant marks detected. New marking round started for the two markers.', 'warning')
 
     return redirect(url_for('project.view_project', project_id=project.id))
 
@@ -208,6 +251,9 @@ def add_marker(project_id):
     if int(add_marker_id) == project.supervisor_id:
         flash('Supervisor cannot be assigned as second marker.', 'danger')
         return redirect(url_for('project.view_project', project_id=project_id))
+    if project.second_marker_id != int(add_marker_id):
+        notify(int(add_marker_id), f'Second marker: {project.proposal.title}',
+               f'You have been assigned as second marker for {project.student.name}\'s project.')
     project.second_marker_id = int(add_marker_id)
     # Create ProjectMark for second marker if not already present
     from models.ProjectMark import ProjectMark
@@ -250,3 +296,85 @@ def archive_project(project_id):
     project.archive()
     flash('Project archived successfully.', 'success')
     return redirect(url_for('user.home'))
+
+
+def selected_statuses(values: [str]) -> [ProjectStatus]:
+    # The archivable statuses named in a form or on the command line
+    return [status for status in ARCHIVABLE_STATUSES if status.name in values]
+
+
+@project_bp.route('/bulk_archive', methods=['GET', 'POST'])
+@login_required
+def bulk_archive():
+    if not current_user.is_admin:
+        flash('Only admins can archive projects.', 'danger')
+        return redirect(url_for('user.home'))
+    if request.method == 'GET':
+        counts = {status: count_archivable([status]) for status in ARCHIVABLE_STATUSES}
+        return render_template('bulk_archive.html', counts=counts)
+    statuses = selected_statuses(request.form.getlist('status'))
+    if not statuses:
+        flash('Select the projects to archive.', 'warning')
+        return redirect(url_for('project.bulk_archive'))
+    # Run as a background job, as archiving a whole cohort takes longer than a request should
+    job = current_app.extensions['job_queue'].submit('archive_projects', created_by_id=current_user.id,
+                                                     statuses=[status.name for status in statuses])
+    flash(f'Archiving queued as job #{job.id}.', 'success')
+    return redirect(url_for('admin.jobs'))
+
+
+def allocation_serializer() -> URLSafeTimedSerializer:
+    return URLSafeTimedSerializer(current_app.secret_key, salt=ALLOCATION_PLAN_SALT)
+
+
+@project_bp.route('/allocate_markers', methods=['GET', 'POST'])
+@login_required
+def allocate_markers():
+    if not current_user.is_admin:
+        flash('Only admins can allocate second markers.', 'danger')
+        return redirect(url_for('user.home'))
+    if request.method == 'GET':
+        # Preview only: nothing is written until the allocation is confirmed. The previewed assignments are signed into
+        # the form so that confirming applies exactly them rather than a plan made afresh.
+        plan = allocate_second_markers(dry_run=True)
+        token = allocation_serializer().dumps([[project_id, marker_id]
+                                               for project_id, _, _, marker_id in plan.assignments])
+        return render_template('allocate_markers.html', plan=plan, token=token)
+    try:
+        assignments = allocation_serializer().loads(request.form.get('plan', ''), max_age=ALLOCATION_PLAN_MAX_AGE)
+    except BadSignature:
+        flash('The allocation preview has expired, please review it again.', 'warning')
+        return redirect(url_for('project.allocate_markers'))
+    job = current_app.extensions['job_queue'].submit('allocate_second_markers', created_by_id=current_user.id,
+                                                     assignments=assignments)
+    flash(f'Allocation queued as job #{job.id}.', 'success')
+    return redirect(url_for('admin.jobs'))
+
+
+@project_bp.cli.command('allocate-markers')
+@click.option('--dry-run', is_flag=True, help='Show the allocation without saving it.')
+def allocate_markers_command(dry_run):
+    """Assign second markers to every submitted project without one, balancing marking load."""
+    plan = allocate_second_markers(dry_run=dry_run)
+    for project_id, title, _, marker_id in plan.assignments:
+        click.echo(f'{project_id}: {title} -> {plan.loads[marker_id][0]}')
+    for project_id, title in plan.unassigned:
+        click.echo(f'{project_id}: {title} has no eligible second marker.', err=True)
+    click.echo(f'{"Would allocate" if dry_run else "Allocated"} {len(plan) if dry_run else len(plan.allocated)} '
+               f'second marker(s), '
+               f'{len(plan.unassigned)} project(s) left unassigned.')
+
+
+@project_bp.cli.command('archive')
+@click.option('--status', 'statuses', multiple=True, type=click.Choice([s.name for s in ARCHIVABLE_STATUSES]),
+              help='Only archive projects in this status (repeatable). Defaults to every archivable status.')
+@click.option('--chunk-size', default=ARCHIVE_CHUNK_SIZE, show_default=True, help='Projects archived per transaction.')
+@click.option('--dry-run', is_flag=True, help='Count the projects that would be archived without archiving them.')
+def archive_command(statuses, chunk_size, dry_run):
+    """Archive every active and marks-confirmed project in short chunks. Safe to re-run after an interruption."""
+    statuses = selected_statuses(statuses) or ARCHIVABLE_STATUSES
+    if dry_run:
+        click.echo(f'Would archive {count_archivable(statuses)} project(s).')
+        return
+    archived = archive_projects(statuses, chunk_size, progress=lambda count: click.echo(f'{count} archived...'))
+    click.echo(f'Archived {archived} project(s).')
@@ -1,6 +1,11 @@
-from flask import Blueprint, redirect, url_for, request, flash, abort, render_template
+from flask import Blueprint, redirect, url_for, request, flash, abort, render_template, jsonify, current_app, \
+    make_response
 from flask_login import login_required, current_user
 from datetime import datetime
+from markupsafe import Markup
+
+from catalog_cache import invalidate_catalog
+from notifications import notify
 
 from models.Proposal import ProposalStatus
 from models import db, User, Project, Proposal, CatalogProposal, ProjectMark
@@ -45,6 +50,8 @@ def submit_proposal():
             supervisor_id=supervisor.id
         )
         db.session.add(proposal)
+        notify(supervisor.id, f'New proposal: {proposal.title}',
+               f'{user.name} has submitted a proposal for you to review.')
         db.session.commit()
         flash("Proposal submitted successfully.", "success")
     except Exception as e:
@@ -76,10 +83,14 @@ def proposal_action(proposal_id):
 
         # Create ProjectMark for supervisor
         db.session.add(ProjectMark(project_id=project.id, marker_id=project.supervisor_id))
+        notify(proposal.student_id, f'Proposal accepted: {proposal.title}',
+               f'{current_user.name} has accepted your proposal and your project has been created.')
 
         flash("Proposal accepted and project created.", "success")
     elif action == "reject":
         proposal.rejected_date = datetime.now()
+        notify(proposal.student_id, f'Proposal rejected: {proposal.title}',
+               f'{current_user.name} has rejected your proposal.')
         flash("Proposal rejected.", "success")
     else:
         flash("Invalid action.", "error")
@@ -111,9 +122,42 @@ def withdraw_proposal(proposal_id):
 @proposal_bp.route('/catalog', methods=['GET'])
 @login_required
 def view_catalog():
-    catalog = CatalogProposal.query.join(User).filter(User.is_supervisor == True, CatalogProposal.active == True,
-                                                      User.active == True).all()
-    return render_template("catalog.html", catalog=catalog, supervisors=User.get_active_supervisors())
+    query = request.args.get('q', '').strip()
+    page = max(1, request.args.get('page', 1, type=int))
+    per_page = current_app.config['CATALOG_PAGE_SIZE']
+    # Everything the catalog content varies by for this user: admins may withdraw any entry, supervisors their own,
+    # and students get the proposal form
+    viewer = (current_user.is_admin, current_user.id if current_user.is_supervisor else None, current_user.is_student)
+
+    def render():
+        catalog, has_next = CatalogProposal.search(query, page, per_page)
+        return render_template("catalog_content.html", catalog=catalog, query=query, page=page, has_next=has_next,
+                               supervisors=User.get_active_supervisors() if current_user.is_student else [])
+
+    content = current_app.extensions['catalog_cache'].get((viewer, query, page, per_page), render)
+    response = make_response(render_template("catalog.html", content=Markup(content)))
+    # The page names the user, so browsers may keep it but must revalidate it, which costs a 304 when unchanged
+    response.cache_control.private = True
+    response.cache_control.no_cache = True
+    response.add_etag()
+    return response.make_conditional(request)
+
+
+@proposal_bp.route('/catalog/search', methods=['GET'])
+@login_required
+def search_catalog():
+    query = request.args.get('q', '').strip()
+    page = max(1, request.args.get('page', 1, type=int))
+    per_page = current_app.config['CATALOG_PAGE_SIZE']
+    results, has_next = CatalogProposal.search(query, page, per_page)
+    return jsonify({
+        'query': query,
+        'page': page,
+        'per_page': per_page,
+        'has_next': has_next,
+        'results': [{'id': row.id, 'title': row.title, 'description': row.description,
+                     'supervisor_id': row.supervisor_id, 'supervisor': row.supervisor_name} for row in results]
+    })
 
 
 @proposal_bp.route('/create_catalog_proposal', methods=['POST'])
@@ -137,6 +181,7 @@ def create_catalog_proposal():
         )
         db.session.add(catalog_proposal)
         db.session.commit()
+        invalidate_catalog()
         flash('Catalog proposal created successfully.', 'success')
     except Exception as e:
         db.session.rollback()
@@ -157,6 +202,7 @@ def deactivate_catalog_proposal(proposal_id):
     proposal.active = False
     try:
         db.session.commit()
+        invalidate_catalog()
         flash('Catalog proposal deactivated.', 'success')
     except Exception as e:
         db.session.rollback()
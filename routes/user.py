@@ -1,26 +1,76 @@
-from flask import Blueprint, render_template, redirect, url_for, request, flash
+from concurrent.futures import ThreadPoolExecutor
+
+import click
+from flask import Blueprint, render_template, redirect, url_for, request, flash, current_app
 from flask_login import current_user, login_required
-from werkzeug.security import generate_password_hash
+from sqlalchemy import Row, func, literal, or_, union_all
+from sqlalchemy.orm import joinedload
 
-from models import db, User, Proposal, Project, CatalogProposal, ProjectMark
+from catalog_cache import invalidate_catalog
+from exceptions import VerifierBusyError
+from identity_cache import invalidate_identities
+from models import db, User, Proposal, Project, ProjectMark
 from models.Proposal import ProposalStatus
 from models.Project import ProjectStatus
+from pagination import keyset_page
+from password_verifier import hash_password
+from user_import import import_users, save_upload
 
 user_bp = Blueprint('user', __name__)
 
+# Relationships read by the dashboard templates for each listed project, loaded alongside the projects themselves so
+# the number of queries per page does not grow with the number of projects.
+DASHBOARD_PROJECT_LOADING = (joinedload(Project.student), joinedload(Project.proposal))
+
+
+# Filters and page sizes accepted by the module leader's student and supervisor lists
+LIST_STATUSES = ('active', 'inactive', 'all')
+SUPERVISOR_ROLES = ('all', 'admin', 'supervisor')
+ADMIN_LIST_MAX_PAGE_SIZE = 200
+
+
+def list_filter(name: str, choices: tuple) -> str:
+    value = request.args.get(name)
+    return value if value in choices else choices[0]
+
+
+def filter_status(query, status: str):
+    return query if status == 'all' else query.filter_by(active=status == 'active')
+
+
+def page_url(**changes) -> str:
+    # The current dashboard URL with some arguments replaced, keeping the other list's position and filters
+    args = {key: value for key, value in request.args.items() if key not in changes}
+    return url_for('user.home', **args, **{key: value for key, value in changes.items() if value is not None})
+
+
+def dashboard_rows(section: int):
+    # Projects for one section of the supervisor dashboard, with the proposal title and student name joined in. The ids
+    # are labelled so the sections' union can be ordered by them.
+    return db.select(literal(section).label('section'), Project.id.label('id'), Proposal.title, Proposal.description,
+                     User.name.label('student')).join(Proposal, Proposal.id == Project.proposal_id).join(
+        User, User.id == Project.student_id)
 
-def fao_supervisor(supervisor: User) -> ([Proposal], [Project], [Project]):
-    pending_proposals = [p for p in Proposal.query.filter_by(supervisor_id=supervisor.id).all() if
-                         p.status == ProposalStatus.PENDING]
-    projects = [p for p in Project.query.filter_by(supervisor_id=supervisor.id).all() if
-                p.status not in [ProjectStatus.MARKS_CONFIRMED, ProjectStatus.ARCHIVED]]
-    marking_projects = [pm.project for pm in
-                        ProjectMark.query.filter_by(marker_id=supervisor.id)
-                        .join(Project)
-                        .filter(Project.supervisor_id != supervisor.id)
-                        .group_by(ProjectMark.project_id).all() if
-                        pm.project.is_submitted and not pm.project.is_archived]
-    return pending_proposals, projects, marking_projects
+
+def fao_supervisor(supervisor: User) -> ([Row], [Row], [Row]):
+    # Pending proposals, supervised projects still in progress and other projects they are marking, fetched in one
+    # statement however many there are. Each row has the id, title, description and student name to display.
+    pending_proposals = db.select(literal(0).label('section'), Proposal.id.label('id'), Proposal.title,
+                                  Proposal.description, User.name.label('student')) \
+        .join(User, User.id == Proposal.student_id) \
+        .where(Proposal.supervisor_id == supervisor.id, Proposal.status == ProposalStatus.PENDING)
+    projects = dashboard_rows(1).where(
+        Project.supervisor_id == supervisor.id,
+        Project.status.not_in([ProjectStatus.MARKS_CONFIRMED, ProjectStatus.ARCHIVED]))
+    marking_projects = dashboard_rows(2).where(
+        Project.id.in_(db.select(ProjectMark.project_id).filter_by(marker_id=supervisor.id)),
+        Project.supervisor_id != supervisor.id,
+        Project.submitted_datetime.isnot(None),
+        Project.archived_datetime.is_(None))
+    sections = ([], [], [])
+    for row in db.session.execute(union_all(pending_proposals, projects, marking_projects).order_by('section', 'id')):
+        sections[row.section].append(row)
+    return sections
 
 
 @user_bp.route("/", methods=["GET", "POST"])
@@ -29,15 +79,37 @@ def home():
     user = current_user.obj
 
     if user.is_admin:
-        # Module leader view
-        students = User.query.filter_by(is_supervisor=False, is_admin=False, active=True).all()
-        supervisors = User.get_active_supervisors()
+        # Module leader view: one keyset page of each list, loaded with a fixed number of queries regardless of cohort
+        per_page = max(1, min(request.args.get('per_page', current_app.config['ADMIN_LIST_PAGE_SIZE'], type=int),
+                              ADMIN_LIST_MAX_PAGE_SIZE))
+        student_status = list_filter('student_status', LIST_STATUSES)
+        supervisor_status = list_filter('supervisor_status', LIST_STATUSES)
+        supervisor_role = list_filter('supervisor_role', SUPERVISOR_ROLES)
+        students = keyset_page(
+            filter_status(User.query.filter_by(is_supervisor=False, is_admin=False), student_status),
+            (User.name, User.id), per_page, request.args.get('students_after'), request.args.get('students_before'))
+        supervisors = filter_status(User.query.filter_by(is_supervisor=True), supervisor_status)
+        if supervisor_role != 'all':
+            supervisors = supervisors.filter_by(is_admin=supervisor_role == 'admin')
+        supervisors = keyset_page(supervisors, (User.name, User.id), per_page,
+                                  request.args.get('supervisors_after'), request.args.get('supervisors_before'))
+        student_projects, supervisor_projects = {}, {}
+        # Not archived is tested on the date column itself so the lookup can use its index
+        for p in Project.query.options(*DASHBOARD_PROJECT_LOADING).filter(
+                Project.archived_datetime.is_(None),
+                or_(Project.student_id.in_([s.id for s in students]),
+                    Project.supervisor_id.in_([s.id for s in supervisors]))).order_by(Project.id).all():
+            student_projects.setdefault(p.student_id, []).append(p)
+            supervisor_projects.setdefault(p.supervisor_id, []).append(p)
+        lists = dict(students=students, supervisors=supervisors, student_projects=student_projects,
+                     supervisor_projects=supervisor_projects, student_status=student_status,
+                     supervisor_status=supervisor_status, supervisor_role=supervisor_role, per_page=per_page,
+                     page_url=page_url)
         if user.is_supervisor:
             pending_proposals, projects, marking_projects = fao_supervisor(user)
-            return render_template("home_admin.html", students=students, supervisors=supervisors,
-                                   pending_proposals=pending_proposals, projects=projects,
-                                   marking_projects=marking_projects)
-        return render_template("home_admin.html", students=students, supervisors=supervisors)
+            return render_template("home_admin.html", pending_proposals=pending_proposals, projects=projects,
+                                   marking_projects=marking_projects, **lists)
+        return render_template("home_admin.html", **lists)
 
     elif user.is_supervisor:
         # Supervisor view
@@ -47,17 +119,16 @@ def home():
 
     else:
         # Student view
-        projects = [p for p in Project.query.filter_by(student_id=user.id).all() if p.status == ProjectStatus.ACTIVE]
-        old_projects = [p for p in Project.query.filter_by(student_id=user.id).all() if
-                        p.status != ProjectStatus.ACTIVE]
-        pending_proposals = [p for p in Proposal.query.filter_by(student_id=user.id).all() if
-                             p.status == ProposalStatus.PENDING]
-        rejected_proposals = [p for p in Proposal.query.filter_by(student_id=user.id).all() if
-                              p.status == ProposalStatus.REJECTED]
-        catalog = CatalogProposal.query.all()
+        projects = Project.query.filter_by(student_id=user.id).filter(Project.status == ProjectStatus.ACTIVE).all()
+        old_projects = Project.query.filter_by(student_id=user.id).filter(
+            Project.status != ProjectStatus.ACTIVE).all()
+        proposals = Proposal.query.options(joinedload(Proposal.supervisor)).filter_by(student_id=user.id).filter(
+            Proposal.status.in_([ProposalStatus.PENDING, ProposalStatus.REJECTED])).order_by(Proposal.id).all()
+        pending_proposals = [p for p in proposals if p.status == ProposalStatus.PENDING]
+        rejected_proposals = [p for p in proposals if p.status == ProposalStatus.REJECTED]
         supervisors = User.get_active_supervisors()
         has_project = len(projects) > 0
-        return render_template("home_student.html", has_project=has_project, catalog=catalog,
+        return render_template("home_student.html", has_project=has_project,
                                projects=projects, old_projects=old_projects, pending_proposals=pending_proposals,
                                rejected_proposals=rejected_proposals, supervisors=supervisors)
 
@@ -77,18 +148,23 @@ def create_user():
     if not (name and email and password and role):
         flash("Error: All fields are required.", "error")
         return redirect(url_for("user.home"))
+    if User.find_by_email(email):
+        flash(f"Error: {email.strip()} already exists.", "error")
+        return redirect(url_for("user.home"))
 
     try:
         user = User(
             name=name,
-            email=email,
-            password_hash=generate_password_hash(password),
+            email=email.strip(),
+            password_hash=hash_password(password),
             is_supervisor=(role == "supervisor"),
             is_admin=False,
             active=True
         )
         db.session.add(user)
         db.session.commit()
+        if user.is_supervisor:
+            invalidate_catalog()
         flash(f"{name} ({role}) created successfully.", "success")
     except Exception as e:
         db.session.rollback()
@@ -97,6 +173,43 @@ def create_user():
     return redirect(url_for("user.home"))
 
 
+@user_bp.route("/import_users", methods=["POST"])
+@login_required
+def import_users_csv():
+    if not (current_user.is_authenticated and current_user.is_admin):
+        flash("Only module leaders can import users.", "error")
+        return redirect(url_for("user.home"))
+
+    upload = request.files.get("file")
+    if not (upload and upload.filename):
+        flash("Error: A CSV file is required.", "error")
+        return redirect(url_for("user.home"))
+
+    # Run as a background job, as hashing the passwords of a whole cohort takes longer than a request should
+    job = current_app.extensions["job_queue"].submit("import_users", created_by_id=current_user.id,
+                                                     path=save_upload(upload.stream),
+                                                     batch_size=current_app.config["USER_IMPORT_BATCH_SIZE"])
+    flash(f"Import queued as job #{job.id}.", "success")
+    return redirect(url_for("admin.jobs"))
+
+
+@user_bp.cli.command('import')
+@click.argument('users_file', type=click.File(encoding='utf-8-sig'))
+@click.option('--batch-size', type=int, help='Rows validated and inserted per batch.')
+@click.option('--workers', type=int, help='Threads used to hash passwords, instead of USER_IMPORT_WORKERS.')
+def import_users_command(users_file, batch_size, workers):
+    """Import users from a CSV file with name, email, password and role columns."""
+    batch_size = batch_size or current_app.config['USER_IMPORT_BATCH_SIZE']
+    if workers:
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            report = import_users(users_file, batch_size=batch_size, executor=executor)
+    else:
+        report = import_users(users_file, batch_size=batch_size)
+    for message in report.messages():
+        click.echo(message, err=True)
+    click.echo(f'Imported {report.created} user(s), skipped {report.refused}.')
+
+
 @user_bp.route('/deactivate_user/<int:user_id>', methods=['POST'])
 @login_required
 def deactivate_user(user_id):
@@ -107,6 +220,9 @@ def deactivate_user(user_id):
     try:
         user.active = False
         db.session.commit()
+        invalidate_identities(user.id)
+        if user.is_supervisor:
+            invalidate_catalog()
         flash('User deactivated successfully.', 'success')
     except Exception as e:
         db.session.rollback()
@@ -114,6 +230,59 @@ def deactivate_user(user_id):
     return redirect(url_for('user.home'))
 
 
+@user_bp.route('/deactivate_users', methods=['POST'])
+@login_required
+def deactivate_users():
+    if not (current_user.is_authenticated and current_user.is_admin):
+        flash('Only module leaders can deactivate users.', 'danger')
+        return redirect(url_for('user.home'))
+    try:
+        user_ids = [int(user_id) for user_id in request.form.getlist('user_ids')]
+    except ValueError:
+        flash('Invalid user selection.', 'danger')
+        return redirect(url_for('user.home'))
+    if not user_ids:
+        flash('No users selected.', 'warning')
+        return redirect(url_for('user.home'))
+    try:
+        deactivated, refused = User.bulk_deactivate(user_ids)
+        invalidate_identities(*deactivated)
+        if deactivated:
+            invalidate_catalog()
+    except Exception as e:
+        db.session.rollback()
+        flash(f'Error deactivating users: {e}', 'danger')
+        return redirect(url_for('user.home'))
+    if deactivated:
+        flash(f'{len(deactivated)} user(s) deactivated successfully.', 'success')
+    if refused:
+        names = dict(db.session.execute(db.select(User.id, User.name).where(User.id.in_(refused.keys()))).all())
+        details = '; '.join(f'{names.get(user_id, user_id)}: {" ".join(reasons)}'
+                            for user_id, reasons in sorted(refused.items()))
+        flash(f'Could not deactivate {len(refused)} user(s). {details}', 'warning')
+    return redirect(url_for('user.home'))
+
+
+@user_bp.cli.command('deactivate')
+@click.argument('users', nargs=-1)
+@click.option('--file', 'users_file', type=click.File(), help='File with one user id or email per line.')
+def deactivate_users_command(users, users_file):
+    """Deactivate USERS (ids or emails) that have no pending or ongoing work."""
+    users = list(users) + ([line.strip() for line in users_file if line.strip()] if users_file else [])
+    user_ids = {int(user) for user in users if user.isdigit()}
+    emails = [user for user in users if not user.isdigit()]
+    found = dict(db.session.execute(db.select(func.lower(User.email), User.id)
+                                    .where(User.email_matches(*emails))).all())
+    for email in emails:
+        if email.strip().lower() not in found:
+            click.echo(f'{email}: User does not exist.', err=True)
+    user_ids.update(found.values())
+    deactivated, refused = User.bulk_deactivate(user_ids)
+    for user_id, reasons in sorted(refused.items()):
+        click.echo(f'{user_id}: {" ".join(reasons)}', err=True)
+    click.echo(f'Deactivated {len(deactivated)} user(s), refused {len(refused)}.')
+
+
 @user_bp.route('/change_admin/<int:user_id>/<admin>', methods=['POST'])
 @login_required
 def change_admin(user_id, admin):
@@ -128,6 +297,7 @@ def change_admin(user_id, admin):
     try:
         user.is_admin = admin_bool
         db.session.commit()
+        invalidate_identities(user.id)
         flash(f'User {"granted" if admin_bool else "removed"} admin privileges successfully.', 'success')
     except Exception as e:
         db.session.rollback()
@@ -143,7 +313,14 @@ def change_password():
     new_password = request.form.get("new_password")
     confirm_password = request.form.get("confirm_password")
 
-    if not user.check_password(current_password):
+    # Checked on the verifier's pool, like a login, so password changes cannot tie up the request threads either
+    verifier = current_app.extensions["password_verifier"]
+    try:
+        verified, _ = verifier.verify(user.password_hash, current_password or "")
+    except VerifierBusyError as e:
+        flash(str(e), "warning")
+        return home(), 503, {"Retry-After": str(verifier.retry_after)}
+    if not verified:
         flash("Current password is incorrect.", "error")
         return redirect(url_for("user.home"))
     if new_password != confirm_password:
@@ -155,5 +332,6 @@ def change_password():
 
     user.set_password(new_password)
     db.session.commit()
+    invalidate_identities(user.id)
     flash("Password changed successfully.", "success")
     return redirect(url_for("user.home"))
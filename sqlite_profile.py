@@ -0,0 +1,42 @@
+from flask import Flask
+from sqlalchemy import event
+
+from models.db import db
+
+# Named sets of PRAGMAs applied to every new SQLite connection, chosen with SQLITE_PROFILE
+SQLITE_PROFILES = {
+    'default': {},
+    'production': {
+        'busy_timeout': 5000,  # ms to wait for a lock before raising "database is locked"
+        'journal_mode': 'WAL',  # readers no longer block the writer, or the writer readers
+        'synchronous': 'NORMAL',  # safe with WAL; only the last commits can be lost on power failure
+        'mmap_size': 268435456,  # 256 MiB of the file read through memory mapping
+        'cache_size': -65536,  # 64 MiB page cache per connection (negative values are KiB)
+        'temp_store': 'MEMORY',
+    },
+}
+
+
+def sqlite_pragmas(app: Flask) -> {str: object}:
+    # The profile's PRAGMAs with any SQLITE_PRAGMAS overrides applied on top
+    profile = app.config.get('SQLITE_PROFILE') or 'default'
+    if profile not in SQLITE_PROFILES:
+        raise ValueError(f"Unknown SQLITE_PROFILE '{profile}', expected one of {', '.join(SQLITE_PROFILES)}.")
+    return {**SQLITE_PROFILES[profile], **app.config.get('SQLITE_PRAGMAS', {})}
+
+
+def apply_sqlite_profile(app: Flask):
+    pragmas = sqlite_pragmas(app)
+    with app.app_context():
+        engine = db.engine
+    if engine.dialect.name != 'sqlite' or not pragmas:
+        return
+
+    @event.listens_for(engine, 'connect')
+    def set_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        try:
+            for name, value in pragmas.items():
+                cursor.execute(f'PRAGMA {name}={value}')
+        finally:
+            cursor.close()
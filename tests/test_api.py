@@ -0,0 +1,180 @@
+import os
+import tempfile
+import unittest
+from datetime import datetime
+
+from flask import g, url_for
+from flask.testing import FlaskClient
+
+from models import User, Proposal, Project, ProjectMark, Meeting, CatalogProposal
+from models.db import db
+from pagination import encode_cursor
+from routes.api import issue_api_token
+
+from app import create_app
+
+
+class ReadOnlyApi(unittest.TestCase):
+    def setUp(self):
+        self.db_fd, self.db_path = tempfile.mkstemp()
+        self.flask_app = create_app({
+            'SQLALCHEMY_DATABASE_URI': f'sqlite:///{self.db_path}',
+            'TESTING': True,
+            'SECRET_KEY': 'test',
+            'SERVER_NAME': 'localhost'
+        })
+        self.app_context = self.flask_app.app_context()
+        self.app_context.push()
+        db.drop_all()
+        db.create_all()
+        self.student = User(email="student@example.com", name="Student", password_hash="x")
+        self.other_student = User(email="other@example.com", name="Other Student", password_hash="x")
+        self.supervisor = User(email="supervisor@example.com", name="Supervisor", password_hash="x",
+                               is_supervisor=True)
+        self.second_marker = User(email="marker@example.com", name="Marker", password_hash="x", is_supervisor=True)
+        self.admin = User(email="admin@example.com", name="Admin", password_hash="x", is_admin=True)
+        db.session.add_all([self.student, self.other_student, self.supervisor, self.second_marker, self.admin])
+        db.session.commit()
+        self.project = self.add_project(self.student, "Project One")
+        self.other_project = self.add_project(self.other_student, "Project Two")
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        db.engine.dispose()
+        self.app_context.pop()
+        os.close(self.db_fd)
+        os.unlink(self.db_path)
+
+    def add_project(self, student: User, title: str) -> Project:
+        proposal = Proposal(title=title, description="Description", student_id=student.id,
+                            supervisor_id=self.supervisor.id, accepted_date=datetime.now())
+        db.session.add(proposal)
+        db.session.flush()
+        project = Project(proposal_id=proposal.id, student_id=student.id, supervisor_id=self.supervisor.id,
+                          second_marker_id=self.second_marker.id)
+        db.session.add(project)
+        db.session.commit()
+        return project
+
+    def get(self, user: User, endpoint: str, **kwargs):
+        g.pop('_login_user', None)  # requests share the test's app context, so drop the user loaded by the last one
+        client = self.flask_app.test_client()
+        return client.get(url_for(endpoint, **kwargs), headers={'Authorization': f'Bearer {issue_api_token(user.id)}'})
+
+    def test_requires_authentication_without_redirecting(self):
+        response = self.flask_app.test_client().get(url_for('api.projects'))
+        self.assertEqual(response.status_code, 401)
+        self.assertEqual(response.json['error'], 'Unauthorized')
+        response = self.flask_app.test_client().get(url_for('api.projects'),
+                                                    headers={'Authorization': 'Bearer not-a-token'})
+        self.assertEqual(response.status_code, 401)
+
+    def test_accepts_session_login(self):
+        client: FlaskClient = self.flask_app.test_client()
+        with client.session_transaction() as session:
+            session['_user_id'] = self.student.id
+        response = client.get(url_for('api.projects'))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([item['title'] for item in response.json['items']], ["Project One"])
+
+    def test_token_does_not_authenticate_html_routes(self):
+        response = self.get(self.student, 'user.home')
+        self.assertEqual(response.status_code, 302)
+
+    def test_rejects_token_of_deactivated_user(self):
+        leaver = User(email="leaver@example.com", name="Leaver", password_hash="x")
+        db.session.add(leaver)
+        db.session.commit()
+        token = issue_api_token(leaver.id)
+        leaver.active = False
+        db.session.commit()
+        response = self.flask_app.test_client().get(url_for('api.projects'),
+                                                    headers={'Authorization': f'Bearer {token}'})
+        self.assertEqual(response.status_code, 401)
+
+    def test_lists_only_visible_projects(self):
+        student = self.get(self.student, 'api.projects').json['items']
+        self.assertEqual([(item['title'], item['student'], item['status']) for item in student],
+                         [("Project One", "Student", "ACTIVE")])
+        self.assertEqual(len(self.get(self.supervisor, 'api.projects').json['items']), 2)
+        self.assertEqual(len(self.get(self.admin, 'api.projects').json['items']), 2)
+        self.assertEqual(self.get(self.admin, 'api.projects', status='submitted').json['items'], [])
+        self.assertEqual(self.get(self.admin, 'api.projects', status='bogus').status_code, 400)
+
+    def test_selects_requested_fields(self):
+        response = self.get(self.student, 'api.projects', fields='title,supervisor')
+        self.assertEqual(response.json['items'], [{'id': self.project.id, 'title': "Project One",
+                                                   'supervisor': "Supervisor"}])
+        response = self.get(self.student, 'api.projects', fields='title,password_hash')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('password_hash', response.json['message'])
+
+    def test_pages_with_cursors(self):
+        for index in range(5):
+            db.session.add(Meeting(project_id=self.project.id, meeting_start=datetime(2025, 1, 1 + index, 10),
+                                   location=f"Room {index}"))
+        db.session.commit()
+        first = self.get(self.student, 'api.meetings', project_id=self.project.id, limit=2).json
+        self.assertEqual([item['location'] for item in first['items']], ["Room 0", "Room 1"])
+        self.assertEqual(first['items'][0]['start'], "2025-01-01T10:00:00")
+        self.assertIsNone(first['prev_cursor'])
+        second = self.get(self.student, 'api.meetings', project_id=self.project.id, limit=2,
+                          after=first['next_cursor']).json
+        self.assertEqual([item['location'] for item in second['items']], ["Room 2", "Room 3"])
+        back = self.get(self.student, 'api.meetings', project_id=self.project.id, limit=2,
+                        before=second['prev_cursor']).json
+        self.assertEqual(back['items'], first['items'])
+        response = self.get(self.student, 'api.meetings', project_id=self.project.id, after=encode_cursor(['1']))
+        self.assertEqual(response.status_code, 400)
+
+    def test_forbids_other_projects(self):
+        response = self.get(self.student, 'api.meetings', project_id=self.other_project.id)
+        self.assertEqual(response.status_code, 403)
+        self.assertEqual(self.get(self.student, 'api.marks', project_id=999).status_code, 404)
+
+    def test_hides_other_markers_marks_until_final(self):
+        supervisor_mark = ProjectMark(project_id=self.project.id, marker_id=self.supervisor.id, mark=70,
+                                      feedback="Good")
+        marker_mark = ProjectMark(project_id=self.project.id, marker_id=self.second_marker.id, mark=72,
+                                  feedback="Fine")
+        db.session.add_all([supervisor_mark, marker_mark])
+        db.session.commit()
+        marks = self.get(self.supervisor, 'api.marks', project_id=self.project.id, fields='marker,mark').json
+        self.assertEqual({item['marker']: item['mark'] for item in marks['items']},
+                         {"Supervisor": 70, "Marker": None})
+        admin = self.get(self.admin, 'api.marks', project_id=self.project.id, fields='mark').json['items']
+        self.assertEqual(sorted(item['mark'] for item in admin), [70, 72])
+
+        # A concordant pair of finalised marks agrees the final mark, which reveals both
+        self.project.submitted_datetime = datetime.now()
+        supervisor_mark.finalised = marker_mark.finalised = True
+        db.session.commit()
+        marks = self.get(self.supervisor, 'api.marks', project_id=self.project.id, fields='mark,round').json['items']
+        self.assertEqual(sorted((item['mark'], item['round']) for item in marks), [(70, 1), (72, 1)])
+        projects = self.get(self.student, 'api.projects', fields='final_mark,status').json['items']
+        self.assertEqual((projects[0]['final_mark'], projects[0]['status']), (71, 'MARKS_CONFIRMED'))
+
+    def test_lists_proposals_and_active_catalog(self):
+        db.session.add_all([
+            CatalogProposal(title="Open Topic", description="Available.", supervisor=self.supervisor),
+            CatalogProposal(title="Withdrawn Topic", description="Gone.", supervisor=self.supervisor, active=False)])
+        db.session.commit()
+        catalog = self.get(self.student, 'api.catalog', fields='title,supervisor').json['items']
+        self.assertEqual([(item['title'], item['supervisor']) for item in catalog], [("Open Topic", "Supervisor")])
+        proposals = self.get(self.student, 'api.proposals', status='accepted').json['items']
+        self.assertEqual([item['title'] for item in proposals], ["Project One"])
+
+    def test_token_command_issues_usable_token(self):
+        result = self.flask_app.test_cli_runner().invoke(args=['api', 'token', 'student@example.com'])
+        self.assertEqual(result.exit_code, 0, result.output)
+        g.pop('_login_user', None)
+        response = self.flask_app.test_client().get(url_for('api.projects'),
+                                                    headers={'Authorization': f'Bearer {result.output.strip()}'})
+        self.assertEqual(response.status_code, 200)
+        result = self.flask_app.test_cli_runner().invoke(args=['api', 'token', 'nobody@example.com'])
+        self.assertNotEqual(result.exit_code, 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,95 @@
+import os
+import tempfile
+import unittest
+
+from sqlalchemy import func, select
+
+from benchmarks.cohort import generate_cohort
+from benchmarks.routes import compare, run_benchmarks
+from models import MarkingRound, Project, ProjectMark, User
+from models.Project import ProjectStatus
+from models.db import db
+
+from app import create_app
+
+
+class SyntheticCohortTests(unittest.TestCase):
+    def setUp(self):
+        self.db_fd, self.db_path = tempfile.mkstemp()
+        self.flask_app = create_app({
+            'SQLALCHEMY_DATABASE_URI': f'sqlite:///{self.db_path}',
+            'TESTING': True,
+            'SECRET_KEY': 'test'
+        })
+        self.app_context = self.flask_app.app_context()
+        self.app_context.push()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        db.engine.dispose()
+        self.app_context.pop()
+        os.close(self.db_fd)
+        os.unlink(self.db_path)
+
+    def test_generates_projects_in_every_status(self):
+        counts = generate_cohort(scale=0.01)
+        self.assertEqual((counts['user'], counts['project'], counts['meeting']), (105, 80, 600))
+        statuses = dict(db.session.execute(select(Project.status, func.count()).group_by(Project.status)).all())
+        self.assertEqual(set(statuses), set(ProjectStatus))
+        # Reconciliation spans a second round, opened after a non-concordant first one
+        second_rounds = db.session.scalars(select(MarkingRound).where(MarkingRound.round_number == 2)).all()
+        self.assertTrue(second_rounds)
+        for second_round in second_rounds:
+            first = db.session.scalar(select(MarkingRound).filter_by(project_id=second_round.project_id,
+                                                                     round_number=1))
+            self.assertFalse(first.concordant)
+        with self.assertRaises(ValueError):
+            generate_cohort(scale=0.01)
+
+    def test_generated_marks_follow_the_marking_rules(self):
+        generate_cohort(scale=0.01)
+        for marking_round in MarkingRound.query.filter(MarkingRound.concordant == True):
+            first, second = [mark.mark for mark in marking_round.marks]
+            self.assertLessEqual(abs(first - second), 5)
+            self.assertEqual(marking_round.resolved_mark, (first + second) / 2)
+        # Finalising the outstanding mark of a project being marked closes its round as the app would
+        project = Project.query.filter(Project.status == ProjectStatus.MARKING,
+                                       Project.rounds.any(MarkingRound.round_number == 1)).first()
+        outstanding = ProjectMark.query.filter_by(project_id=project.id, finalised=False).one()
+        first = ProjectMark.query.filter_by(project_id=project.id, finalised=True).one()
+        outstanding.mark, outstanding.finalised = first.mark, True
+        db.session.commit()
+        self.assertEqual(project.status, ProjectStatus.MARKS_CONFIRMED)
+        self.assertFalse(User.query.filter(User.active == False, User.projects_supervised.any()).count())
+
+
+class RouteBenchmarkTests(unittest.TestCase):
+    def setUp(self):
+        self.db_fd, self.db_path = tempfile.mkstemp()
+
+    def tearDown(self):
+        os.close(self.db_fd)
+        for suffix in ('', '-wal', '-shm'):
+            if os.path.exists(self.db_path + suffix):
+                os.unlink(self.db_path + suffix)
+
+    def test_times_each_route_and_flags_regressions(self):
+        results = run_benchmarks(self.db_path, scale=0.01, repeat=2, warmup=1)
+        self.assertIn('user.home (admin)', results['routes'])
+        self.assertIn('project.submit_mark', results['routes'])
+        for result in results['routes'].values():
+            self.assertEqual(result['requests'], 2)
+            self.assertGreater(result['median_ms'], 0)
+        self.assertFalse(any(regressed for *_, regressed in compare(results, results, tolerance=0.2)))
+
+        route = {'median_ms': 10.0, 'queries': 4}
+        baseline = {'routes': {'fast': route, 'tiny': {'median_ms': 0.5, 'queries': 1}, 'chatty': route}}
+        current = {'routes': {'fast': {'median_ms': 13.0, 'queries': 4}, 'tiny': {'median_ms': 0.9, 'queries': 1},
+                              'chatty': {'median_ms': 10.0, 'queries': 5}, 'new': route}}
+        flagged = {name: regressed for name, _, _, regressed in compare(current, baseline, tolerance=0.2)}
+        self.assertEqual(flagged, {'fast': True, 'tiny': False, 'chatty': True})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,189 @@
+import os
+import tempfile
+import unittest
+from datetime import datetime
+
+from flask import g, url_for
+from sqlalchemy import event, update
+
+from models import User, Proposal, Project, Meeting
+from models.db import db
+from routes.calendar import calendar_feed_url, content_line, token_serializer
+
+from app import create_app
+
+
+class MeetingCalendarFeeds(unittest.TestCase):
+    def setUp(self):
+        self.db_fd, self.db_path = tempfile.mkstemp()
+        self.flask_app = create_app({
+            'SQLALCHEMY_DATABASE_URI': f'sqlite:///{self.db_path}',
+            'TESTING': True,
+            'SECRET_KEY': 'test',
+            'SERVER_NAME': 'localhost'
+        })
+        self.app_context = self.flask_app.app_context()
+        self.app_context.push()
+        db.drop_all()
+        db.create_all()
+        self.student = User(email="student@example.com", name="Student", password_hash="x")
+        self.other_student = User(email="other@example.com", name="Other Student", password_hash="x")
+        self.supervisor = User(email="supervisor@example.com", name="Supervisor", password_hash="x",
+                               is_supervisor=True)
+        db.session.add_all([self.student, self.other_student, self.supervisor])
+        db.session.commit()
+        self.project = self.add_project(self.student, "Project One")
+        self.other_project = self.add_project(self.other_student, "Robots, Rules; and Ethics")
+        self.meeting = Meeting(project_id=self.project.id, meeting_start=datetime(2030, 1, 7, 10),
+                               meeting_end=datetime(2030, 1, 7, 11), location="Room 101")
+        db.session.add_all([self.meeting, Meeting(project_id=self.other_project.id,
+                                                  meeting_start=datetime(2030, 1, 8, 14), location="Online")])
+        db.session.commit()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        db.engine.dispose()
+        self.app_context.pop()
+        os.close(self.db_fd)
+        os.unlink(self.db_path)
+
+    def add_project(self, student: User, title: str) -> Project:
+        proposal = Proposal(title=title, description="Description", student_id=student.id,
+                            supervisor_id=self.supervisor.id, accepted_date=datetime.now())
+        db.session.add(proposal)
+        db.session.flush()
+        project = Project(proposal_id=proposal.id, student_id=student.id, supervisor_id=self.supervisor.id)
+        db.session.add(project)
+        db.session.commit()
+        return project
+
+    def get_feed(self, user: User, **headers):
+        g.pop('_login_user', None)  # requests share the test's app context, so drop the user loaded by the last one
+        return self.flask_app.test_client().get(calendar_feed_url(user.id), headers=headers)
+
+    def test_lists_each_users_meetings(self):
+        response = self.get_feed(self.student)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.mimetype, 'text/calendar')
+        feed = response.get_data(as_text=True)
+        self.assertTrue(feed.startswith('BEGIN:VCALENDAR\r\n') and feed.endswith('END:VCALENDAR\r\n'))
+        self.assertEqual(feed.count('BEGIN:VEVENT'), 1)
+        self.assertIn(f'UID:meeting-{self.meeting.id}@localhost\r\n', feed)
+        self.assertIn('DTSTART:20300107T100000\r\nDTEND:20300107T110000\r\n', feed)
+        self.assertIn('SUMMARY:Project One meeting with Supervisor\r\n', feed)
+
+        feed = self.get_feed(self.supervisor).get_data(as_text=True)
+        self.assertEqual(feed.count('BEGIN:VEVENT'), 2)
+        self.assertIn('SUMMARY:Robots\\, Rules\\; and Ethics meeting with Other Student\r\n', feed)
+        self.assertIn('LOCATION:Online\r\n', feed)
+
+    def test_folds_long_lines(self):
+        line = content_line('DESCRIPTION', 'é' * 60)
+        parts = line[:-2].split('\r\n')
+        self.assertTrue(all(len(part.encode()) <= 75 for part in parts))
+        self.assertTrue(all(part.startswith(' ') for part in parts[1:]))
+        self.assertEqual(''.join(part[1:] if i else part for i, part in enumerate(parts)), 'DESCRIPTION:' + 'é' * 60)
+
+    def test_answers_unchanged_feed_with_not_modified(self):
+        first = self.get_feed(self.student)
+        etag = first.headers['ETag']
+        self.assertIsNotNone(first.last_modified)
+        self.assertIn('no-cache', first.headers['Cache-Control'])
+
+        statements = []
+
+        def record(conn, cursor, statement, parameters, context, executemany):
+            statements.append(statement)
+
+        url = calendar_feed_url(self.student.id)
+        event.listen(db.engine, "before_cursor_execute", record)
+        try:
+            g.pop('_login_user', None)
+            response = self.flask_app.test_client().get(url, headers={'If-None-Match': etag})
+        finally:
+            event.remove(db.engine, "before_cursor_execute", record)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.data, b'')
+        self.assertEqual(len(statements), 1)  # only the feed's version, not its meetings
+        response = self.get_feed(self.student, **{'If-Modified-Since': first.headers['Last-Modified']})
+        self.assertEqual(response.status_code, 304)
+
+        self.meeting.location = "Room 202"
+        db.session.commit()
+        response = self.get_feed(self.student, **{'If-None-Match': etag})
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('LOCATION:Room 202', response.get_data(as_text=True))
+
+        etag = response.headers['ETag']
+        db.session.delete(self.meeting)
+        db.session.commit()
+        response = self.get_feed(self.student, **{'If-None-Match': etag})
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn('BEGIN:VEVENT', response.get_data(as_text=True))
+
+    def test_deleted_meeting_changes_last_modified(self):
+        db.session.execute(update(Meeting).values(created_at=datetime(2024, 1, 1), updated_at=datetime(2024, 1, 1)))
+        db.session.commit()
+        first = self.get_feed(self.student)
+        db.session.delete(self.meeting)
+        db.session.commit()
+        response = self.get_feed(self.student, **{'If-Modified-Since': first.headers['Last-Modified']})
+        self.assertEqual(response.status_code, 200)
+        self.assertGreater(response.last_modified, first.last_modified)
+        self.assertNotEqual(response.headers['ETag'], first.headers['ETag'])
+        self.assertNotIn('BEGIN:VEVENT', response.get_data(as_text=True))
+
+    def test_renamed_project_or_person_changes_feed(self):
+        etag = self.get_feed(self.supervisor).headers['ETag']
+        self.student.name = "Renamed Student"
+        db.session.commit()
+        response = self.get_feed(self.supervisor, **{'If-None-Match': etag})
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('SUMMARY:Project One meeting with Renamed Student\r\n', response.get_data(as_text=True))
+
+        etag = self.get_feed(self.student).headers['ETag']
+        self.project.proposal.title = "Project Renamed"
+        db.session.commit()
+        response = self.get_feed(self.student, **{'If-None-Match': etag})
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('SUMMARY:Project Renamed meeting with Supervisor\r\n', response.get_data(as_text=True))
+
+    def test_reset_revokes_feed_link(self):
+        url = calendar_feed_url(self.student.id)
+        self.assertEqual(self.flask_app.test_client().get(url).status_code, 200)
+        client = self.flask_app.test_client()
+        with client.session_transaction() as session:
+            session['_user_id'] = self.student.id
+        response = client.post(url_for('calendar.reset_feed'), data={'project_id': self.project.id},
+                               follow_redirects=True)
+        self.assertIn(b'Your calendar feed link has been reset.', response.data)
+        g.pop('_login_user', None)
+        self.assertEqual(self.flask_app.test_client().get(url).status_code, 404)
+        self.assertNotEqual(calendar_feed_url(self.student.id), url)
+        self.assertEqual(self.get_feed(self.student).status_code, 200)
+
+    def test_refuses_unknown_tokens_and_inactive_users(self):
+        client = self.flask_app.test_client()
+        self.assertEqual(client.get(url_for('calendar.feed', token='not-a-token')).status_code, 404)
+        # A token without the user's feed secret, as links were before secrets were added
+        self.assertEqual(client.get(url_for('calendar.feed', token=token_serializer().dumps(self.student.id)))
+                         .status_code, 404)
+        leaver = User(email="leaver@example.com", name="Leaver", password_hash="x")
+        db.session.add(leaver)
+        db.session.commit()
+        url = calendar_feed_url(leaver.id)
+        leaver.active = False
+        db.session.commit()
+        self.assertEqual(client.get(url).status_code, 404)
+
+    def test_project_page_links_to_feed(self):
+        client = self.flask_app.test_client()
+        with client.session_transaction() as session:
+            session['_user_id'] = self.student.id
+        response = client.get(url_for('project.view_project', project_id=self.project.id))
+        self.assertIn(calendar_feed_url(self.student.id).encode(), response.data)
+
+
+if __name__ == '__main__':
+    unittest.main()
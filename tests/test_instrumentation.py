@@ -0,0 +1,89 @@
+import json
+import logging
+import os
+import tempfile
+import unittest
+
+from flask import url_for
+from flask.testing import FlaskClient
+
+from instrumentation import SQL_STATS_LOGGER
+from models import User
+
+from models.db import db
+
+from app import create_app
+
+
+class SQLInstrumentationTests(unittest.TestCase):
+    def setUp(self):
+        self.db_fd, self.db_path = tempfile.mkstemp()
+        test_config = {
+            'SQLALCHEMY_DATABASE_URI': f'sqlite:///{self.db_path}',
+            'TESTING': True,
+            'SECRET_KEY': 'test',
+            'SERVER_NAME': 'localhost',
+            'SQL_INSTRUMENTATION': True,
+            'SQL_INSTRUMENTATION_TOP_N': 2
+        }
+        self.flask_app = create_app(test_config)
+        self.app_context = self.flask_app.app_context()
+        self.app_context.push()
+        db.drop_all()
+        db.create_all()
+        self.student_user = User(email="student@example.com", name="Student User", password_hash="x")
+        self.admin_user = User(email="admin@example.com", name="Admin User", password_hash="x", is_admin=True)
+        db.session.add_all([self.student_user, self.admin_user])
+        db.session.commit()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        db.engine.dispose()
+        self.app_context.pop()
+        os.close(self.db_fd)
+        os.unlink(self.db_path)
+
+    def login(self, user: User) -> FlaskClient:
+        client = self.flask_app.test_client()
+        with client.session_transaction() as session:
+            session['_user_id'] = user.id
+        return client
+
+    def test_adds_server_timing_header_and_log_line(self):
+        client = self.login(self.student_user)
+        self.assertEqual(self.flask_app.logger.getEffectiveLevel(), logging.WARNING)
+        self.assertTrue(logging.getLogger(SQL_STATS_LOGGER).isEnabledFor(logging.INFO))
+        with self.assertLogs(SQL_STATS_LOGGER, level='INFO') as logs:
+            response = client.get(url_for('user.home'))
+        self.assertEqual(response.status_code, 200)
+        self.assertRegex(response.headers['Server-Timing'], r'^db;dur=[0-9.]+;desc="[0-9]+ queries"$')
+        record = json.loads(logs.records[-1].getMessage())
+        self.assertEqual(record['endpoint'], 'user.home')
+        self.assertGreater(record['queries'], 0)
+        self.assertLessEqual(len(record['slowest']), 2)
+
+    def test_lists_worst_endpoints_for_admins(self):
+        client = self.login(self.admin_user)
+        client.get(url_for('user.home'))
+        response = client.get(url_for('admin.sql_stats'))
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(b'user.home', response.data)
+
+    def test_prevents_non_admin_from_viewing_sql_stats(self):
+        response = self.login(self.student_user).get(url_for('admin.sql_stats'), follow_redirects=True)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(b'Only module leaders can view SQL statistics.', response.data)
+
+    def test_does_not_instrument_when_disabled(self):
+        flask_app = create_app({'SQLALCHEMY_DATABASE_URI': f'sqlite:///{self.db_path}', 'TESTING': True,
+                                'SECRET_KEY': 'test'})
+        client = flask_app.test_client()
+        with client.session_transaction() as session:
+            session['_user_id'] = self.student_user.id
+        response = client.get('/user/')
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn('Server-Timing', response.headers)
+        self.assertNotIn('sql_instrumentation', flask_app.extensions)
+        with flask_app.app_context():
+            db.engine.dispose()
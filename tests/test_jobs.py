@@ -0,0 +1,227 @@
+import os
+import tempfile
+import unittest
+import unittest.mock
+from datetime import datetime, timedelta
+from threading import Event
+
+from flask import g, url_for
+from sqlalchemy import update
+
+from job_queue import JobQueue, job_task
+from models import User
+from models.Job import Job, JobState
+from models.db import db
+from notifications import NotificationOutbox
+
+from app import create_app
+
+started = Event()
+released = Event()
+runs = []  # job ids, once per run of test_until_released
+
+
+@job_task('test_count')
+def count_task(job, to):
+    job.progress(0, to)
+    for done in range(1, to + 1):
+        job.progress(done)
+    return f'Counted to {to}.'
+
+
+@job_task('test_fail')
+def fail_task(job):
+    raise RuntimeError('Something broke.')
+
+
+@job_task('test_until_cancelled')
+def until_cancelled_task(job):
+    started.set()
+    while True:
+        job.progress(0)
+
+
+@job_task('test_until_released')
+def until_released_task(job):
+    runs.append(job.job_id)
+    started.set()
+    released.wait(timeout=30)
+    return 'Released.'
+
+
+class BackgroundJobs(unittest.TestCase):
+    def setUp(self):
+        self.db_fd, self.db_path = tempfile.mkstemp()
+        self.flask_app = self.create_app()
+        self.app_context = self.flask_app.app_context()
+        self.app_context.push()
+        db.drop_all()
+        db.create_all()
+        self.queue = self.flask_app.extensions['job_queue']
+        started.clear()
+        released.clear()
+
+    def tearDown(self):
+        self.queue.wait(timeout=30)
+        db.session.remove()
+        db.drop_all()
+        db.engine.dispose()
+        self.app_context.pop()
+        os.close(self.db_fd)
+        os.unlink(self.db_path)
+
+    def create_app(self, **config):
+        return create_app({
+            'SQLALCHEMY_DATABASE_URI': f'sqlite:///{self.db_path}',
+            'TESTING': True,
+            'SECRET_KEY': 'test',
+            'SERVER_NAME': 'localhost',
+            'JOB_RUN_IN_PROCESS': True,
+            **config
+        })
+
+    def finished(self, job: Job) -> Job:
+        self.queue.wait(timeout=30)
+        db.session.expire_all()
+        return db.session.get(Job, job.id)
+
+    def admin_client(self):
+        admin = User(email="admin@example.com", name="Admin", password_hash="x", is_admin=True)
+        db.session.add(admin)
+        db.session.commit()
+        g.pop('_login_user', None)
+        client = self.flask_app.test_client()
+        with client.session_transaction() as session:
+            session['_user_id'] = admin.id
+        return client
+
+    def test_runs_task_and_records_progress(self):
+        job = self.finished(self.queue.submit('test_count', to=3))
+        self.assertEqual(job.state, JobState.SUCCEEDED)
+        self.assertEqual((job.progress, job.total, job.percent), (3, 3, 100))
+        self.assertEqual(job.message, 'Counted to 3.')
+        self.assertIsNotNone(job.started_at)
+        self.assertGreaterEqual(job.finished_at, job.started_at)
+
+    def test_records_failure(self):
+        job = self.finished(self.queue.submit('test_fail'))
+        self.assertEqual((job.state, job.message), (JobState.FAILED, 'Something broke.'))
+
+    def test_refuses_unknown_task(self):
+        with self.assertRaises(ValueError):
+            self.queue.submit('no_such_task')
+        self.assertFalse(db.session.query(Job).count())
+
+    def test_cancels_queued_job(self):
+        job = Job(name='test_count', arguments={'to': 3})
+        db.session.add(job)
+        db.session.commit()
+        self.assertTrue(self.queue.cancel(job.id))
+        self.queue.dispatch(job.id)  # a worker that picks it up anyway leaves it alone
+        job = self.finished(job)
+        self.assertEqual((job.state, job.progress, job.started_at), (JobState.CANCELLED, 0, None))
+        self.assertFalse(self.queue.cancel(job.id))
+
+    def test_cancels_running_job(self):
+        job = self.queue.submit('test_until_cancelled')
+        self.assertTrue(started.wait(timeout=30))
+        self.assertTrue(self.queue.cancel(job.id))
+        job = self.finished(job)
+        self.assertEqual((job.state, job.message), (JobState.CANCELLED, 'Cancelled.'))
+
+    def test_keeps_jobs_it_is_still_running(self):
+        job = self.queue.submit('test_until_released')
+        self.assertTrue(started.wait(timeout=30))
+        # A task that reports no progress for longer than JOB_STALE_AFTER is not taken for abandoned
+        stale = datetime.now() - timedelta(hours=1)
+        db.session.execute(update(Job).where(Job.id == job.id).values(heartbeat_at=stale))
+        db.session.commit()
+        self.queue.poll()
+        db.session.expire_all()
+        job = db.session.get(Job, job.id)
+        self.assertEqual(job.state, JobState.RUNNING)
+        self.assertGreater(job.heartbeat_at, stale)
+        released.set()
+        job = self.finished(job)
+        self.assertEqual((job.state, job.message), (JobState.SUCCEEDED, 'Released.'))
+        self.assertEqual(runs.count(job.id), 1)
+
+    def test_resumes_jobs_left_by_stopped_worker(self):
+        stale = datetime.now() - timedelta(hours=1)
+        queued = Job(name='test_count', arguments={'to': 2})
+        abandoned = Job(name='test_count', arguments={'to': 2}, state=JobState.RUNNING, started_at=stale,
+                        heartbeat_at=stale)
+        # Still reporting progress, so another process is running it
+        running = Job(name='test_count', arguments={'to': 2}, state=JobState.RUNNING, started_at=datetime.now(),
+                      heartbeat_at=datetime.now())
+        db.session.add_all([queued, abandoned, running])
+        db.session.commit()
+
+        self.queue = self.create_app().extensions['job_queue']  # as when the app is started again
+        for job in (queued, abandoned):
+            self.assertEqual(self.finished(job).state, JobState.SUCCEEDED)
+        self.assertEqual(self.finished(running).state, JobState.RUNNING)
+
+    def test_only_queues_jobs_in_processes_not_running_them(self):
+        # As in a CLI command, or a server configured with no job workers
+        for config in ({'JOB_RUN_IN_PROCESS': False}, {'JOB_WORKERS': 0}):
+            queue = self.create_app(**config).extensions['job_queue']
+            self.assertFalse(queue.running)
+            job = queue.submit('test_count', to=2)
+            queue.wait(timeout=30)
+            self.assertEqual(self.finished(job).state, JobState.QUEUED)
+        self.queue.poll()  # until the process running jobs next polls
+        self.queue.wait(timeout=30)
+        db.session.expire_all()
+        self.assertFalse(db.session.query(Job).filter(Job.state != JobState.SUCCEEDED).count())
+
+    def test_poll_requeues_jobs_abandoned_since_start_up(self):
+        job = self.queue.submit('test_count', to=2)
+        self.assertEqual(self.finished(job).state, JobState.SUCCEEDED)
+        stale = datetime.now() - timedelta(hours=1)
+        db.session.execute(update(Job).where(Job.id == job.id).values(state=JobState.RUNNING, heartbeat_at=stale))
+        db.session.commit()
+        self.queue.poll()
+        job = self.finished(job)
+        self.assertEqual((job.state, job.message), (JobState.SUCCEEDED, 'Counted to 2.'))
+
+    def test_worker_command_runs_queued_jobs(self):
+        flask_app = self.create_app(JOB_RUN_IN_PROCESS=False)
+        job = flask_app.extensions['job_queue'].submit('test_count', to=2)
+        # Polling and the outbox worker are patched out instead of running until stopped
+        with flask_app.app_context(), unittest.mock.patch.object(JobQueue, 'work'), \
+                unittest.mock.patch.object(NotificationOutbox, 'start') as start_outbox:
+            result = flask_app.test_cli_runner().invoke(args=['jobs', 'worker', '--workers', '1'])
+        self.assertIn('Running background jobs on 1 thread(s)', result.output)
+        start_outbox.assert_called_once_with()
+        flask_app.extensions['job_queue'].wait(timeout=30)
+        self.assertEqual(self.finished(job).state, JobState.SUCCEEDED)
+
+    def test_admin_lists_and_cancels_jobs(self):
+        client = self.admin_client()
+        job = Job(name='test_count', arguments={'to': 3})
+        db.session.add(job)
+        db.session.commit()
+        response = client.get(url_for('admin.jobs'))
+        self.assertIn(f'#{job.id} test_count'.encode(), response.data)
+        self.assertIn(b'http-equiv="refresh"', response.data)
+        response = client.post(url_for('admin.cancel_job', job_id=job.id), follow_redirects=True)
+        self.assertIn(f'Job #{job.id} cancelled.'.encode(), response.data)
+        self.assertNotIn(b'http-equiv="refresh"', response.data)
+        response = client.post(url_for('admin.cancel_job', job_id=job.id), follow_redirects=True)
+        self.assertIn(f'Job #{job.id} has already finished.'.encode(), response.data)
+
+    def test_refuses_non_admins(self):
+        student = User(email="student@example.com", name="Student", password_hash="x")
+        db.session.add(student)
+        db.session.commit()
+        g.pop('_login_user', None)
+        client = self.flask_app.test_client()
+        with client.session_transaction() as session:
+            session['_user_id'] = student.id
+        response = client.get(url_for('admin.jobs'), follow_redirects=True)
+        self.assertIn(b'Only module leaders can view background jobs.', response.data)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,109 @@
+import csv
+import io
+import os
+import tempfile
+import unittest
+from datetime import datetime
+
+from flask import g, url_for
+
+from benchmarks.cohort import generate_cohort
+from models import Project, ProjectMark, Proposal, User
+from models.db import db
+
+from app import create_app
+
+
+class MarksExport(unittest.TestCase):
+    def setUp(self):
+        self.db_fd, self.db_path = tempfile.mkstemp()
+        self.flask_app = create_app({
+            'SQLALCHEMY_DATABASE_URI': f'sqlite:///{self.db_path}',
+            'TESTING': True,
+            'SECRET_KEY': 'test',
+            'SERVER_NAME': 'localhost'
+        })
+        self.app_context = self.flask_app.app_context()
+        self.app_context.push()
+        db.drop_all()
+        db.create_all()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        db.engine.dispose()
+        self.app_context.pop()
+        os.close(self.db_fd)
+        os.unlink(self.db_path)
+
+    def export_as(self, user: User):
+        g.pop('_login_user', None)  # requests share the test's app context, so drop the user loaded by the last one
+        client = self.flask_app.test_client()
+        with client.session_transaction() as session:
+            session['_user_id'] = user.id
+        return client.get(url_for('admin.export_marks'))
+
+    def read_export(self, response) -> [dict]:
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.is_streamed)
+        return list(csv.DictReader(io.StringIO(response.get_data().decode('utf-8-sig'))))
+
+    def test_exports_one_row_per_project_with_every_round(self):
+        admin = User(email="admin@example.com", name="Admin", password_hash="x", is_admin=True)
+        student = User(email="student@example.com", name="Student", password_hash="x")
+        supervisor = User(email="supervisor@example.com", name="Supervisor", password_hash="x", is_supervisor=True)
+        marker = User(email="marker@example.com", name="Marker", password_hash="x", is_supervisor=True)
+        db.session.add_all([admin, student, supervisor, marker])
+        db.session.flush()
+        proposal = Proposal(title="=HYPERLINK(\"x\")", description="Description", student_id=student.id,
+                            supervisor_id=supervisor.id, accepted_date=datetime.now())
+        db.session.add(proposal)
+        db.session.flush()
+        project = Project(proposal_id=proposal.id, student_id=student.id, supervisor_id=supervisor.id,
+                          second_marker_id=marker.id, submitted_datetime=datetime.now())
+        db.session.add(project)
+        db.session.flush()
+        # Each pair of finalised marks closes a round, the first apart and the second concordant
+        for supervisor_mark, marker_mark in ((50, 70), (64, 66)):
+            db.session.add_all([
+                ProjectMark(project_id=project.id, marker_id=supervisor.id, mark=supervisor_mark, finalised=True),
+                ProjectMark(project_id=project.id, marker_id=marker.id, mark=marker_mark, finalised=True)])
+            db.session.commit()
+
+        response = self.export_as(admin)
+        self.assertIn('attachment; filename=marks-', response.headers['Content-Disposition'])
+        rows = self.read_export(response)
+        self.assertEqual(len(rows), 1)
+        row = rows[0]
+        self.assertEqual(row['Title'], "'=HYPERLINK(\"x\")")
+        self.assertEqual((row['Student'], row['Supervisor'], row['Second Marker']), ("Student", "Supervisor", "Marker"))
+        self.assertEqual((row['Round 1 Supervisor Mark'], row['Round 1 Second Marker Mark'], row['Round 1 Agreed']),
+                         ('50.0', '70.0', 'No'))
+        self.assertEqual((row['Round 2 Supervisor Mark'], row['Round 2 Second Marker Mark'], row['Round 2 Agreed']),
+                         ('64.0', '66.0', 'Yes'))
+        self.assertEqual((row['Final Mark'], row['Status']), ('65.0', 'Marks Confirmed'))
+
+    def test_exports_whole_cohort(self):
+        generate_cohort(scale=0.01)
+        admin = User.query.filter_by(is_admin=True).first()
+        rows = self.read_export(self.export_as(admin))
+        self.assertEqual([int(row['Project ID']) for row in rows], [p.id for p in Project.query.order_by(Project.id)])
+        confirmed = {project.id: project.final_mark for project in Project.query if project.final_mark is not None}
+        self.assertEqual({int(row['Project ID']): float(row['Final Mark']) for row in rows if row['Final Mark']},
+                         confirmed)
+        self.assertTrue(any(row['Round 2 Agreed'] == 'Yes' for row in rows))
+
+    def test_refuses_non_admins(self):
+        student = User(email="student@example.com", name="Student", password_hash="x")
+        db.session.add(student)
+        db.session.commit()
+        g.pop('_login_user', None)
+        client = self.flask_app.test_client()
+        with client.session_transaction() as session:
+            session['_user_id'] = student.id
+        response = client.get(url_for('admin.export_marks'), follow_redirects=True)
+        self.assertIn(b'Only module leaders can export marks.', response.data)
+
+
+if __name__ == '__main__':
+    unittest.main()
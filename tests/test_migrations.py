@@ -0,0 +1,201 @@
+import os
+import sqlite3
+import tempfile
+import unittest
+
+from flask import g, url_for
+from sqlalchemy import inspect, select, text
+
+from models import Project, ProjectMark, User
+from models.Project import ProjectStatus
+from models.db import db
+
+from app import create_app
+
+# The schema of a database created before any of the migrations, as create_all made it for the first release
+BASELINE_SCHEMA = """
+CREATE TABLE user (
+    id INTEGER NOT NULL,
+    email VARCHAR(120) NOT NULL,
+    name VARCHAR(120) NOT NULL,
+    password_hash VARCHAR(128) NOT NULL,
+    is_supervisor BOOLEAN,
+    is_admin BOOLEAN,
+    active BOOLEAN,
+    PRIMARY KEY (id),
+    UNIQUE (email)
+);
+CREATE TABLE catalog_proposal (
+    id INTEGER NOT NULL,
+    title VARCHAR(150) NOT NULL,
+    description TEXT NOT NULL,
+    active BOOLEAN NOT NULL,
+    supervisor_id INTEGER NOT NULL,
+    PRIMARY KEY (id),
+    FOREIGN KEY(supervisor_id) REFERENCES user (id)
+);
+CREATE TABLE proposal (
+    id INTEGER NOT NULL,
+    title VARCHAR(150) NOT NULL,
+    description TEXT NOT NULL,
+    catalog_proposal_id INTEGER,
+    student_id INTEGER NOT NULL,
+    supervisor_id INTEGER NOT NULL,
+    created_date DATETIME NOT NULL,
+    accepted_date DATETIME,
+    rejected_date DATETIME,
+    PRIMARY KEY (id),
+    FOREIGN KEY(catalog_proposal_id) REFERENCES catalog_proposal (id),
+    FOREIGN KEY(student_id) REFERENCES user (id),
+    FOREIGN KEY(supervisor_id) REFERENCES user (id)
+);
+CREATE TABLE project (
+    id INTEGER NOT NULL,
+    proposal_id INTEGER NOT NULL,
+    student_id INTEGER NOT NULL,
+    supervisor_id INTEGER NOT NULL,
+    second_marker_id INTEGER,
+    submitted_datetime DATETIME,
+    archived_datetime DATETIME,
+    PRIMARY KEY (id),
+    CONSTRAINT check_second_marker_not_supervisor CHECK (second_marker_id IS NULL OR second_marker_id != supervisor_id),
+    CONSTRAINT check_second_marker_not_student CHECK (second_marker_id IS NULL OR second_marker_id != student_id),
+    UNIQUE (proposal_id),
+    FOREIGN KEY(proposal_id) REFERENCES proposal (id),
+    FOREIGN KEY(student_id) REFERENCES user (id),
+    FOREIGN KEY(supervisor_id) REFERENCES user (id),
+    FOREIGN KEY(second_marker_id) REFERENCES user (id)
+);
+CREATE TABLE project_mark (
+    id INTEGER NOT NULL,
+    project_id INTEGER NOT NULL,
+    marker_id INTEGER NOT NULL,
+    mark FLOAT,
+    feedback TEXT,
+    submitted_at DATETIME,
+    finalised BOOLEAN NOT NULL,
+    PRIMARY KEY (id),
+    CONSTRAINT check_grade_bounds CHECK (mark is NULL OR (mark >= 0 AND mark <= 100)),
+    FOREIGN KEY(project_id) REFERENCES project (id),
+    FOREIGN KEY(marker_id) REFERENCES user (id)
+);
+CREATE TABLE meeting (
+    id INTEGER NOT NULL,
+    project_id INTEGER NOT NULL,
+    created_at DATETIME,
+    meeting_start DATETIME NOT NULL,
+    meeting_end DATETIME,
+    location VARCHAR(120),
+    attendance BOOLEAN NOT NULL,
+    outcome_notes TEXT,
+    PRIMARY KEY (id),
+    CONSTRAINT check_meeting_end_after_start CHECK (meeting_end IS NULL OR meeting_end > meeting_start),
+    FOREIGN KEY(project_id) REFERENCES project (id)
+);
+"""
+
+# A supervisor, two students and a second marker. The first project's marks were too far apart and are being marked
+# again, the second's agreed, and the third has only the supervisor's mark so far.
+BASELINE_DATA = """
+INSERT INTO user VALUES (1, 'supervisor@example.com', 'Supervisor', 'x', 1, 1, 1);
+INSERT INTO user VALUES (2, 'student@example.com', 'Student', 'x', 0, 0, 1);
+INSERT INTO user VALUES (3, 'marker@example.com', 'Marker', 'x', 1, 0, 1);
+INSERT INTO proposal VALUES (1, 'Title', 'Description', NULL, 2, 1, '2024-01-01 09:00:00', '2024-01-02 09:00:00', NULL);
+INSERT INTO user VALUES (4, 'student2@example.com', 'Second Student', 'x', 0, 0, 1);
+INSERT INTO user VALUES (5, 'student3@example.com', 'Third Student', 'x', 0, 0, 1);
+INSERT INTO proposal VALUES (2, 'Agreed', 'Description', NULL, 4, 1, '2024-01-01 09:00:00',
+                             '2024-01-02 09:00:00', NULL);
+INSERT INTO proposal VALUES (3, 'Started', 'Description', NULL, 5, 1, '2024-01-01 09:00:00',
+                             '2024-01-02 09:00:00', NULL);
+INSERT INTO project VALUES (1, 1, 2, 1, 3, '2024-05-01 09:00:00', NULL);
+INSERT INTO project VALUES (2, 2, 4, 1, 3, '2024-05-01 09:00:00', NULL);
+INSERT INTO project VALUES (3, 3, 5, 1, 3, '2024-05-01 09:00:00', NULL);
+INSERT INTO project_mark VALUES (1, 1, 1, 50, 'Feedback', NULL, 1);
+INSERT INTO project_mark VALUES (2, 2, 1, 64, 'Feedback', NULL, 1);
+INSERT INTO project_mark VALUES (3, 1, 3, 70, 'Feedback', NULL, 1);
+INSERT INTO project_mark VALUES (4, 2, 3, 66, 'Feedback', NULL, 1);
+INSERT INTO project_mark VALUES (5, 1, 1, NULL, NULL, NULL, 0);
+INSERT INTO project_mark VALUES (6, 1, 3, NULL, NULL, NULL, 0);
+INSERT INTO project_mark VALUES (7, 3, 1, 60, 'Feedback', NULL, 1);
+INSERT INTO meeting VALUES (1, 1, '2024-01-03 09:00:00', '2024-01-10 09:00:00', '2024-01-10 10:00:00', 'Office', 0,
+                            NULL);
+"""
+
+
+class LegacyDatabaseMigration(unittest.TestCase):
+    def setUp(self):
+        self.db_fd, self.db_path = tempfile.mkstemp()
+        connection = sqlite3.connect(self.db_path)
+        connection.executescript(BASELINE_SCHEMA + BASELINE_DATA)
+        connection.close()
+
+    def tearDown(self):
+        os.close(self.db_fd)
+        os.unlink(self.db_path)
+
+    def migrated_app(self):
+        return create_app({
+            'SQLALCHEMY_DATABASE_URI': f'sqlite:///{self.db_path}',
+            'TESTING': True,
+            'SECRET_KEY': 'test',
+            'SERVER_NAME': 'localhost'
+        })
+
+    def test_brings_baseline_schema_up_to_date(self):
+        flask_app = self.migrated_app()
+        with flask_app.app_context():
+            inspector = inspect(db.engine)
+            # Reflection skips expression indexes, so they are listed from sqlite_master
+            indexes = set(db.session.scalars(text("SELECT name FROM sqlite_master WHERE type = 'index'")))
+            for table in db.metadata.sorted_tables:
+                columns = {column['name'] for column in inspector.get_columns(table.name)}
+                self.assertEqual(columns, {column.name for column in table.columns}, table.name)
+                self.assertTrue({index.name for index in table.indexes} <= indexes, table.name)
+            secrets = dict(db.session.execute(select(User.id, User.calendar_secret)).all())
+            self.assertEqual(len(set(secrets.values()) - {None}), 5)
+            db.session.remove()
+            db.engine.dispose()
+        with self.migrated_app().app_context():  # every migration is safe to run again
+            self.assertEqual(dict(db.session.execute(select(User.id, User.calendar_secret)).all()), secrets)
+            db.session.remove()
+            db.engine.dispose()
+
+    def test_builds_marking_rounds_from_existing_marks(self):
+        for _ in range(2):  # the second start-up finds every mark already in a round
+            flask_app = self.migrated_app()
+            with flask_app.app_context():
+                projects = {project.id: project for project in Project.query}
+                self.assertEqual([(r.round_number, r.concordant) for r in projects[1].rounds], [(1, False)])
+                self.assertEqual((projects[1].status, projects[1].final_mark), (ProjectStatus.MARKING, None))
+                self.assertEqual([(r.round_number, r.concordant) for r in projects[2].rounds], [(1, True)])
+                self.assertEqual((projects[2].status, projects[2].final_mark), (ProjectStatus.MARKS_CONFIRMED, 65))
+                self.assertEqual([(r.is_open, len(r.marks)) for r in projects[3].rounds], [(True, 1)])
+                self.assertEqual(Project.query.filter(Project.status == ProjectStatus.MARKING).count(), 2)
+                self.assertFalse(ProjectMark.query.filter_by(finalised=True, round_id=None).count())
+
+                # Marking carries on from the migrated rounds
+                mark = ProjectMark(project_id=3, marker_id=3, mark=62, finalised=True)
+                db.session.add(mark)
+                db.session.flush()
+                self.assertEqual(db.session.get(Project, 3).final_mark, 61)
+                db.session.rollback()
+                db.session.remove()
+                db.engine.dispose()
+
+    def test_migrated_database_serves_dashboards(self):
+        flask_app = self.migrated_app()
+        with flask_app.app_context():
+            g.pop('_login_user', None)
+            client = flask_app.test_client()
+            with client.session_transaction() as session:
+                session['_user_id'] = 1
+            response = client.get(url_for('user.home'))
+            self.assertEqual(response.status_code, 200)
+            self.assertIn(b'Student', response.data)
+            self.assertEqual(db.session.get(User, 3).name, 'Marker')
+            db.session.remove()
+            db.engine.dispose()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,262 @@
+import os
+import socketserver
+import tempfile
+import threading
+import unittest
+import unittest.mock
+from datetime import datetime
+from email import message_from_bytes
+
+from flask import g, url_for
+
+from marker_allocation import allocate_second_markers
+from models import User, Proposal, Project, ProjectMark
+from models.Notification import Notification
+from models.db import db
+from notifications import notify
+
+from app import create_app
+
+
+class SMTPSinkHandler(socketserver.StreamRequestHandler):
+    # Just enough SMTP to accept a session from smtplib, keeping each message instead of delivering it
+    def reply(self, line: str):
+        self.wfile.write(line.encode() + b'\r\n')
+
+    def handle(self):
+        self.reply('220 localhost SMTP sink')
+        recipients = []
+        while line := self.rfile.readline():
+            command = line.decode().strip()
+            verb = command.split(' ', 1)[0].upper()
+            if verb in ('EHLO', 'HELO'):
+                self.reply('250 localhost')
+            elif verb == 'RCPT':
+                address = command.split(':', 1)[1].strip(' <>')
+                if address in self.server.refused:
+                    self.reply('550 No such user')
+                else:
+                    recipients.append(address)
+                    self.reply('250 OK')
+            elif verb == 'DATA':
+                self.reply('354 End data with <CR><LF>.<CR><LF>')
+                data = b''
+                while (line := self.rfile.readline()) != b'.\r\n':
+                    data += line
+                if self.server.failing.intersection(recipients):
+                    self.reply('554 Transaction failed')
+                else:
+                    self.server.messages.append((recipients, message_from_bytes(data)))
+                    self.reply('250 OK')
+                recipients = []
+            elif verb == 'QUIT':
+                self.reply('221 Bye')
+                return
+            else:
+                self.reply('250 OK')
+
+
+class SMTPSink(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+
+    def __init__(self):
+        super().__init__(('127.0.0.1', 0), SMTPSinkHandler)
+        self.messages = []
+        self.refused = set()
+        self.failing = set()  # accepted as recipients, but their messages are rejected
+
+
+class NotificationOutbox(unittest.TestCase):
+    def setUp(self):
+        self.smtp = SMTPSink()
+        threading.Thread(target=self.smtp.serve_forever, daemon=True).start()
+        self.db_fd, self.db_path = tempfile.mkstemp()
+        self.flask_app = create_app({
+            'SQLALCHEMY_DATABASE_URI': f'sqlite:///{self.db_path}',
+            'TESTING': True,
+            'SECRET_KEY': 'test',
+            'SERVER_NAME': 'localhost',
+            'MAIL_SERVER': '127.0.0.1',
+            'MAIL_PORT': self.smtp.server_address[1]
+        })
+        self.app_context = self.flask_app.app_context()
+        self.app_context.push()
+        db.drop_all()
+        db.create_all()
+        self.outbox = self.flask_app.extensions['notification_outbox']
+
+        self.student = User(email="student@example.com", name="Student", password_hash="x")
+        self.supervisor = User(email="supervisor@example.com", name="Supervisor", password_hash="x",
+                               is_supervisor=True)
+        self.marker = User(email="marker@example.com", name="Marker", password_hash="x", is_supervisor=True)
+        self.admin = User(email="admin@example.com", name="Admin", password_hash="x", is_admin=True)
+        db.session.add_all([self.student, self.supervisor, self.marker, self.admin])
+        db.session.commit()
+
+    def tearDown(self):
+        self.smtp.shutdown()
+        self.smtp.server_close()
+        db.session.remove()
+        db.drop_all()
+        db.engine.dispose()
+        self.app_context.pop()
+        os.close(self.db_fd)
+        os.unlink(self.db_path)
+
+    def client_for(self, user: User):
+        g.pop('_login_user', None)  # requests share the test's app context, so drop the user loaded by the last one
+        client = self.flask_app.test_client()
+        with client.session_transaction() as session:
+            session['_user_id'] = user.id
+        return client
+
+    def pending(self, user: User) -> [str]:
+        return [n.subject for n in Notification.query.filter_by(recipient_id=user.id, sent_at=None)
+                .order_by(Notification.id)]
+
+    def create_project(self, submitted: bool = False) -> Project:
+        proposal = Proposal(title="Title", description="Description", student_id=self.student.id,
+                            supervisor_id=self.supervisor.id, accepted_date=datetime.now())
+        db.session.add(proposal)
+        db.session.flush()
+        project = Project(proposal_id=proposal.id, student_id=self.student.id, supervisor_id=self.supervisor.id,
+                          submitted_datetime=datetime.now() if submitted else None)
+        db.session.add(project)
+        db.session.commit()
+        return project
+
+    def test_notification_is_rolled_back_with_its_change(self):
+        notify(self.student.id, 'Subject', 'Body')
+        db.session.rollback()
+        self.assertFalse(Notification.query.count())
+
+    def test_proposal_lifecycle_notifies(self):
+        self.client_for(self.student).post(url_for('proposal.submit_proposal'), data={
+            'title': 'Title', 'description': 'Description', 'supervisor_id': self.supervisor.id})
+        self.assertEqual(self.pending(self.supervisor), ['New proposal: Title'])
+        proposal = Proposal.query.one()
+        self.client_for(self.supervisor).post(url_for('proposal.proposal_action', proposal_id=proposal.id),
+                                              data={'action': 'reject'})
+        self.assertEqual(self.pending(self.student), ['Proposal rejected: Title'])
+
+    def test_accepted_proposal_notifies_student(self):
+        proposal = Proposal(title="Title", description="Description", student_id=self.student.id,
+                            supervisor_id=self.supervisor.id)
+        db.session.add(proposal)
+        db.session.commit()
+        self.client_for(self.supervisor).post(url_for('proposal.proposal_action', proposal_id=proposal.id),
+                                              data={'action': 'accept'})
+        self.assertEqual(self.pending(self.student), ['Proposal accepted: Title'])
+
+    def test_marker_assignment_notifies_marker(self):
+        project = self.create_project()
+        client = self.client_for(self.admin)
+        for _ in range(2):
+            client.post(url_for('project.add_marker', project_id=project.id), data={'add_marker_id': self.marker.id})
+        self.assertEqual(self.pending(self.marker), ['Second marker: Title'])
+
+    def test_marker_allocation_notifies_markers(self):
+        self.create_project(submitted=True)
+        plan = allocate_second_markers()
+        self.assertEqual(len(plan), 1)
+        self.assertEqual(self.pending(self.marker), ['Second marker: Title'])
+
+    def test_non_concordant_marks_notify_both_markers(self):
+        project = self.create_project(submitted=True)
+        project.second_marker_id = self.marker.id
+        marks = [ProjectMark(project_id=project.id, marker_id=self.supervisor.id),
+                 ProjectMark(project_id=project.id, marker_id=self.marker.id)]
+        db.session.add_all(marks)
+        db.session.commit()
+        for user, mark, grade in ((self.supervisor, marks[0], 50), (self.marker, marks[1], 70)):
+            self.client_for(user).post(url_for('project.submit_mark', mark_id=mark.id),
+                                       data={'grade': grade, 'feedback': 'Feedback'})
+        for user in (self.supervisor, self.marker):
+            self.assertEqual(self.pending(user), ['Marks not concordant: Title'])
+
+    def test_sends_one_digest_per_recipient(self):
+        for number in range(3):
+            notify(self.student.id, f'Update {number}', f'Body {number}')
+        notify(self.supervisor.id, 'Only update', 'Body')
+        db.session.commit()
+
+        self.assertEqual(self.outbox.drain(), 2)
+        messages = {recipients[0]: message for recipients, message in self.smtp.messages}
+        self.assertEqual(len(self.smtp.messages), 2)
+        digest = messages['student@example.com']
+        self.assertEqual(digest['Subject'], '3 updates on your dissertation projects')
+        self.assertEqual(digest['From'], 'dms@localhost')
+        for number in range(3):
+            self.assertIn(f'Update {number}', digest.get_payload())
+        self.assertEqual(messages['supervisor@example.com']['Subject'], 'Only update')
+        self.assertFalse(Notification.query.filter_by(sent_at=None).count())
+        self.assertEqual(self.outbox.drain(), 0)
+        self.assertEqual(len(self.smtp.messages), 2)
+
+    def test_claims_in_batches(self):
+        self.outbox.batch_size = 2
+        for user in (self.student, self.supervisor, self.marker):
+            notify(user.id, 'Update', 'Body')
+        db.session.commit()
+        self.assertEqual(self.outbox.drain(), 3)
+        self.assertEqual(len(self.smtp.messages), 3)
+
+    def test_refused_recipient_is_retried(self):
+        self.smtp.refused.add('student@example.com')
+        notify(self.student.id, 'Update', 'Body')
+        notify(self.supervisor.id, 'Update', 'Body')
+        db.session.commit()
+        self.assertEqual(self.outbox.drain(), 1)
+        self.assertEqual(self.pending(self.student), ['Update'])
+        self.assertEqual(self.outbox.drain(), 0)  # still claimed by the failed attempt
+
+        self.smtp.refused.clear()
+        self.outbox.claim_timeout = self.outbox.claim_timeout * 0
+        self.assertEqual(self.outbox.drain(), 1)
+        self.assertEqual(Notification.query.filter_by(recipient_id=self.student.id).one().attempts, 2)
+
+    def test_gives_up_after_max_attempts(self):
+        self.smtp.refused.add('student@example.com')
+        self.outbox.claim_timeout = self.outbox.claim_timeout * 0
+        notify(self.student.id, 'Update', 'Body')
+        db.session.commit()
+        with self.assertLogs(self.flask_app.logger, 'ERROR') as logs:
+            self.outbox.drain()  # each claim lapses at once, so every attempt is made in this one drain
+        notification = Notification.query.one()
+        self.assertIn(f'Gave up on 1 notification(s) after {self.outbox.max_attempts} attempts: {notification.id}',
+                      logs.output[-1])
+        self.assertEqual(notification.attempts, self.outbox.max_attempts)
+        self.assertIsNotNone(notification.failed_at)
+        self.assertEqual(self.outbox.drain(), 0)
+        self.assertEqual(Notification.query.one().attempts, self.outbox.max_attempts)
+
+    def test_failed_digest_does_not_stop_the_batch(self):
+        self.smtp.failing.add('student@example.com')
+        notify(self.student.id, 'Update', 'Body')
+        notify(self.supervisor.id, 'Update', 'Body')
+        db.session.commit()
+        with self.assertLogs(self.flask_app.logger, 'WARNING'):
+            self.assertEqual(self.outbox.drain(), 1)
+        self.assertEqual([recipients for recipients, _ in self.smtp.messages], [['supervisor@example.com']])
+        self.assertEqual(self.pending(self.student), ['Update'])
+        self.assertEqual(self.pending(self.supervisor), [])
+
+    def test_send_command(self):
+        notify(self.student.id, 'Update', 'Body')
+        db.session.commit()
+        result = self.flask_app.test_cli_runner().invoke(args=['send-notifications'])
+        self.assertEqual(result.output.strip(), 'Sent 1 notification digest(s).')
+        self.assertEqual(len(self.smtp.messages), 1)
+
+    def test_worker_only_runs_in_the_process_that_runs_jobs(self):
+        config = {'SQLALCHEMY_DATABASE_URI': f'sqlite:///{self.db_path}', 'JOB_WORKERS': 0}
+        with unittest.mock.patch('notifications.Thread') as thread:
+            create_app(config)  # as in a CLI command or a server that leaves jobs to `flask jobs worker`
+            thread.assert_not_called()
+            outbox = create_app(dict(config, JOB_RUN_IN_PROCESS=True)).extensions['notification_outbox']
+        thread.assert_called_once_with(target=outbox.work, name='notification-outbox', daemon=True)
+        thread.return_value.start.assert_called_once_with()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,16 +1,24 @@
 import os
+import re
 import tempfile
 import unittest
 import unittest.mock
 from datetime import datetime, timedelta
 
+from sqlalchemy import event, func, inspect, select
 from sqlalchemy.exc import IntegrityError
 from flask import url_for
 from flask.testing import FlaskClient
 
 from exceptions import NoConcordantProjectMarks
-
-from models import User, Proposal, Project, ProjectMark, Meeting
+from benchmarks.cohort import generate_cohort
+from marker_allocation import allocate_second_markers, apply_allocation
+from project_archive import archive_projects
+
+from models import User, Proposal, Project, ProjectMark, Meeting, MeetingSeries, MarkingRound
+from models.MarkingRound import MarkingRoundState
+from models.Job import Job, JobState
+from models.Notification import Notification
 from models.Project import ProjectStatus
 
 from models.db import db
@@ -131,6 +139,7 @@ class ProjectManipulation(unittest.TestCase):
     def tearDown(self):
         db.session.remove()
         db.drop_all()
+        db.engine.dispose()
         self.app_context.pop()
         os.close(self.db_fd)
         os.unlink(self.db_path)
@@ -388,6 +397,37 @@ class ProjectManipulation(unittest.TestCase):
         ).all()
         self.assertEqual(len(new_marks), 2)
 
+    def test_records_marking_rounds_for_non_concordant_then_concordant_marks(self):
+        self.submitted_project.second_marker_id = self.supervisor_user2.id
+        second_mark = ProjectMark(project_id=self.submitted_project.id, marker_id=self.supervisor_user2.id)
+        db.session.add(second_mark)
+        supervisor_mark = ProjectMark.query.filter_by(project_id=self.submitted_project.id,
+                                                      marker_id=self.supervisor_user.id).first()
+        supervisor_mark.mark = 80
+        supervisor_mark.finalised = True
+        db.session.commit()
+        self.assertEqual(self.submitted_project.current_round.round_number, 1)
+        self.assertTrue(self.submitted_project.current_round.is_open)
+
+        client = self.login(self.supervisor_user2)
+        client.post(url_for('project.submit_mark', mark_id=second_mark.id), data={'grade': 60, 'feedback': 'Low'})
+        first_round, second_round = self.submitted_project.rounds
+        self.assertEqual(first_round.state, MarkingRoundState.CLOSED)
+        self.assertFalse(first_round.concordant)
+        self.assertIsNone(first_round.resolved_mark)
+        self.assertEqual(second_round.round_number, 2)
+        self.assertEqual(len(second_round.marks), 2)
+
+        for mark, grade in zip(second_round.marks, [70, 74]):
+            client = self.login(mark.marker)
+            client.post(url_for('project.submit_mark', mark_id=mark.id), data={'grade': grade, 'feedback': 'Ok'})
+        db.session.refresh(second_round)
+        self.assertEqual(second_round.state, MarkingRoundState.CLOSED)
+        self.assertTrue(second_round.concordant)
+        self.assertEqual(self.submitted_project.final_mark, 72)
+        self.assertEqual(self.submitted_project.status, ProjectStatus.MARKS_CONFIRMED)
+        self.assertEqual(MarkingRound.query.filter_by(project_id=self.submitted_project.id).count(), 2)
+
     def test_returns_final_mark_when_concordant_marks_exist(self):
         mark1 = ProjectMark(project_id=self.project.id, marker_id=self.supervisor_user.id, mark=80, finalised=True)
         mark2 = ProjectMark(project_id=self.project.id, marker_id=self.inactive_supervisor_user.id, mark=82,
@@ -435,6 +475,46 @@ class ProjectManipulation(unittest.TestCase):
         db.session.commit()
         self.assertNotEqual(self.project.status, ProjectStatus.MARKING)
 
+    def assert_sql_status_matches(self, project: Project):
+        db.session.expire_all()
+        sql_status = db.session.scalar(db.select(Project.status).where(Project.id == project.id))
+        self.assertEqual(sql_status, project.status)
+        return sql_status
+
+    def test_sql_status_matches_python_status(self):
+        self.assertEqual(self.assert_sql_status_matches(self.project), ProjectStatus.ACTIVE)
+        self.assertEqual(self.assert_sql_status_matches(self.submitted_project), ProjectStatus.SUBMITTED)
+
+        supervisor_mark = ProjectMark.query.filter_by(project_id=self.submitted_project.id).first()
+        supervisor_mark.mark = 80
+        supervisor_mark.finalised = True
+        db.session.commit()
+        self.assertEqual(self.assert_sql_status_matches(self.submitted_project), ProjectStatus.MARKING)
+
+        db.session.add(ProjectMark(project_id=self.submitted_project.id, marker_id=self.supervisor_user2.id, mark=90,
+                                   finalised=True))
+        db.session.commit()
+        self.assertEqual(self.assert_sql_status_matches(self.submitted_project), ProjectStatus.MARKING)
+
+        db.session.add_all([
+            ProjectMark(project_id=self.submitted_project.id, marker_id=self.supervisor_user.id, mark=84,
+                        finalised=True),
+            ProjectMark(project_id=self.submitted_project.id, marker_id=self.supervisor_user2.id, mark=86,
+                        finalised=True)
+        ])
+        db.session.commit()
+        self.assertEqual(self.assert_sql_status_matches(self.submitted_project), ProjectStatus.MARKS_CONFIRMED)
+
+        self.submitted_project.archive()
+        self.assertEqual(self.assert_sql_status_matches(self.submitted_project), ProjectStatus.ARCHIVED)
+
+    def test_filters_projects_by_status_in_sql(self):
+        active = Project.query.filter(Project.status == ProjectStatus.ACTIVE).all()
+        self.assertEqual(active, [self.project])
+        open_projects = Project.query.filter(
+            Project.status.in_([ProjectStatus.SUBMITTED, ProjectStatus.MARKING])).all()
+        self.assertEqual(open_projects, [self.submitted_project])
+
     def test_removes_second_marker_successfully(self):
         self.project.second_marker_id = self.inactive_supervisor_user.id
         db.session.commit()
@@ -813,6 +893,384 @@ class ProjectManipulation(unittest.TestCase):
             db.session.refresh(meeting)
             self.assertNotEqual(meeting.meeting_end, datetime.now() - timedelta(hours=1))
 
+    def create_series(self, repeat: str = 'weekly', occurrences: int = 4, skip_dates: str = '', **form):
+        client = self.login(self.supervisor_user)
+        return client.post(url_for('project.create_meeting', project_id=self.project.id), data={
+            'meeting_start': '2030-01-07T10:00', 'meeting_end': '11:00', 'location': 'Room 101', 'repeat': repeat,
+            'occurrences': occurrences, 'skip_dates': skip_dates, **form
+        }, follow_redirects=True)
+
+    def series_starts(self) -> [datetime]:
+        return [m.meeting_start for m in Meeting.query.filter_by(project_id=self.project.id).order_by(
+            Meeting.meeting_start)]
+
+    def test_creates_meeting_series_in_one_insert(self):
+        statements = []
+
+        def record(conn, cursor, statement, parameters, context, executemany):
+            if statement.startswith('INSERT INTO meeting '):
+                statements.append(executemany)
+
+        event.listen(db.engine, "before_cursor_execute", record)
+        try:
+            response = self.create_series('fortnightly', 3, skip_dates='2030-01-21')
+        finally:
+            event.remove(db.engine, "before_cursor_execute", record)
+        self.assertIn(b'3 fortnightly meetings created.', response.data)
+        self.assertEqual(statements, [True])
+        self.assertEqual(self.series_starts(), [datetime(2030, 1, 7, 10), datetime(2030, 2, 4, 10),
+                                                datetime(2030, 2, 18, 10)])
+        series = MeetingSeries.query.one()
+        self.assertEqual(series.interval_weeks, 2)
+        self.assertEqual([m.meeting_end for m in series.meetings][-1], datetime(2030, 2, 18, 11))
+
+    def test_refuses_invalid_series_before_inserting(self):
+        response = self.create_series(meeting_end='09:00')
+        self.assertIn(b'Meeting series not created: The meeting on 2030-01-07 would end before it starts.',
+                      response.data)
+        response = self.create_series(occurrences=0)
+        self.assertIn(b'A series must have between 1 and 52 meetings.', response.data)
+        response = self.create_series('daily')
+        self.assertIn(b'Meetings can only repeat weekly or fortnightly.', response.data)
+        response = self.create_series(skip_dates='next week')
+        self.assertIn(b'Meeting series not created', response.data)
+        self.assertEqual(Meeting.query.count(), 0)
+        self.assertEqual(MeetingSeries.query.count(), 0)
+
+    def test_edits_one_occurrence_or_rest_of_series(self):
+        self.create_series()
+        first, second, third, fourth = Meeting.query.order_by(Meeting.meeting_start).all()
+        client = self.login(self.supervisor_user)
+        client.post(url_for('project.edit_meeting', meeting_id=first.id), data={
+            'meeting_start': '2030-01-07T09:00', 'attendance': 1, 'outcome_notes': 'Kick-off'})
+        self.assertEqual(self.series_starts()[:2], [datetime(2030, 1, 7, 9), datetime(2030, 1, 14, 10)])
+
+        response = client.post(url_for('project.edit_meeting', meeting_id=second.id), data={
+            'meeting_start': '2030-01-15T14:00', 'meeting_end': '2030-01-15T15:30', 'scope': 'following',
+            'attendance': 1, 'outcome_notes': 'Moved to Tuesdays'}, follow_redirects=True)
+        self.assertIn(b'3 meetings updated.', response.data)
+        self.assertEqual(self.series_starts(), [datetime(2030, 1, 7, 9), datetime(2030, 1, 15, 14),
+                                                datetime(2030, 1, 22, 14), datetime(2030, 1, 29, 14)])
+        db.session.refresh(fourth)
+        self.assertEqual(fourth.meeting_end, datetime(2030, 1, 29, 15, 30))
+        self.assertFalse(fourth.attendance)
+        self.assertIsNone(fourth.outcome_notes)
+
+    def test_deletes_rest_of_series(self):
+        self.create_series()
+        first, second, third, fourth = Meeting.query.order_by(Meeting.meeting_start).all()
+        client = self.login(self.supervisor_user)
+        response = client.post(url_for('project.delete_meeting', meeting_id=third.id), data={'scope': 'following'},
+                               follow_redirects=True)
+        self.assertIn(b'2 meetings deleted.', response.data)
+        self.assertEqual(self.series_starts(), [datetime(2030, 1, 7, 10), datetime(2030, 1, 14, 10)])
+        response = client.post(url_for('project.delete_meeting', meeting_id=first.id), follow_redirects=True)
+        self.assertIn(b'Meeting deleted.', response.data)
+        self.assertEqual(self.series_starts(), [datetime(2030, 1, 14, 10)])
+
+    def test_migration_adds_series_column_to_existing_database(self):
+        db.session.remove()
+        with db.engine.begin() as connection:
+            # The meeting table as it was before series, which SQLite cannot get back to with DROP COLUMN
+            connection.exec_driver_sql('DROP TABLE meeting')
+            connection.exec_driver_sql(
+                'CREATE TABLE meeting (id INTEGER PRIMARY KEY, project_id INTEGER NOT NULL REFERENCES project (id), '
+                'created_at DATETIME, meeting_start DATETIME NOT NULL, meeting_end DATETIME, location VARCHAR(120), '
+                'attendance BOOLEAN NOT NULL, outcome_notes TEXT)')
+        db.engine.dispose()
+        flask_app = create_app({'SQLALCHEMY_DATABASE_URI': f'sqlite:///{self.db_path}', 'TESTING': True})
+        with flask_app.app_context():
+            inspector = inspect(db.engine)
+            self.assertIn('series_id', {column['name'] for column in inspector.get_columns('meeting')})
+            self.assertIn('ix_meeting_series_start', {index['name'] for index in inspector.get_indexes('meeting')})
+            db.engine.dispose()
+
+
+class MarkerAllocation(unittest.TestCase):
+    def setUp(self):
+        self.db_fd, self.db_path = tempfile.mkstemp()
+        self.flask_app = create_app({
+            'SQLALCHEMY_DATABASE_URI': f'sqlite:///{self.db_path}',
+            'TESTING': True,
+            'SECRET_KEY': 'test',
+            'SERVER_NAME': 'localhost',
+            'JOB_RUN_IN_PROCESS': True
+        })
+        self.app_context = self.flask_app.app_context()
+        self.app_context.push()
+        db.drop_all()
+        db.create_all()
+        self.admin = User(email="admin@example.com", name="Admin", password_hash="x", is_admin=True)
+        self.supervisors = [User(email=f"supervisor{i}@example.com", name=f"Supervisor {i}", password_hash="x",
+                                 is_supervisor=True) for i in range(3)]
+        self.inactive = User(email="inactive@example.com", name="Inactive", password_hash="x", is_supervisor=True,
+                             active=False)
+        db.session.add_all([self.admin, self.inactive] + self.supervisors)
+        db.session.commit()
+        self.student_count = 0
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        db.engine.dispose()
+        self.app_context.pop()
+        os.close(self.db_fd)
+        os.unlink(self.db_path)
+
+    def add_project(self, supervisor: User, second_marker: User = None, submitted: bool = True) -> Project:
+        self.student_count += 1
+        student = User(email=f"student{self.student_count}@example.com", name=f"Student {self.student_count}",
+                       password_hash="x")
+        db.session.add(student)
+        db.session.flush()
+        proposal = Proposal(title=f"Project {self.student_count}", description="Description", student_id=student.id,
+                            supervisor_id=supervisor.id, accepted_date=datetime.now())
+        db.session.add(proposal)
+        db.session.flush()
+        project = Project(proposal_id=proposal.id, student_id=student.id, supervisor_id=supervisor.id,
+                          second_marker_id=second_marker.id if second_marker else None,
+                          submitted_datetime=datetime.now() if submitted else None)
+        db.session.add(project)
+        db.session.flush()
+        db.session.add(ProjectMark(project_id=project.id, marker_id=supervisor.id))
+        db.session.commit()
+        return project
+
+    def test_balances_marking_load_and_respects_constraints(self):
+        first, second, third = self.supervisors
+        # Second already marks two projects, so third should take most of the new ones
+        self.add_project(first, second)
+        self.add_project(first, second)
+        projects = [self.add_project(first) for _ in range(4)]
+        self.add_project(first, submitted=False)
+        plan = allocate_second_markers(dry_run=True)
+        self.assertEqual(sorted(project_id for project_id, *_ in plan.assignments), [p.id for p in projects])
+        markers = [marker_id for *_, marker_id in plan.assignments]
+        self.assertNotIn(first.id, markers)
+        self.assertNotIn(self.inactive.id, markers)
+        self.assertEqual((markers.count(second.id), markers.count(third.id)), (1, 3))
+        self.assertEqual({user_id: after for user_id, (_, _, after) in plan.loads.items()},
+                         {first.id: 6, second.id: 3, third.id: 3})
+        self.assertIsNone(db.session.get(Project, projects[0].id).second_marker_id)
+
+    def test_allocates_markers_and_marks_in_one_pass(self):
+        first, second, _ = self.supervisors
+        projects = [self.add_project(first) for _ in range(3)]
+        # A marker with an outstanding mark on the project keeps it rather than getting a second one
+        db.session.add(ProjectMark(project_id=projects[0].id, marker_id=second.id))
+        db.session.commit()
+        plan = allocate_second_markers()
+        self.assertEqual(len(plan), 3)
+        for project in projects:
+            db.session.refresh(project)
+            self.assertIsNotNone(project.second_marker_id)
+            self.assertEqual(ProjectMark.query.filter_by(project_id=project.id, marker_id=project.second_marker_id,
+                                                         finalised=False).count(), 1)
+        self.assertEqual(len(allocate_second_markers()), 0)
+
+    def test_reports_projects_without_an_eligible_marker(self):
+        first, second, third = self.supervisors
+        second.active = third.active = False
+        db.session.commit()
+        project = self.add_project(first)
+        plan = allocate_second_markers()
+        self.assertEqual(plan.unassigned, [(project.id, project.proposal.title)])
+        self.assertIsNone(db.session.get(Project, project.id).second_marker_id)
+
+    def test_admin_previews_then_confirms_allocation(self):
+        project = self.add_project(self.supervisors[0])
+        client = self.flask_app.test_client()
+        with client.session_transaction() as session:
+            session['_user_id'] = self.admin.id
+        preview = client.get(url_for('project.allocate_markers'))
+        self.assertIn(b'Confirm Allocation', preview.data)
+        self.assertIn(b'Supervisor 1', preview.data)
+        self.assertIsNone(db.session.get(Project, project.id).second_marker_id)
+        response = client.post(url_for('project.allocate_markers'), data={'plan': self.previewed_plan(preview)},
+                               follow_redirects=True)
+        self.assertIn(b'Allocation queued as job #', response.data)
+        self.assertEqual(self.job_message(), '1 second marker(s) allocated.')
+        db.session.refresh(project)
+        self.assertEqual(project.second_marker_id, self.supervisors[1].id)
+
+    def previewed_plan(self, preview) -> str:
+        return re.search(rb'name="plan" value="([^"]+)"', preview.data).group(1).decode()
+
+    def job_message(self) -> str:
+        self.flask_app.extensions['job_queue'].wait(timeout=30)
+        db.session.expire_all()
+        job = db.session.scalars(select(Job)).one()
+        self.assertEqual(job.state, JobState.SUCCEEDED)
+        return job.message
+
+    def test_confirming_applies_only_the_previewed_allocation(self):
+        first, second, third = self.supervisors
+        projects = [self.add_project(first) for _ in range(2)]
+        client = self.flask_app.test_client()
+        with client.session_transaction() as session:
+            session['_user_id'] = self.admin.id
+        plan = self.previewed_plan(client.get(url_for('project.allocate_markers')))
+        # Between preview and confirmation one project is given a marker by hand and another is submitted
+        projects[0].second_marker_id = third.id
+        db.session.commit()
+        late = self.add_project(first)
+        client.post(url_for('project.allocate_markers'), data={'plan': plan})
+        self.assertEqual(self.job_message(), '1 second marker(s) allocated. 1 project(s) changed since the preview '
+                                             'and were left as they are.')
+        for project in projects + [late]:
+            db.session.refresh(project)
+        self.assertEqual(projects[0].second_marker_id, third.id)
+        self.assertIn(projects[1].second_marker_id, (second.id, third.id))
+        self.assertIsNone(late.second_marker_id)
+
+    def test_allocation_job_reports_progress_per_project_and_can_be_run_again(self):
+        first = self.supervisors[0]
+        projects = [self.add_project(first) for _ in range(2)]
+        client = self.flask_app.test_client()
+        with client.session_transaction() as session:
+            session['_user_id'] = self.admin.id
+        client.post(url_for('project.allocate_markers'),
+                    data={'plan': self.previewed_plan(client.get(url_for('project.allocate_markers')))})
+        self.assertEqual(self.job_message(), '2 second marker(s) allocated.')
+        job = db.session.scalars(select(Job)).one()
+        self.assertEqual((job.progress, job.total), (2, 2))
+        # As when the job is requeued after an interruption: nothing is assigned or notified again
+        notifications = Notification.query.count()
+        progress = unittest.mock.Mock()
+        for project in projects:
+            db.session.refresh(project)
+        self.assertEqual(apply_allocation([[p.id, p.second_marker_id] for p in projects], progress=progress), [])
+        self.assertEqual(progress.call_args_list, [unittest.mock.call(1), unittest.mock.call(2)])
+        self.assertEqual(Notification.query.count(), notifications)
+
+    def test_refuses_tampered_allocation(self):
+        project = self.add_project(self.supervisors[0])
+        client = self.flask_app.test_client()
+        with client.session_transaction() as session:
+            session['_user_id'] = self.admin.id
+        for plan in ('', f'[[{project.id}, {self.inactive.id}]]'):
+            response = client.post(url_for('project.allocate_markers'), data={'plan': plan}, follow_redirects=True)
+            self.assertIn(b'The allocation preview has expired, please review it again.', response.data)
+        self.assertIsNone(db.session.get(Project, project.id).second_marker_id)
+
+    def test_non_admin_cannot_allocate(self):
+        project = self.add_project(self.supervisors[0])
+        client = self.flask_app.test_client()
+        with client.session_transaction() as session:
+            session['_user_id'] = self.supervisors[1].id
+        response = client.post(url_for('project.allocate_markers'), follow_redirects=True)
+        self.assertIn(b'Only admins can allocate second markers.', response.data)
+        self.assertIsNone(db.session.get(Project, project.id).second_marker_id)
+
+    def test_allocate_command_supports_dry_run(self):
+        project = self.add_project(self.supervisors[0])
+        result = self.flask_app.test_cli_runner().invoke(args=['project', 'allocate-markers', '--dry-run'])
+        self.assertIn(f'{project.id}: Project 1 -> Supervisor 1', result.output)
+        self.assertIn('Would allocate 1 second marker(s)', result.output)
+        self.assertIsNone(db.session.get(Project, project.id).second_marker_id)
+        result = self.flask_app.test_cli_runner().invoke(args=['project', 'allocate-markers'])
+        self.assertIn('Allocated 1 second marker(s)', result.output)
+
+
+class BulkArchive(unittest.TestCase):
+    def setUp(self):
+        self.db_fd, self.db_path = tempfile.mkstemp()
+        self.flask_app = create_app({
+            'SQLALCHEMY_DATABASE_URI': f'sqlite:///{self.db_path}',
+            'TESTING': True,
+            'SECRET_KEY': 'test',
+            'SERVER_NAME': 'localhost',
+            'JOB_RUN_IN_PROCESS': True
+        })
+        self.app_context = self.flask_app.app_context()
+        self.app_context.push()
+        generate_cohort(scale=0.01)
+        self.before = self.status_counts()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        db.engine.dispose()
+        self.app_context.pop()
+        os.close(self.db_fd)
+        os.unlink(self.db_path)
+
+    def status_counts(self) -> {ProjectStatus: int}:
+        return dict(db.session.execute(select(Project.status, func.count()).group_by(Project.status)).all())
+
+    def assertArchivedEverythingCompleted(self):
+        after = self.status_counts()
+        self.assertEqual(after[ProjectStatus.ARCHIVED], self.before[ProjectStatus.ARCHIVED] +
+                         self.before[ProjectStatus.ACTIVE] + self.before[ProjectStatus.MARKS_CONFIRMED])
+        self.assertNotIn(ProjectStatus.ACTIVE, after)
+        self.assertNotIn(ProjectStatus.MARKS_CONFIRMED, after)
+        for status in (ProjectStatus.SUBMITTED, ProjectStatus.MARKING):
+            self.assertEqual(after[status], self.before[status])
+        self.assertFalse(ProjectMark.query.join(Project).filter(Project.archived_datetime.isnot(None),
+                                                                ProjectMark.finalised == False).count())
+
+    def test_archives_in_chunks_of_set_based_statements(self):
+        finalised = ProjectMark.query.filter_by(finalised=True).count()
+        writes = []
+
+        def record(conn, cursor, statement, parameters, context, executemany):
+            if statement.startswith(('UPDATE', 'DELETE')):
+                writes.append(statement.split()[0])
+
+        chunks = []
+        event.listen(db.engine, "before_cursor_execute", record)
+        try:
+            archived = archive_projects(chunk_size=10, progress=chunks.append)
+        finally:
+            event.remove(db.engine, "before_cursor_execute", record)
+        self.assertEqual(archived, self.before[ProjectStatus.ACTIVE] + self.before[ProjectStatus.MARKS_CONFIRMED])
+        self.assertEqual(chunks[-1], archived)
+        self.assertEqual(writes, ['UPDATE', 'DELETE'] * len(chunks))
+        self.assertArchivedEverythingCompleted()
+        self.assertEqual(ProjectMark.query.filter_by(finalised=True).count(), finalised)
+
+    def test_resumes_after_interruption(self):
+        def interrupt(archived):
+            raise KeyboardInterrupt
+
+        with self.assertRaises(KeyboardInterrupt):
+            archive_projects(chunk_size=10, progress=interrupt)
+        self.assertEqual(self.status_counts()[ProjectStatus.ARCHIVED], self.before[ProjectStatus.ARCHIVED] + 10)
+        self.assertEqual(archive_projects(chunk_size=10) + 10,
+                         self.before[ProjectStatus.ACTIVE] + self.before[ProjectStatus.MARKS_CONFIRMED])
+        self.assertArchivedEverythingCompleted()
+
+    def test_admin_archives_selected_statuses(self):
+        admin = User.query.filter_by(is_admin=True).first()
+        client = self.flask_app.test_client()
+        with client.session_transaction() as session:
+            session['_user_id'] = admin.id
+        preview = client.get(url_for('project.bulk_archive'))
+        self.assertIn(f'Marks Confirmed ({self.before[ProjectStatus.MARKS_CONFIRMED]} projects)'.encode(),
+                      preview.data)
+        response = client.post(url_for('project.bulk_archive'), follow_redirects=True)
+        self.assertIn(b'Select the projects to archive.', response.data)
+        response = client.post(url_for('project.bulk_archive'), data={'status': 'MARKS_CONFIRMED'},
+                               follow_redirects=True)
+        self.assertIn(b'Archiving queued as job #', response.data)
+        self.flask_app.extensions['job_queue'].wait(timeout=30)
+        job = db.session.scalars(select(Job)).one()
+        self.assertEqual((job.state, job.message), (JobState.SUCCEEDED,
+                         f'{self.before[ProjectStatus.MARKS_CONFIRMED]} project(s) archived.'))
+        self.assertEqual((job.progress, job.total), (self.before[ProjectStatus.MARKS_CONFIRMED],) * 2)
+        after = self.status_counts()
+        self.assertNotIn(ProjectStatus.MARKS_CONFIRMED, after)
+        self.assertEqual(after[ProjectStatus.ACTIVE], self.before[ProjectStatus.ACTIVE])
+
+    def test_archive_command(self):
+        runner = self.flask_app.test_cli_runner()
+        result = runner.invoke(args=['project', 'archive', '--status', 'ACTIVE', '--dry-run'])
+        self.assertEqual(result.output.strip(), f'Would archive {self.before[ProjectStatus.ACTIVE]} project(s).')
+        result = runner.invoke(args=['project', 'archive', '--chunk-size', '25'])
+        self.assertEqual(result.exit_code, 0, result.output)
+        self.assertIn('25 archived...', result.output)
+        self.assertArchivedEverythingCompleted()
+
 
 if __name__ == '__main__':
     unittest.main()
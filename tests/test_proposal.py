@@ -6,7 +6,7 @@ import unittest.mock
 from datetime import datetime
 
 import sqlalchemy
-from flask import url_for
+from flask import g, url_for
 from flask.testing import FlaskClient
 
 from exceptions import InvalidStudent, InvalidSupervisor, MaxProposalsReachedError
@@ -66,7 +66,9 @@ class ProposalCreation(unittest.TestCase):
         db.session.commit()
 
     def tearDown(self):
+        db.session.remove()
         db.drop_all()
+        db.engine.dispose()
         self.app_context.pop()
         os.close(self.db_fd)
         os.unlink(self.db_path)
@@ -128,6 +130,22 @@ class ProposalCreation(unittest.TestCase):
         proposal = Proposal(accepted_date=datetime.now(), rejected_date=datetime.now())
         self.assertEqual(proposal.status, ProposalStatus.REJECTED)
 
+    def test_proposal_status_filters_in_sql(self):
+        pending = Proposal(title="Pending", description="Description", student=self.student_user,
+                           supervisor=self.supervisor_user)
+        accepted = Proposal(title="Accepted", description="Description", student=self.student_user,
+                            supervisor=self.supervisor_user, accepted_date=datetime.now())
+        rejected = Proposal(title="Rejected", description="Description", student=self.student_user,
+                            supervisor=self.supervisor_user, accepted_date=datetime.now(),
+                            rejected_date=datetime.now())
+        db.session.add_all([accepted, rejected, pending])
+        db.session.commit()
+        for proposal in [pending, accepted, rejected]:
+            sql_status = db.session.scalar(db.select(Proposal.status).where(Proposal.id == proposal.id))
+            self.assertEqual(sql_status, proposal.status)
+        self.assertEqual(Proposal.query.filter(Proposal.status == ProposalStatus.PENDING).all(), [pending])
+        self.assertEqual(self.student_user.has_pending, [pending])
+
     def test_submits_proposal_successfully(self):
         client = self.login(self.student_user)
         response = client.post(url_for('proposal.submit_proposal'), data={
@@ -198,6 +216,20 @@ class ProposalCreation(unittest.TestCase):
 
         self.assertEqual(new_proposal.student, self.student_user)
 
+    def test_rejects_second_pending_proposal_submission_and_allows_after_rejection(self):
+        client = self.login(self.student_user)
+        data = {'title': 'Test Proposal', 'description': 'Test Description', 'supervisor_id': self.supervisor_user.id}
+        client.post(url_for('proposal.submit_proposal'), data=data)
+        response = client.post(url_for('proposal.submit_proposal'), data=data, follow_redirects=True)
+        self.assertIn(b'Student already has an active proposal.', response.data)
+        self.assertEqual(Proposal.query.filter_by(student_id=self.student_user.id).count(), 1)
+
+        Proposal.query.filter_by(student_id=self.student_user.id).one().rejected_date = datetime.now()
+        db.session.commit()
+        response = client.post(url_for('proposal.submit_proposal'), data=data, follow_redirects=True)
+        self.assertIn(b'Proposal submitted successfully.', response.data)
+        self.assertEqual(Proposal.query.filter_by(student_id=self.student_user.id).count(), 2)
+
     def test_proposal_action_accepts_pending_proposal_and_creates_project(self):
         proposal = Proposal(
             title="Pending Proposal",
@@ -618,7 +650,9 @@ class CatalogProposalManagement(unittest.TestCase):
         db.session.commit()
 
     def tearDown(self):
+        db.session.remove()
         db.drop_all()
+        db.engine.dispose()
         self.app_context.pop()
         os.close(self.db_fd)
         os.unlink(self.db_path)
@@ -808,3 +842,136 @@ class CatalogProposalManagement(unittest.TestCase):
         self.assertEqual(response.status_code, 200)
         self.assertIn(b'You do not have permission to deactivate this catalog proposal.', response.data)
         self.assertTrue(CatalogProposal.query.get(catalog_proposal.id).active)
+
+    def add_catalog(self, *entries: (str, str)) -> [CatalogProposal]:
+        catalog = [CatalogProposal(title=title, description=description, supervisor=self.supervisor_user)
+                   for title, description in entries]
+        db.session.add_all(catalog)
+        db.session.commit()
+        return catalog
+
+    def test_searches_catalog_ranked_by_relevance(self):
+        self.add_catalog(("Blockchain Voting", "Secure elections using a distributed ledger."),
+                         ("Machine Learning for Healthcare", "Predict outcomes with machine learning models."),
+                         ("Compilers", "Optimising code generation, with a little machine learning."))
+        response = self.login(self.student_user).get(url_for('proposal.search_catalog', q='machine learning'))
+        self.assertEqual(response.status_code, 200)
+        titles = [result['title'] for result in response.json['results']]
+        self.assertEqual(titles, ["Machine Learning for Healthcare", "Compilers"])
+        self.assertEqual(response.json['results'][0]['supervisor'], "Supervisor User")
+
+    def test_search_matches_stems_and_prefixes_and_ignores_operators(self):
+        self.add_catalog(("Voting Systems", "Evaluating electronic votes."))
+        client = self.login(self.student_user)
+        for query in ('vote', 'electr', '"voting', 'systems)*'):
+            response = client.get(url_for('proposal.search_catalog', q=query))
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual([r['title'] for r in response.json['results']], ["Voting Systems"], query)
+
+    def test_search_index_follows_updates_deletes_and_withdrawals(self):
+        kept, renamed, deleted = self.add_catalog(("Robotics", "Robot arms."), ("Graphics", "Rendering."),
+                                                  ("Robot Vision", "Cameras."))
+        renamed.title = "Robot Graphics"
+        db.session.delete(deleted)
+        db.session.commit()
+        client = self.login(self.student_user)
+        results = client.get(url_for('proposal.search_catalog', q='robot')).json['results']
+        self.assertEqual(sorted(r['title'] for r in results), ["Robot Graphics", "Robotics"])
+        kept.active = False
+        db.session.commit()
+        results = client.get(url_for('proposal.search_catalog', q='robot')).json['results']
+        self.assertEqual([r['title'] for r in results], ["Robot Graphics"])
+
+    def test_pages_catalog_results(self):
+        self.flask_app.config['CATALOG_PAGE_SIZE'] = 2
+        self.add_catalog(*[(f"Topic {i}", "Shared description.") for i in range(5)])
+        client = self.login(self.student_user)
+        first = client.get(url_for('proposal.search_catalog', q='shared')).json
+        last = client.get(url_for('proposal.search_catalog', q='shared', page=3)).json
+        self.assertEqual((len(first['results']), first['has_next']), (2, True))
+        self.assertEqual((len(last['results']), last['has_next']), (1, False))
+        response = client.get(url_for('proposal.view_catalog', q='shared', page=2))
+        self.assertIn(b'Topic 2', response.data)
+        self.assertNotIn(b'Topic 0', response.data)
+        self.assertIn(b'page=3', response.data)
+
+    def test_migration_builds_search_index_for_existing_catalog(self):
+        self.add_catalog(("Quantum Computing", "Qubits."))
+        db.session.remove()
+        db.engine.dispose()
+        connection = sqlite3.connect(self.db_path)
+        connection.execute("DROP TABLE catalog_proposal_fts")
+        connection.commit()
+        connection.close()
+        create_app({'SQLALCHEMY_DATABASE_URI': f'sqlite:///{self.db_path}', 'TESTING': True})
+        rows, has_next = CatalogProposal.search('quantum', 1, 10)
+        self.assertEqual([row.title for row in rows], ["Quantum Computing"])
+
+    def get_catalog_as(self, client: FlaskClient, **kwargs):
+        g.pop('_login_user', None)  # requests share the test's app context, so drop the user loaded by the last one
+        return client.get(url_for('proposal.view_catalog'), **kwargs)
+
+    def post_as(self, client: FlaskClient, url: str, **kwargs):
+        g.pop('_login_user', None)
+        return client.post(url, **kwargs)
+
+    def test_serves_repeat_catalog_views_from_cache_with_etag(self):
+        self.add_catalog(("Cached Topic", "Rendered once."))
+        cache = self.flask_app.extensions['catalog_cache']
+        client = self.login(self.student_user)
+        first = client.get(url_for('proposal.view_catalog'))
+        second = client.get(url_for('proposal.view_catalog'))
+        self.assertEqual((cache.misses, cache.hits), (1, 1))
+        self.assertEqual(first.data, second.data)
+        self.assertIn(b'Cached Topic', second.data)
+        self.assertTrue(first.headers['ETag'])
+        self.assertIn('no-cache', first.headers['Cache-Control'])
+        not_modified = client.get(url_for('proposal.view_catalog'), headers={'If-None-Match': first.headers['ETag']})
+        self.assertEqual(not_modified.status_code, 304)
+        self.assertEqual(not_modified.data, b'')
+
+    def test_catalog_cache_varies_by_viewer(self):
+        self.add_catalog(("Shared Topic", "Seen by all."))
+        student = self.get_catalog_as(self.login(self.student_user))
+        supervisor = self.get_catalog_as(self.login(self.supervisor_user))
+        other_supervisor = self.get_catalog_as(self.login(self.admin_supervisor_user))
+        self.assertIn(b'Submit a Proposal', student.data)
+        self.assertNotIn(b'Deactivate Proposal', student.data)
+        self.assertIn(b'Deactivate Proposal', supervisor.data)
+        self.assertNotIn(b'Submit a Proposal', supervisor.data)
+        self.assertIn(b'Deactivate Proposal', other_supervisor.data)
+        self.assertEqual(self.flask_app.extensions['catalog_cache'].hits, 0)
+
+    def test_catalog_writes_invalidate_cached_pages(self):
+        entry, = self.add_catalog(("Original Topic", "Before."))
+        cache = self.flask_app.extensions['catalog_cache']
+        student = self.login(self.student_user)
+        etag = self.get_catalog_as(student).headers['ETag']
+        supervisor = self.login(self.supervisor_user)
+        self.post_as(supervisor, url_for('proposal.create_catalog_proposal'),
+                     data={'title': 'Fresh Topic', 'description': 'After.'})
+        self.assertEqual((cache.version, cache.size), (1, 0))
+        response = self.get_catalog_as(student, headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(b'Fresh Topic', response.data)
+        self.post_as(supervisor, url_for('proposal.deactivate_catalog_proposal', proposal_id=entry.id))
+        self.assertEqual(cache.version, 2)
+        self.assertNotIn(b'Original Topic', self.get_catalog_as(student).data)
+
+    def test_supervisor_deactivation_invalidates_cached_pages(self):
+        self.add_catalog(("Leaving Topic", "Supervisor leaves."))
+        student = self.login(self.student_user)
+        self.assertIn(b'Leaving Topic', self.get_catalog_as(student).data)
+        self.post_as(self.login(self.admin_user), url_for('user.deactivate_user', user_id=self.supervisor_user.id))
+        self.assertEqual(self.flask_app.extensions['catalog_cache'].version, 1)
+        response = self.get_catalog_as(student)
+        self.assertNotIn(b'Leaving Topic', response.data)
+        self.assertNotIn(b'Supervisor User (supervisor@example.com)', response.data)
+
+    def test_catalog_cache_is_bounded(self):
+        self.flask_app.extensions['catalog_cache'].max_size = 2
+        client = self.login(self.student_user)
+        for query in ('alpha', 'beta', 'gamma', 'alpha'):
+            client.get(url_for('proposal.view_catalog', q=query))
+        cache = self.flask_app.extensions['catalog_cache']
+        self.assertEqual((cache.size, cache.hits, cache.misses), (2, 0, 4))
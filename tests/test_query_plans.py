@@ -0,0 +1,139 @@
+import os
+import re
+import sqlite3
+import tempfile
+import unittest
+
+from sqlalchemy import event, text
+
+from models import User, Proposal, Project, ProjectMark, Meeting, CatalogProposal
+from models.Proposal import ProposalStatus
+from models.Project import ProjectStatus
+from models.db import db
+from pagination import encode_cursor, keyset_page
+from routes.user import fao_supervisor
+
+from app import create_app
+
+# A read without any index, e.g. "SCAN project_mark" ("SCAN TABLE project_mark" before SQLite 3.36)
+SCAN = re.compile(r'^SCAN (TABLE )?(?P<table>\w+)( AS \w+)?$')
+
+
+def is_full_table_scan(detail: str) -> bool:
+    # Scans of subqueries and CTEs are fine, only tables of the models count
+    match = SCAN.match(detail)
+    return bool(match) and match.group('table') in db.metadata.tables
+
+
+class QueryPlanTests(unittest.TestCase):
+    def setUp(self):
+        self.db_fd, self.db_path = tempfile.mkstemp()
+        self.flask_app = create_app({
+            'SQLALCHEMY_DATABASE_URI': f'sqlite:///{self.db_path}',
+            'TESTING': True,
+            'SECRET_KEY': 'test'
+        })
+        self.app_context = self.flask_app.app_context()
+        self.app_context.push()
+        db.drop_all()
+        db.create_all()
+        self.supervisor = User(email="supervisor@example.com", name="Supervisor", password_hash="x",
+                               is_supervisor=True)
+        self.student = User(email="student@example.com", name="Student", password_hash="x")
+        db.session.add_all([self.supervisor, self.student])
+        db.session.commit()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        db.engine.dispose()
+        self.app_context.pop()
+        os.close(self.db_fd)
+        os.unlink(self.db_path)
+
+    def query_plans(self, run) -> [(str, [str])]:
+        # Runs the queries issued by run(), then explains each with the same parameters
+        statements = []
+
+        def record(conn, cursor, statement, parameters, context, executemany):
+            if statement.lstrip().upper().startswith('SELECT'):
+                statements.append((statement, parameters))
+
+        event.listen(db.engine, "before_cursor_execute", record)
+        try:
+            run()
+        finally:
+            event.remove(db.engine, "before_cursor_execute", record)
+        self.assertTrue(statements)
+        with db.engine.connect() as connection:
+            return [(statement, [row[-1] for row in connection.exec_driver_sql(
+                f'EXPLAIN QUERY PLAN {statement}', parameters)]) for statement, parameters in statements]
+
+    def assertUsesIndexes(self, run):
+        for statement, plan in self.query_plans(run):
+            scans = [detail for detail in plan if is_full_table_scan(detail)]
+            self.assertEqual(scans, [], f'Full table scan in:\n{statement}\n{plan}')
+
+    def test_mark_lookups_use_indexes(self):
+        self.assertUsesIndexes(lambda: ProjectMark.query.filter_by(project_id=1).all())
+        self.assertUsesIndexes(lambda: ProjectMark.query.filter_by(project_id=1, marker_id=2, finalised=0).first())
+        self.assertUsesIndexes(lambda: db.session.query(ProjectMark.marker_id).filter_by(
+            project_id=1, finalised=False).all())
+        self.assertUsesIndexes(lambda: ProjectMark.query.filter_by(round_id=1, finalised=True).all())
+        self.assertUsesIndexes(lambda: self.supervisor.has_unmarked)
+
+    def test_meeting_lookup_uses_index_for_filter_and_order(self):
+        plans = self.query_plans(
+            lambda: Meeting.query.filter_by(project_id=1).order_by(Meeting.meeting_start).all())
+        for statement, plan in plans:
+            self.assertFalse([detail for detail in plan if is_full_table_scan(detail) or 'TEMP B-TREE' in detail],
+                             f'{statement}\n{plan}')
+
+    def test_project_lookups_use_indexes(self):
+        self.assertUsesIndexes(lambda: Project.query.filter_by(supervisor_id=self.supervisor.id).filter(
+            Project.status.not_in([ProjectStatus.MARKS_CONFIRMED, ProjectStatus.ARCHIVED])).all())
+        self.assertUsesIndexes(lambda: Project.query.filter_by(student_id=self.student.id).filter(
+            Project.status == ProjectStatus.ACTIVE).all())
+        self.assertUsesIndexes(lambda: Project.query.filter_by(second_marker_id=self.supervisor.id).all())
+        self.assertUsesIndexes(lambda: Project.query.filter(Project.archived_datetime.is_(None)).all())
+
+    def test_dashboard_and_proposal_lookups_use_indexes(self):
+        self.assertUsesIndexes(lambda: fao_supervisor(self.supervisor))
+        self.assertUsesIndexes(lambda: Proposal.query.filter_by(student_id=self.student.id).filter(
+            Proposal.status == ProposalStatus.PENDING).all())
+        self.assertUsesIndexes(lambda: CatalogProposal.query.filter_by(supervisor_id=self.supervisor.id,
+                                                                       active=True).all())
+        self.assertUsesIndexes(lambda: User.get_active_supervisors())
+        self.assertUsesIndexes(lambda: User.deactivation_blockers([self.supervisor.id, self.student.id]))
+
+    def test_admin_list_pages_seek_in_index_order(self):
+        lists = (User.query.filter_by(is_supervisor=False, is_admin=False, active=True),
+                 User.query.filter_by(is_supervisor=True, active=True))
+        for query in lists:
+            for after, before in ((None, None), (encode_cursor(['Student', 1]), None),
+                                  (None, encode_cursor(['Student', 1]))):
+                plans = self.query_plans(lambda: keyset_page(query, (User.name, User.id), 50, after, before))
+                for statement, plan in plans:
+                    self.assertFalse([detail for detail in plan
+                                      if is_full_table_scan(detail) or 'TEMP B-TREE' in detail],
+                                     f'{statement}\n{plan}')
+
+    def test_migration_adds_indexes_to_existing_database(self):
+        db.session.remove()
+        db.engine.dispose()
+        connection = sqlite3.connect(self.db_path)
+        names = [name for name, in connection.execute(
+            "SELECT name FROM sqlite_master WHERE type = 'index' AND name LIKE 'ix_%'")]
+        self.assertIn('ix_project_mark_project_marker', names)
+        for name in names:
+            connection.execute(f'DROP INDEX {name}')
+        connection.commit()
+        connection.close()
+
+        flask_app = create_app({'SQLALCHEMY_DATABASE_URI': f'sqlite:///{self.db_path}', 'TESTING': True})
+        with flask_app.app_context():
+            migrated = set(db.session.scalars(text("SELECT name FROM sqlite_master WHERE type = 'index'")))
+            db.session.remove()
+            db.engine.dispose()
+        self.assertIn('ix_user_email_lower', names)
+        self.assertTrue(set(names) <= migrated)
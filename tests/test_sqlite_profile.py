@@ -0,0 +1,58 @@
+import os
+import tempfile
+import unittest
+
+from sqlalchemy import text
+
+from models.db import db
+
+from app import create_app
+
+
+class SQLiteProfileTests(unittest.TestCase):
+    def setUp(self):
+        self.db_fd, self.db_path = tempfile.mkstemp()
+        self.app_context = None
+
+    def tearDown(self):
+        if self.app_context is not None:
+            db.session.remove()
+            db.engine.dispose()
+            self.app_context.pop()
+        os.close(self.db_fd)
+        os.unlink(self.db_path)
+
+    def create_app(self, **config):
+        flask_app = create_app({
+            'SQLALCHEMY_DATABASE_URI': f'sqlite:///{self.db_path}',
+            'TESTING': True,
+            'SECRET_KEY': 'test',
+            **config
+        })
+        self.app_context = flask_app.app_context()
+        self.app_context.push()
+        return flask_app
+
+    def pragma(self, name: str):
+        return db.session.execute(text(f'PRAGMA {name}')).scalar()
+
+    def test_production_profile_is_applied_on_connect(self):
+        self.create_app(SQLITE_PROFILE='production')
+        self.assertEqual(self.pragma('journal_mode'), 'wal')
+        self.assertEqual(self.pragma('synchronous'), 1)  # NORMAL
+        self.assertEqual(self.pragma('busy_timeout'), 5000)
+        self.assertEqual(self.pragma('cache_size'), -65536)
+        self.assertEqual(self.pragma('temp_store'), 2)  # MEMORY
+
+    def test_pragmas_can_be_overridden(self):
+        self.create_app(SQLITE_PROFILE='production', SQLITE_PRAGMAS={'busy_timeout': 250})
+        self.assertEqual(self.pragma('busy_timeout'), 250)
+        self.assertEqual(self.pragma('journal_mode'), 'wal')
+
+    def test_default_profile_leaves_sqlite_defaults(self):
+        self.create_app(SQLITE_PROFILE='default')
+        self.assertEqual(self.pragma('journal_mode'), 'delete')
+
+    def test_rejects_unknown_profile(self):
+        with self.assertRaises(ValueError):
+            create_app({'SQLALCHEMY_DATABASE_URI': f'sqlite:///{self.db_path}', 'SQLITE_PROFILE': 'turbo'})
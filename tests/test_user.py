@@ -1,14 +1,23 @@
+import io
 import os
+import re
 import tempfile
 import unittest
 import unittest.mock
+from datetime import datetime
 
-from flask import url_for
+from flask import g, url_for
 from flask.testing import FlaskClient
+from sqlalchemy import event, select
+from werkzeug.security import generate_password_hash
 
-from models import User
+from models import User, Proposal, Project, ProjectMark
+from models.Job import Job, JobState
 
 from models.db import db
+from pagination import encode_cursor
+from routes.user import fao_supervisor
+from user_import import import_users
 
 from app import create_app
 
@@ -20,7 +29,8 @@ class UserManipulation(unittest.TestCase):
             'SQLALCHEMY_DATABASE_URI': f'sqlite:///{self.db_path}',
             'TESTING': True,
             'SECRET_KEY': 'test',
-            'SERVER_NAME': 'localhost'
+            'SERVER_NAME': 'localhost',
+            'JOB_RUN_IN_PROCESS': True
         }
         self.flask_app = create_app(test_config)
         self.app = self.flask_app.test_client()
@@ -70,7 +80,9 @@ class UserManipulation(unittest.TestCase):
         db.session.commit()
 
     def tearDown(self):
+        db.session.remove()
         db.drop_all()
+        db.engine.dispose()
         self.app_context.pop()
         os.close(self.db_fd)
         os.unlink(self.db_path)
@@ -95,6 +107,80 @@ class UserManipulation(unittest.TestCase):
         db.session.refresh(self.student_user)
         self.assertFalse(self.student_user.active)
 
+    def test_bulk_deactivates_eligible_users_and_reports_refused(self):
+        db.session.add(Proposal(title="Pending", description="Description", student_id=self.student_user.id,
+                                supervisor_id=self.supervisor_user.id))
+        db.session.commit()
+        client = self.login(self.admin_user)
+        response = client.post(url_for('user.deactivate_users'), data={
+            'user_ids': [self.student_user.id, self.student_user2.id, self.supervisor_user.id]
+        }, follow_redirects=True)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(b'1 user(s) deactivated successfully.', response.data)
+        self.assertIn(b'Could not deactivate 2 user(s).', response.data)
+        self.assertIn(b'Student User: Cannot deactivate user with pending proposals.', response.data)
+        db.session.refresh(self.student_user)
+        db.session.refresh(self.student_user2)
+        self.assertTrue(self.student_user.active)
+        self.assertFalse(self.student_user2.active)
+
+    def test_bulk_deactivation_refuses_user_blocked_after_check(self):
+        check = User.deactivation_blockers
+        calls = []
+
+        def stale_check(user_ids):
+            calls.append(user_ids)
+            if len(calls) > 1:
+                return check(user_ids)
+            # A proposal is submitted between the eligibility check and the update
+            db.session.add(Proposal(title="Pending", description="Description", student_id=self.student_user.id,
+                                    supervisor_id=self.supervisor_user.id))
+            db.session.flush()
+            return {}
+
+        with unittest.mock.patch.object(User, 'deactivation_blockers', side_effect=stale_check):
+            deactivated, refused = User.bulk_deactivate([self.student_user.id, self.student_user2.id])
+        self.assertEqual(deactivated, [self.student_user2.id])
+        self.assertEqual(refused, {self.student_user.id: ["Cannot deactivate user with pending proposals."]})
+        db.session.refresh(self.student_user)
+        self.assertTrue(self.student_user.active)
+
+    def test_deactivation_blockers_reports_every_reason(self):
+        proposal = Proposal(title="Accepted", description="Description", student_id=self.student_user.id,
+                            supervisor_id=self.supervisor_user.id, accepted_date=datetime.now())
+        db.session.add(proposal)
+        db.session.flush()
+        project = Project(proposal_id=proposal.id, student_id=self.student_user.id,
+                          supervisor_id=self.supervisor_user.id)
+        db.session.add(project)
+        db.session.flush()
+        db.session.add_all([
+            ProjectMark(project_id=project.id, marker_id=self.supervisor_user.id),
+            Proposal(title="Pending", description="Description", student_id=self.student_user2.id,
+                     supervisor_id=self.supervisor_user.id)
+        ])
+        db.session.commit()
+        blockers = User.deactivation_blockers([self.student_user.id, self.student_user2.id,
+                                               self.supervisor_user.id, self.admin_user.id])
+        self.assertEqual(blockers, {
+            self.student_user.id: ["Cannot deactivate user with ongoing projects."],
+            self.student_user2.id: ["Cannot deactivate user with pending proposals."],
+            self.supervisor_user.id: ["Cannot deactivate user with pending proposals.",
+                                      "Cannot deactivate user with ongoing projects.",
+                                      "Cannot deactivate user with unfinalised marks."],
+        })
+
+    def test_deactivate_cli_command_accepts_ids_and_emails(self):
+        runner = self.flask_app.test_cli_runner()
+        result = runner.invoke(args=['user', 'deactivate', 'Student@Example.com', str(self.student_user2.id),
+                                     'missing@example.com', '9999'])
+        self.assertEqual(result.exit_code, 0)
+        self.assertIn('Deactivated 2 user(s), refused 1.', result.output)
+        self.assertIn('missing@example.com: User does not exist.', result.output)
+        self.assertIn('9999: User does not exist.', result.output)
+        db.session.refresh(self.student_user)
+        self.assertFalse(self.student_user.active)
+
     def test_prevents_non_admin_from_deactivating_user(self):
         client = self.login(self.student_user)
         response = client.post(url_for('user.deactivate_user', user_id=self.supervisor_user.id), follow_redirects=True)
@@ -163,6 +249,91 @@ class UserManipulation(unittest.TestCase):
         duplicate_user = User.query.filter_by(name='Duplicate User').first()
         self.assertIsNone(duplicate_user)
 
+    def test_handles_creation_with_email_differing_only_by_case(self):
+        client = self.login(self.admin_user)
+        response = client.post(url_for('user.create_user'), data={
+            'name': 'Duplicate User',
+            'email': 'Student@Example.COM',
+            'password': 'password123',
+            'role': 'supervisor'
+        }, follow_redirects=True)
+        self.assertIn(b'Error: Student@Example.COM already exists.', response.data)
+        self.assertIsNone(User.query.filter_by(name='Duplicate User').first())
+
+    def test_imports_users_from_csv_and_reports_skipped_rows(self):
+        client = self.login(self.admin_user)
+        job = self.import_csv(client, b"name,email,password,role\n"
+                                      b"New Student,new.student@example.com,password123,student\n"
+                                      b"New Supervisor,new.supervisor@example.com,password123,supervisor\n"
+                                      b"Existing,student@example.com,password123,student\n"
+                                      b"Repeated,new.student@example.com,password123,student\n"
+                                      b"No Role,norole@example.com,password123,\n"
+                                      b"Bad Role,badrole@example.com,password123,admin\n")
+        self.assertEqual((job.state, job.progress), (JobState.SUCCEEDED, 6))
+        self.assertEqual(job.message, '2 user(s) imported. 4 row(s) skipped. '
+                                      'Line 4: student@example.com already exists. '
+                                      'Line 5: new.student@example.com already exists. '
+                                      'Line 6: All fields are required. '
+                                      'Line 7: Role must be one of student, supervisor.')
+        self.assertFalse(os.path.exists(job.arguments['path']))  # the upload, with its passwords, is removed
+        supervisor = User.query.filter_by(email='new.supervisor@example.com').first()
+        self.assertTrue(supervisor.is_supervisor)
+        self.assertTrue(supervisor.active)
+        self.assertTrue(supervisor.check_password('password123'))
+        self.assertIsNone(User.query.filter_by(email='badrole@example.com').first())
+
+    def import_csv(self, client: FlaskClient, content: bytes) -> Job:
+        # Uploads a CSV file and returns its import job once it has run
+        response = client.post(url_for('user.import_users_csv'), data={'file': (io.BytesIO(content), 'users.csv')},
+                               content_type='multipart/form-data', follow_redirects=True)
+        self.assertIn(b'Import queued as job #', response.data)
+        self.flask_app.extensions['job_queue'].wait(timeout=30)
+        db.session.expire_all()
+        return db.session.scalars(select(Job).order_by(Job.id.desc())).first()
+
+    def test_import_compares_emails_without_case(self):
+        report = import_users(io.StringIO(
+            "name,email,password,role\n"
+            "Mixed Case,New.Student@Example.com,password123,student\n"
+            "Lower Case,new.student@example.com,password123,student\n"
+            "Existing,Student@Example.com,password123,student\n"
+        ), batch_size=2)
+        self.assertEqual(report.created, 1)
+        self.assertEqual(report.messages(), ['Line 3: new.student@example.com already exists.',
+                                             'Line 4: Student@Example.com already exists.'])
+        self.assertEqual([user.name for user in User.query.filter(User.email.ilike('new.student@example.com'))],
+                         ['Mixed Case'])
+        self.assertEqual(User.query.filter_by(name='Mixed Case').one().email, 'New.Student@Example.com')
+
+    def test_prevents_non_admin_from_importing_users(self):
+        client = self.login(self.student_user)
+        csv_file = io.BytesIO(b"name,email,password,role\nNew,new@example.com,password123,student\n")
+        response = client.post(url_for('user.import_users_csv'), data={'file': (csv_file, 'users.csv')},
+                               content_type='multipart/form-data', follow_redirects=True)
+        self.assertIn(b'Only module leaders can import users.', response.data)
+        self.assertIsNone(User.query.filter_by(email='new@example.com').first())
+
+    def test_import_cli_command_inserts_in_batches(self):
+        csv_fd, csv_path = tempfile.mkstemp(suffix='.csv')
+        with os.fdopen(csv_fd, 'w') as csv_file:
+            csv_file.write("name,email,password,role\n")
+            for i in range(5):
+                csv_file.write(f"Student {i},student{i}@import.example.com,password{i},student\n")
+            csv_file.write("Broken,broken@import.example.com\n")
+        runner = self.flask_app.test_cli_runner()
+        result = runner.invoke(args=['user', 'import', csv_path, '--batch-size', '2', '--workers', '2'])
+        os.unlink(csv_path)
+        self.assertEqual(result.exit_code, 0)
+        self.assertIn('Imported 5 user(s), skipped 1.', result.output)
+        self.assertIn('Line 7: Wrong number of columns.', result.output)
+        self.assertEqual(User.query.filter(User.email.like('%@import.example.com')).count(), 5)
+
+    def test_import_rejects_file_without_required_columns(self):
+        client = self.login(self.admin_user)
+        job = self.import_csv(client, b"name,email\nNew,new@example.com\n")
+        self.assertEqual(job.message, '0 user(s) imported. 1 row(s) skipped. '
+                                      'Line 1: Header must contain name, email, password, role.')
+
     def test_logs_in_user_with_valid_credentials(self):
         client = self.flask_app.test_client()
         user = User(email="validuser@example.com", name="Valid User", active=True)
@@ -176,6 +347,15 @@ class UserManipulation(unittest.TestCase):
         self.assertEqual(response.status_code, 200)
         self.assertIn(b"Welcome", response.data)
 
+    def test_logs_in_imported_user_with_mixed_case_email(self):
+        import_users(io.StringIO("name,email,password,role\nJane Doe,Jane.Doe@Uni.ac.uk,password123,student\n"))
+        for email in ('Jane.Doe@Uni.ac.uk', 'jane.doe@uni.ac.uk', ' JANE.DOE@UNI.AC.UK '):
+            client = self.flask_app.test_client()
+            response = client.post(url_for("auth.login"), data={"email": email, "password": "password123"},
+                                   follow_redirects=True)
+            self.assertIn(b"Welcome", response.data, email)
+            g.pop('_login_user', None)
+
     def test_prevents_login_with_invalid_credentials(self):
         client = self.flask_app.test_client()
         response = client.post(url_for("auth.login"), data={
@@ -198,6 +378,54 @@ class UserManipulation(unittest.TestCase):
         self.assertEqual(response.status_code, 200)
         self.assertIn(b"Your account is inactive", response.data)
 
+    def test_rejects_login_with_503_when_verifier_is_saturated(self):
+        client = self.flask_app.test_client()
+        verifier = self.flask_app.extensions['password_verifier']
+        with unittest.mock.patch.object(verifier, 'slots') as slots:
+            slots.acquire.return_value = False
+            response = client.post(url_for("auth.login"), data={
+                "email": "student@example.com",
+                "password": "password"
+            })
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response.headers['Retry-After'], '5')
+        self.assertIn(b"Too many logins are being processed", response.data)
+        slots.release.assert_not_called()
+
+    def test_upgrades_password_hash_on_successful_login(self):
+        client = self.flask_app.test_client()
+        self.student_user.password_hash = generate_password_hash("password", "pbkdf2:sha256:1000")
+        db.session.commit()
+        response = client.post(url_for("auth.login"), data={
+            "email": "student@example.com",
+            "password": "password"
+        }, follow_redirects=True)
+        self.assertIn(b"Welcome", response.data)
+        db.session.refresh(self.student_user)
+        self.assertTrue(self.student_user.password_hash.startswith("scrypt:"))
+        self.assertTrue(self.student_user.check_password("password"))
+
+    def test_hashes_new_passwords_with_configured_method(self):
+        verifier = self.flask_app.extensions['password_verifier']
+        with unittest.mock.patch.object(verifier, 'method', 'pbkdf2:sha256:1000'):
+            self.student_user.set_password("password")
+            client = self.login(self.admin_user)
+            client.post(url_for('user.create_user'), data={'name': 'New User', 'email': 'newuser@example.com',
+                                                           'password': 'password123', 'role': 'student'})
+            import_users(io.StringIO("name,email,password,role\nImported,imported@example.com,password123,student\n"))
+        hashes = [User.query.filter_by(email=email).one().password_hash
+                  for email in ('student@example.com', 'newuser@example.com', 'imported@example.com')]
+        self.assertEqual([password_hash.split('$', 1)[0] for password_hash in hashes], ['pbkdf2:sha256:1000'] * 3)
+
+    def test_keeps_password_hash_when_login_fails(self):
+        client = self.flask_app.test_client()
+        old_hash = generate_password_hash("password", "pbkdf2:sha256:1000")
+        self.student_user.password_hash = old_hash
+        db.session.commit()
+        client.post(url_for("auth.login"), data={"email": "student@example.com", "password": "wrong"})
+        db.session.refresh(self.student_user)
+        self.assertEqual(self.student_user.password_hash, old_hash)
+
     def test_logs_out_authenticated_user(self):
         client = self.login(self.admin_user)
         response = client.get(url_for("auth.logout"), follow_redirects=True)
@@ -281,6 +509,24 @@ class UserManipulation(unittest.TestCase):
         self.assertIn(b"Password changed successfully.", response.data)
         self.assertTrue(self.student_user.check_password("newpassword123"))
 
+    def test_rejects_password_change_with_503_when_verifier_is_saturated(self):
+        client = self.login(self.student_user)
+        self.student_user.set_password("oldpassword")
+        db.session.commit()
+        verifier = self.flask_app.extensions['password_verifier']
+        with unittest.mock.patch.object(verifier, 'slots') as slots:
+            slots.acquire.return_value = False
+            response = client.post(url_for("user.change_password"), data={
+                "current_password": "oldpassword",
+                "new_password": "newpassword123",
+                "confirm_password": "newpassword123"
+            })
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response.headers['Retry-After'], '5')
+        self.assertIn(b"Too many logins are being processed", response.data)
+        db.session.refresh(self.student_user)
+        self.assertTrue(self.student_user.check_password("oldpassword"))
+
     def test_prevents_password_change_with_incorrect_current_password(self):
         client = self.login(self.student_user)
         self.student_user.set_password("oldpassword")
@@ -352,3 +598,194 @@ class UserManipulation(unittest.TestCase):
         self.assertIn(b'Admin', response.data)
         self.assertNotIn(b'Admin Supervisor', response.data)
         self.assertNotIn(b"You don\xe2\x80\x99t have any proposals or projects yet.", response.data)
+
+    def add_cohort(self, size: int, second_marker: User):
+        offset = User.query.count()
+        for i in range(offset, offset + size):
+            student = User(email=f"cohort{i}@student.example.com", name=f"Cohort Student {i}", password_hash="x")
+            supervisor = User(email=f"cohort{i}@staff.example.com", name=f"Cohort Supervisor {i}", password_hash="x",
+                              is_supervisor=True)
+            db.session.add_all([student, supervisor])
+            db.session.flush()
+            proposal = Proposal(title=f"Project {i}", description="Description", student_id=student.id,
+                                supervisor_id=supervisor.id, accepted_date=datetime.now())
+            db.session.add(proposal)
+            db.session.flush()
+            project = Project(proposal_id=proposal.id, student_id=student.id, supervisor_id=supervisor.id,
+                              second_marker_id=second_marker.id, submitted_datetime=datetime.now())
+            db.session.add(project)
+            db.session.flush()
+            db.session.add_all([
+                ProjectMark(project_id=project.id, marker_id=supervisor.id, mark=60, finalised=True),
+                ProjectMark(project_id=project.id, marker_id=second_marker.id),
+                Proposal(title=f"Follow-up {i}", description="Description", student_id=student.id,
+                         supervisor_id=second_marker.id)
+            ])
+        db.session.commit()
+
+    def count_queries(self, user: User, url: str) -> int:
+        statements = []
+
+        def record(conn, cursor, statement, parameters, context, executemany):
+            statements.append(statement)
+
+        event.listen(db.engine, "before_cursor_execute", record)
+        try:
+            response = self.get_with_login(user, url)
+        finally:
+            event.remove(db.engine, "before_cursor_execute", record)
+        self.assertEqual(response.status_code, 200)
+        return len(statements)
+
+    def test_admin_home_query_count_does_not_grow_with_cohort(self):
+        self.admin_user.is_supervisor = True
+        db.session.commit()
+        self.add_cohort(2, self.admin_user)
+        small_cohort = self.count_queries(self.admin_user, url_for('user.home'))
+        self.add_cohort(10, self.admin_user)
+        large_cohort = self.count_queries(self.admin_user, url_for('user.home'))
+        self.assertEqual(small_cohort, large_cohort)
+        self.assertLessEqual(large_cohort, 8)
+
+    def test_supervisor_dashboard_loads_in_one_statement(self):
+        self.add_cohort(2, self.supervisor_user)
+        self.get_with_login(self.supervisor_user, url_for('user.home'))  # loads the identity into its cache
+        g.pop('_login_user', None)
+        small_cohort = self.count_queries(self.supervisor_user, url_for('user.home'))
+        self.add_cohort(10, self.supervisor_user)
+        g.pop('_login_user', None)
+        response = self.get_with_login(self.supervisor_user, url_for('user.home'))
+        self.assertIn(b'Follow-up 15 by Cohort Student 15', response.data)
+        self.assertIn(b'Project 15 (Cohort Student 15)', response.data)
+        g.pop('_login_user', None)
+        self.assertEqual(self.count_queries(self.supervisor_user, url_for('user.home')), small_cohort)
+
+        db.session.refresh(self.supervisor_user)
+        statements = []
+
+        def record(conn, cursor, statement, parameters, context, executemany):
+            statements.append(statement)
+
+        event.listen(db.engine, "before_cursor_execute", record)
+        try:
+            pending_proposals, projects, marking_projects = fao_supervisor(self.supervisor_user)
+        finally:
+            event.remove(db.engine, "before_cursor_execute", record)
+        self.assertEqual(len(statements), 1)
+        self.assertEqual((len(pending_proposals), len(marking_projects)), (12, 12))
+        self.assertEqual((marking_projects[0].title, marking_projects[0].student),
+                         ("Project 4", "Cohort Student 4"))
+
+    def test_authorises_repeat_requests_from_identity_cache(self):
+        client = self.login(self.admin_user)
+        client.get(url_for('admin.sql_stats'))
+        g.pop('_login_user', None)  # requests share the test's app context, so drop the user loaded by the last one
+        statements = []
+
+        def record(conn, cursor, statement, parameters, context, executemany):
+            statements.append(statement)
+
+        event.listen(db.engine, "before_cursor_execute", record)
+        try:
+            response = client.get(url_for('admin.sql_stats'))
+        finally:
+            event.remove(db.engine, "before_cursor_execute", record)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(statements, [])
+        cache = self.flask_app.extensions['identity_cache']
+        self.assertEqual((cache.hits, cache.misses), (1, 1))
+        self.assertIn(b'Identity Cache', response.data)
+
+    def test_invalidates_cached_identity_when_admin_status_changes(self):
+        supervisor_client = self.login(self.supervisor_user)
+        response = supervisor_client.get(url_for('admin.sql_stats'), follow_redirects=True)
+        self.assertIn(b'Only module leaders can view SQL statistics.', response.data)
+        g.pop('_login_user', None)
+        self.login(self.admin_user).post(url_for('user.change_admin', user_id=self.supervisor_user.id, admin=True))
+        g.pop('_login_user', None)
+        response = supervisor_client.get(url_for('admin.sql_stats'))
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(b'SQL Statistics', response.data)
+
+    def test_invalidates_cached_identity_when_user_is_deactivated(self):
+        student_client = self.login(self.student_user)
+        self.assertEqual(student_client.get(url_for('user.home')).status_code, 200)
+        g.pop('_login_user', None)
+        self.login(self.admin_user).post(url_for('user.deactivate_user', user_id=self.student_user.id))
+        g.pop('_login_user', None)
+        response = student_client.get(url_for('user.home'))
+        self.assertEqual(response.status_code, 302)
+        self.assertIn(url_for('auth.login', _external=False), response.headers['Location'])
+
+    def test_identity_cache_evicts_least_recently_used(self):
+        cache = self.flask_app.extensions['identity_cache']
+        cache.max_size = 2
+        for user in (self.student_user, self.student_user2, self.student_user, self.supervisor_user):
+            cache.get(user.id, User.load_identity)
+        self.assertEqual(list(cache.entries), [self.student_user.id, self.supervisor_user.id])
+        self.assertEqual((cache.hits, cache.misses), (1, 3))
+
+    def add_students(self, count: int, active: bool = True) -> [User]:
+        students = [User(email=f"paged{i}@student.example.com", name=f"Paged Student {i:02d}", password_hash="x",
+                         active=active) for i in range(count)]
+        db.session.add_all(students)
+        db.session.commit()
+        return students
+
+    def test_paginates_students_with_keyset_cursors(self):
+        self.add_students(5)
+        client = self.login(self.admin_user)
+        names = []
+        url = url_for('user.home', per_page=3)
+        for _ in range(4):
+            response = client.get(url)
+            self.assertEqual(response.status_code, 200)
+            page = [name.decode() for name in re.findall(rb'(Paged Student \d+|Student (?:2 )?User) \(', response.data)]
+            names.extend(page)
+            match = re.search(rb'href="([^"]*students_after=[^"]*)"', response.data)
+            if match is None:
+                break
+            url = match.group(1).decode().replace('&amp;', '&')
+        self.assertEqual(names, sorted(names))
+        self.assertEqual(len(names), 7)
+        self.assertEqual(len(set(names)), 7)
+
+    def test_previous_cursor_returns_to_preceding_page(self):
+        self.add_students(5)
+        client = self.login(self.admin_user)
+        first = client.get(url_for('user.home', per_page=2)).data
+        next_url = re.search(rb'href="([^"]*students_after=[^"]*)"', first).group(1).decode().replace('&amp;', '&')
+        second = client.get(next_url).data
+        prev_url = re.search(rb'href="([^"]*students_before=[^"]*)"', second).group(1).decode().replace('&amp;', '&')
+        self.assertEqual(re.findall(rb'Paged Student \d+', client.get(prev_url).data),
+                         re.findall(rb'Paged Student \d+', first))
+
+    def test_filters_students_by_status(self):
+        self.add_students(2, active=False)
+        client = self.login(self.admin_user)
+        response = client.get(url_for('user.home', student_status='inactive'))
+        self.assertIn(b'Paged Student 00', response.data)
+        self.assertNotIn(b'Student User (', response.data)
+        response = client.get(url_for('user.home'))
+        self.assertNotIn(b'Paged Student 00', response.data)
+        self.assertIn(b'Student User (', response.data)
+
+    def test_filters_supervisors_by_role(self):
+        self.admin_user.is_supervisor = True
+        db.session.commit()
+        client = self.login(self.admin_user)
+        response = client.get(url_for('user.home', supervisor_role='supervisor'))
+        self.assertIn(b'Supervisor User (', response.data)
+        self.assertNotIn(b'Admin User (', response.data)
+        response = client.get(url_for('user.home', supervisor_role='admin'))
+        self.assertNotIn(b'Supervisor User (', response.data)
+        self.assertIn(b'Admin User (', response.data)
+
+    def test_rejects_malformed_cursor(self):
+        client = self.login(self.admin_user)
+        for cursor in ('not-a-cursor', encode_cursor(['Student User']), encode_cursor(['Student User', '1']),
+                       encode_cursor([['Student User'], 1]), encode_cursor([None, 1]), encode_cursor(['a', True])):
+            response = client.get(url_for('user.home', students_after=cursor))
+            self.assertEqual(response.status_code, 400, cursor)
+        response = client.get(url_for('user.home', students_after=encode_cursor(['Student User', 1])))
+        self.assertEqual(response.status_code, 200)
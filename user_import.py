@@ -0,0 +1,151 @@
+import csv
+import os
+import shutil
+import tempfile
+from concurrent.futures import Executor, ThreadPoolExecutor
+from itertools import islice
+
+from flask import Flask, current_app
+from sqlalchemy import func, insert, select
+from sqlalchemy.exc import IntegrityError
+
+from catalog_cache import invalidate_catalog
+from job_queue import JobContext, job_task
+from models.User import User
+from models.db import db
+
+IMPORT_FIELDS = ('name', 'email', 'password', 'role')
+IMPORT_ROLES = ('student', 'supervisor')
+
+
+class UserImporter:
+    # Hashes imported passwords on one pool of USER_IMPORT_WORKERS threads (default one per CPU), started with the app
+    # and shared by every import. hashlib releases the GIL while hashing, so the threads hash in parallel without the
+    # server process being forked for each import.
+
+    def __init__(self, app: Flask = None):
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app: Flask):
+        workers = app.config.get('USER_IMPORT_WORKERS') or os.cpu_count() or 1
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='user-import')
+        app.extensions['user_import'] = self
+
+
+class ImportReport:
+    def __init__(self):
+        self.created = 0
+        self.duplicates = []  # (line, email) for emails already registered or repeated in the file
+        self.errors = []  # (line, message) for rows that could not be imported
+
+    @property
+    def refused(self) -> int:
+        return len(self.duplicates) + len(self.errors)
+
+    def messages(self) -> [str]:
+        problems = [(line, f'{email} already exists.') for line, email in self.duplicates] + self.errors
+        return [f'Line {line}: {message}' for line, message in sorted(problems)]
+
+
+def validate_row(row: dict) -> str:
+    # Returns the reason a row cannot be imported, or None when it is valid
+    if None in row or any(row.get(field) is None for field in IMPORT_FIELDS):
+        return 'Wrong number of columns.'
+    if not all(row[field].strip() for field in IMPORT_FIELDS):
+        return 'All fields are required.'
+    if '@' not in row['email']:
+        return 'Invalid email address.'
+    if row['role'].strip().lower() not in IMPORT_ROLES:
+        return f'Role must be one of {", ".join(IMPORT_ROLES)}.'
+    return None
+
+
+def import_users(lines, batch_size: int = 500, executor: Executor = None, progress=None) -> ImportReport:
+    # Rows are read, validated and inserted one batch at a time so memory does not grow with the file. Passwords for
+    # each batch are hashed on the app's UserImporter pool, or the given executor, then the batch is written with a
+    # single executemany insert. progress(rows read so far) is called between batches, when given. Emails are stored as
+    # given and compared without regard to case.
+    report = ImportReport()
+    reader = csv.DictReader(lines)
+    if reader.fieldnames is None or set(IMPORT_FIELDS) - {field.strip().lower() for field in reader.fieldnames}:
+        report.errors.append((1, f'Header must contain {", ".join(IMPORT_FIELDS)}.'))
+        return report
+    reader.fieldnames = [field.strip().lower() for field in reader.fieldnames]
+    executor = executor or current_app.extensions['user_import'].executor
+    verifier = current_app.extensions['password_verifier']
+    seen = set()
+    read = 0
+    rows = ((reader.line_num, row) for row in reader)
+    while batch := list(islice(rows, batch_size)):
+        if progress is not None:
+            progress(read)
+        read += len(batch)
+        valid = []
+        for line, row in batch:
+            error = validate_row(row)
+            if error:
+                report.errors.append((line, error))
+                continue
+            email = row['email'].strip()
+            if email.lower() in seen:
+                report.duplicates.append((line, email))
+                continue
+            seen.add(email.lower())
+            valid.append((line, row, email))
+        if not valid:
+            continue
+        # Addresses are stored as given; an existing user matches regardless of case
+        existing = set(db.session.scalars(
+            select(func.lower(User.email)).where(User.email_matches(*(email for _, _, email in valid)))))
+        report.duplicates.extend((line, email) for line, _, email in valid if email.lower() in existing)
+        valid = [(line, row, email) for line, row, email in valid if email.lower() not in existing]
+        if not valid:
+            continue
+        hashes = executor.map(verifier.hash, [row['password'] for _, row, _ in valid])
+        try:
+            db.session.execute(insert(User.__table__), [{
+                'name': row['name'].strip(),
+                'email': email,
+                'password_hash': password_hash,
+                'is_supervisor': row['role'].strip().lower() == 'supervisor',
+                'is_admin': False,
+                'active': True
+            } for (_, row, email), password_hash in zip(valid, hashes)])
+            db.session.commit()
+            report.created += len(valid)
+        except IntegrityError:
+            # Another request registered one of these emails since the lookup; refuse the batch, keep going
+            db.session.rollback()
+            report.errors.extend((line, 'Could not be inserted, please retry.') for line, _, _ in valid)
+    if progress is not None:
+        progress(read)
+    return report
+
+
+def save_upload(stream) -> str:
+    # Keeps an uploaded file for the import job in USER_IMPORT_FOLDER (default the system's temporary folder), which
+    # must be shared with the processes that run jobs, and returns its path. Only its owner can read it, as it holds
+    # passwords, and the job removes it.
+    fd, path = tempfile.mkstemp(suffix='.csv', dir=current_app.config.get('USER_IMPORT_FOLDER'))
+    with os.fdopen(fd, 'wb') as file:
+        shutil.copyfileobj(stream, file)
+    return path
+
+
+@job_task('import_users')
+def import_users_job(job: JobContext, path: str, batch_size: int) -> str:
+    # A job resumed after an interruption reads the whole file again, reporting the rows it had imported as existing
+    try:
+        with open(path, encoding='utf-8-sig', newline='') as lines:
+            report = import_users(lines, batch_size=batch_size, progress=job.progress)
+    finally:
+        os.remove(path)
+    if report.created:
+        invalidate_catalog()
+    summary = f'{report.created} user(s) imported.'
+    if report.refused:
+        messages = report.messages()
+        more = f" ({len(messages) - 10} more)" if len(messages) > 10 else ""
+        summary += f" {report.refused} row(s) skipped. {' '.join(messages[:10])}{more}"
+    return summary